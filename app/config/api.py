@@ -1,20 +1,146 @@
 # app/config/api.py
 
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
 from fastapi import FastAPI
 from app.routes.uploads.photo_upload import router as upload_router
+from app.routes.agent import router as recommendation_router
+from app.routes.marketplace import router as marketplace_router
+from app.routes.monitoring import router as monitoring_router
+from app.routes.chats.chat import router as chat_router
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
-# ... other imports (Pandas, joblib, etc. for the real app) ...
+from app.config.state import APP_STATE # Single shared state dict (re-exported for older imports)
+from app.config.data_loader import load_app_state
+from app.services.marketplace_services import get_offer_store, get_reservation_service, shutdown_offer_store
+from app.services.vision_service import get_vision_detector
+from app.services.analysis_cache import AnalysisCache
+from app.services.recommendation_table import build_recommendation_table
+from app.routes.agent.recommendation import get_producer_index, get_npk_similarity_index, get_recommendation_cache
+from app.config.constants import ANALYSIS_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_TTL_S, ANALYSIS_CACHE_PHASH_DISTANCE
+from app.config.constants import ANALYSIS_CACHE_DISK_MAX_ENTRIES
+from app.config.constants import RESERVATION_SWEEP_INTERVAL_S, PROFILING_ENABLED, PROFILING_INTERVAL_S
+from app.config.constants import AUTH_REVOCATION_REFRESH_S
+from app.services.metrics import MetricsMiddleware
+from app.services.upload_jobs import UploadJobQueue
+from app.services.upload_service import UploadSizeLimitMiddleware
+from app.services.chat_service import ChatHub, ChatStore
+from app.services.auth_service import get_auth_service
+from app.config.constants import (
+    UPLOAD_JOB_WORKERS,
+    UPLOAD_JOB_MAX_PENDING,
+    UPLOAD_JOB_RESULT_TTL_S,
+    UPLOAD_JOB_STALE_S,
+    CHAT_SEND_QUEUE_MAX,
+)
 
-# NOTE: Minimal placeholder for APP_STATE to prevent crashes
-APP_STATE = {
-    'WASTE_DF_PROCESSED': None # Will be loaded in a real service
-}
+DEFAULT_DATA_PATH = Path(__file__).resolve().parent.parent / 'data'
 
-app = FastAPI(title="Waste Analysis Interface")
+
+def _timed_step(name: str, step) -> None:
+    start = time.perf_counter()
+    step()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    APP_STATE['LOAD_TIMINGS'][name] = elapsed_ms
+    print(f"INFO: Built {name} in {elapsed_ms:.1f} ms")
+
+
+async def _sweep_expired_reservations() -> None:
+    """Background task: returns stock from expired holds every RESERVATION_SWEEP_INTERVAL_S."""
+    service = get_reservation_service()
+    while True:
+        await asyncio.sleep(RESERVATION_SWEEP_INTERVAL_S)
+        try:
+            released = await run_in_threadpool(service.release_expired)
+            if released:
+                print(f"INFO: Released {released} expired reservations")
+        except Exception as e:
+            print(f"ERROR: Reservation sweep failed: {e}")
+
+
+async def _refresh_token_revocations() -> None:
+    """Background task: picks up logouts / password resets made in other workers."""
+    revocations = get_auth_service().revocations
+    while True:
+        await asyncio.sleep(AUTH_REVOCATION_REFRESH_S)
+        try:
+            await run_in_threadpool(revocations.refresh)
+        except Exception as e:
+            print(f"ERROR: Token revocation refresh failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 1. Datasets + model, loaded ONCE per worker (columnar snapshots after the first start)
+    load_app_state(APP_STATE, APP_STATE.get('DATA_PATH') or DEFAULT_DATA_PATH)
+
+    # 2. Derived structures, built before the first request
+    APP_STATE.pop('PRODUCER_INDEX', None)
+    _timed_step('PRODUCER_INDEX', get_producer_index)
+    _timed_step('OFFER_STORE', get_offer_store)
+    _timed_step('RECOMMENDATION_TABLE', build_recommendation_table) # crop -> (class, best waste)
+    _timed_step('RESERVATION_SERVICE', get_reservation_service)
+    APP_STATE.pop('AUTH_SERVICE', None)
+    _timed_step('AUTH_SERVICE', get_auth_service) # users table, token signer + verification cache
+    APP_STATE.pop('NPK_INDEX', None)
+    _timed_step('NPK_INDEX', get_npk_similarity_index) # k-NN over available offers' N:P:K profiles
+    APP_STATE.pop('RECOMMENDATION_CACHE', None)
+    _timed_step('RECOMMENDATION_CACHE', get_recommendation_cache)
+
+    _timed_step('VISION_DETECTOR', get_vision_detector) # Gemini client and/or the local ONNX model
+    APP_STATE.setdefault('ANALYSIS_CACHE', AnalysisCache(
+        max_entries=ANALYSIS_CACHE_MAX_ENTRIES,
+        ttl_s=ANALYSIS_CACHE_TTL_S,
+        disk_dir=APP_STATE['DATA_PATH'] / 'analysis_cache',
+        disk_max_entries=ANALYSIS_CACHE_DISK_MAX_ENTRIES,
+        phash_max_distance=ANALYSIS_CACHE_PHASH_DISTANCE,
+    ))
+    # Background upload pipeline (/upload/photo/jobs): bounded workers on this event loop
+    APP_STATE['UPLOAD_JOB_QUEUE'] = UploadJobQueue(
+        get_offer_store(),
+        workers=UPLOAD_JOB_WORKERS,
+        max_pending=UPLOAD_JOB_MAX_PENDING,
+        result_ttl_s=UPLOAD_JOB_RESULT_TTL_S,
+        stale_after_s=UPLOAD_JOB_STALE_S,
+    )
+    APP_STATE['UPLOAD_JOB_QUEUE'].start()
+    # Chat rooms (one per offer id): in-process fan-out, batched appends to DATA_PATH/chat.db
+    APP_STATE['CHAT_HUB'] = ChatHub(
+        ChatStore(APP_STATE['DATA_PATH'] / 'chat.db'),
+        max_pending_per_connection=CHAT_SEND_QUEUE_MAX,
+    )
+    sweeper = asyncio.create_task(_sweep_expired_reservations())
+    revocation_refresher = asyncio.create_task(_refresh_token_revocations())
+    yield
+    sweeper.cancel()
+    revocation_refresher.cancel()
+    await APP_STATE.pop('UPLOAD_JOB_QUEUE').stop() # Before the store closes: unfinished jobs are marked failed
+    APP_STATE.pop('CHAT_HUB').close() # Commits any queued messages
+    APP_STATE.pop('VISION_DETECTOR').close() # Stops the local inference thread (no-op for Gemini)
+    if APP_STATE.get('RECOMMENDATION_CACHE') is not None:
+        APP_STATE['RECOMMENDATION_CACHE'].close()
+    APP_STATE.pop('AUTH_SERVICE', None) # Holds the store that is about to close
+    # Group-committed offers are flushed and the WAL compacted so the next start is fast
+    shutdown_offer_store()
+
+
+app = FastAPI(title="Waste Analysis Interface", lifespan=lifespan)
 
 # Include the file upload router
 app.include_router(upload_router, prefix="/api/v1") 
+# Include the recommendation (agent) router
+app.include_router(recommendation_router, prefix="/api/v1")
+# Include the marketplace (offers / reservations) router
+app.include_router(marketplace_router, prefix="/api/v1")
+# Include the buyer-seller chat router (WebSocket rooms per offer)
+app.include_router(chat_router, prefix="/api/v1")
+# Prometheus scrape endpoint (+ profile downloads), unversioned like most scrape targets
+app.include_router(monitoring_router)
 
+# Refuses oversized uploads (413) from Content-Length or the running byte count, before form parsing
+app.add_middleware(UploadSizeLimitMiddleware)
 # Add CORS middleware (essential for frontend testing)
 app.add_middleware(
     CORSMiddleware,
@@ -22,4 +148,6 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-)
\ No newline at end of file
+)
+# Outermost: request latency / in-flight metrics and opt-in per-request profiling
+app.add_middleware(MetricsMiddleware, profiling_enabled=PROFILING_ENABLED, profiling_interval_s=PROFILING_INTERVAL_S)
@@ -0,0 +1,87 @@
+# app/config/constants.py
+import os
+
+# --- VISION (Gemini) ---
+GEMINI_VISION_MODEL = os.getenv("GEMINI_VISION_MODEL", "gemini-2.5-flash")
+VISION_MAX_CONCURRENCY = int(os.getenv("VISION_MAX_CONCURRENCY", "8")) # Max in-flight vision calls per worker
+VISION_TIMEOUT_S = float(os.getenv("VISION_TIMEOUT_S", "30")) # Per-call timeout
+VISION_DISCONNECT_POLL_S = 0.25 # How often to check whether the uploading client went away
+USE_FAKE_GEMINI = os.getenv("USE_FAKE_GEMINI", "0") == "1" # Offline mode (app/services/fake_gemini.py)
+
+# --- VISION BACKEND (app/services/detectors.py) ---
+VISION_BACKEND = os.getenv("VISION_BACKEND", "gemini") # gemini | local | cascade (local first, Gemini when unsure)
+VISION_LOCAL_MODEL_PATH = os.getenv("VISION_LOCAL_MODEL_PATH", "") # YOLO-style ONNX export, loaded once per worker
+VISION_LOCAL_LABELS_PATH = os.getenv("VISION_LOCAL_LABELS_PATH", "") # One class per line (default: the model's 'names' metadata)
+VISION_LOCAL_CONFIDENCE = float(os.getenv("VISION_LOCAL_CONFIDENCE", "0.35")) # Boxes below this score are dropped
+VISION_LOCAL_IOU = float(os.getenv("VISION_LOCAL_IOU", "0.5")) # NMS overlap threshold
+VISION_LOCAL_MAX_BATCH = int(os.getenv("VISION_LOCAL_MAX_BATCH", "8")) # Concurrent images stacked into one inference
+VISION_LOCAL_BATCH_WAIT_MS = float(os.getenv("VISION_LOCAL_BATCH_WAIT_MS", "5")) # How long a batch waits to fill
+VISION_LOCAL_THREADS = int(os.getenv("VISION_LOCAL_THREADS", "0")) # onnxruntime intra-op threads (0 = runtime default)
+VISION_CASCADE_MIN_CONFIDENCE = float(os.getenv("VISION_CASCADE_MIN_CONFIDENCE", "0.6")) # Local answers below this go to Gemini
+
+# --- IMAGE ANALYSIS CACHE ---
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "1024")) # Memory tier (LRU)
+ANALYSIS_CACHE_TTL_S = float(os.getenv("ANALYSIS_CACHE_TTL_S", str(7 * 24 * 3600)))
+ANALYSIS_CACHE_PHASH_DISTANCE = int(os.getenv("ANALYSIS_CACHE_PHASH_DISTANCE", "0")) # Opt-in near-duplicate matching (bits); 0 = exact hash only
+ANALYSIS_CACHE_DISK_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_DISK_MAX_ENTRIES", "50000")) # Disk tier files (oldest pruned); 0 = unbounded
+
+# --- UPLOAD PREPROCESSING ---
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(15 * 1024 * 1024))) # Hard cap on raw upload size
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024 # Multipart framing + text fields allowed on top of UPLOAD_MAX_BYTES
+UPLOAD_CHUNK_BYTES = 256 * 1024
+UPLOAD_MAX_PIXELS = 60_000_000 # Reject decompression bombs before decoding
+ANALYSIS_MAX_SIDE_PX = int(os.getenv("ANALYSIS_MAX_SIDE_PX", "1024")) # Longest side sent to the model
+ANALYSIS_JPEG_QUALITY = int(os.getenv("ANALYSIS_JPEG_QUALITY", "80"))
+
+# --- RESERVATIONS ---
+RESERVATION_HOLD_S = float(os.getenv("RESERVATION_HOLD_S", "900")) # Default hold before stock returns to the offer
+RESERVATION_MAX_HOLD_S = 24 * 3600
+RESERVATION_SWEEP_INTERVAL_S = float(os.getenv("RESERVATION_SWEEP_INTERVAL_S", "15")) # Expired-hold sweeper period
+
+# --- REGION SHARDS ---
+REGION_ASSIGN_RADIUS_KM = float(os.getenv("REGION_ASSIGN_RADIUS_KM", "50")) # New producers without a city join the nearest region this close
+
+# --- RECOMMENDATION RESPONSE CACHE ---
+RECOMMENDATION_CACHE_MAX_ENTRIES = int(os.getenv("RECOMMENDATION_CACHE_MAX_ENTRIES", "4096")) # 0 disables the cache
+RECOMMENDATION_CACHE_TTL_S = float(os.getenv("RECOMMENDATION_CACHE_TTL_S", "300"))
+RECOMMENDATION_CACHE_STALE_TTL_S = float(os.getenv("RECOMMENDATION_CACHE_STALE_TTL_S", "3600")) # Max age served in SWR mode
+RECOMMENDATION_CACHE_SWR = os.getenv("RECOMMENDATION_CACHE_SWR", "0") == "1" # Serve stale entries while recomputing
+RECOMMENDATION_CACHE_CELL_DEG = float(os.getenv("RECOMMENDATION_CACHE_CELL_DEG", "0.01")) # ~1 km farmer location cell
+
+# --- METRICS / PROFILING ---
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1" # Lets callers request a profile with "X-Profile: 1"
+PROFILING_INTERVAL_S = float(os.getenv("PROFILING_INTERVAL_S", "0.005")) # Stack sampling period
+
+# --- ASYNC UPLOAD JOBS ---
+UPLOAD_JOB_WORKERS = int(os.getenv("UPLOAD_JOB_WORKERS", "4")) # Concurrent pipelines per worker process
+UPLOAD_JOB_MAX_PENDING = int(os.getenv("UPLOAD_JOB_MAX_PENDING", "64")) # Queued + running; beyond this -> 429
+UPLOAD_JOB_RESULT_TTL_S = float(os.getenv("UPLOAD_JOB_RESULT_TTL_S", str(24 * 3600))) # Results (and idempotency keys) kept this long
+UPLOAD_JOB_STALE_S = float(os.getenv("UPLOAD_JOB_STALE_S", "600")) # Unfinished jobs older than this are failed (worker died)
+UPLOAD_JOB_RETRY_AFTER_S = 5 # Retry-After hint on 429
+UPLOAD_JOB_MAX_WAIT_S = 30.0 # Longest long-poll on the status endpoint
+UPLOAD_JOB_STREAM_POLL_S = 1.0 # Status check period for the events stream
+
+# --- BULK IMPORT / EXPORT ---
+BULK_IMPORT_CHUNK_ROWS = int(os.getenv("BULK_IMPORT_CHUNK_ROWS", "1000")) # Rows validated + committed per transaction
+BULK_IMPORT_MAX_LINE_BYTES = 64 * 1024 # A single longer line rejects the import (413)
+BULK_IMPORT_MAX_ERRORS = 100 # Row errors listed in the summary (the count is always exact)
+BULK_EXPORT_PAGE_ROWS = int(os.getenv("BULK_EXPORT_PAGE_ROWS", "1000")) # Rows read per keyset page while streaming
+
+# --- CHAT (WebSockets) ---
+CHAT_MAX_MESSAGE_CHARS = int(os.getenv("CHAT_MAX_MESSAGE_CHARS", "2000")) # Longer messages are rejected (connection stays open)
+CHAT_MAX_FRAME_CHARS = 16 * 1024 # Frames longer than this close the connection (1009)
+CHAT_SEND_QUEUE_MAX = int(os.getenv("CHAT_SEND_QUEUE_MAX", "256")) # Undelivered messages held per connection before it is dropped
+CHAT_HISTORY_ON_JOIN = 50 # Recent messages replayed when a connection joins a room
+CHAT_HISTORY_MAX = 200 # Page size cap of the history endpoint
+
+# --- AUTH ---
+AUTH_SECRET_KEY = os.getenv("AUTH_SECRET_KEY", "") # Token signing key; empty -> generated once into DATA_PATH/auth_secret.key
+AUTH_ACCESS_TOKEN_TTL_S = float(os.getenv("AUTH_ACCESS_TOKEN_TTL_S", "3600"))
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "0") == "1" # Reject anonymous reservations / chat (off during client rollout)
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "4")) # Dedicated password-hashing threads per worker
+AUTH_SCRYPT_N = int(os.getenv("AUTH_SCRYPT_N", str(2 ** 14))) # scrypt cost (~50-100 ms per hash); stored per hash
+AUTH_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_TOKEN_CACHE_MAX_ENTRIES", "10000")) # Verified tokens (LRU)
+AUTH_REVOCATION_REFRESH_S = float(os.getenv("AUTH_REVOCATION_REFRESH_S", "5")) # How soon other workers' logouts apply here
+AUTH_RESET_TOKEN_TTL_S = float(os.getenv("AUTH_RESET_TOKEN_TTL_S", "1800"))
+AUTH_RETURN_RESET_TOKEN = os.getenv("AUTH_RETURN_RESET_TOKEN", "0") == "1" # Dev only: no mailer, reset token in the response
+AUTH_MIN_PASSWORD_CHARS = 8
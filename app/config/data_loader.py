@@ -0,0 +1,158 @@
+# app/config/data_loader.py
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# --- Dataset registry: APP_STATE key -> (CSV file, read_csv dtype overrides) ---
+CSV_DATASETS = {
+    'CROP_DF': ('crop_npk_requirements.csv', {}),
+    'WASTE_DF_PROCESSED': ('waste_npk_processed.csv', {}),
+    'PRODUCER_DF': ('waste_producers.csv', {'contact': str}), # Keep leading zeros / '+' in phone numbers
+}
+MODEL_FILE = 'waste_recommender_model.joblib'
+
+SNAPSHOT_DIR_NAME = '.snapshots'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_POINTER = 'CURRENT' # Names the live version directory; swapped with os.replace
+SNAPSHOT_GRACE_S = 60 # Superseded versions are kept this long for readers still loading them
+
+# =======================================================
+#               COLUMNAR SNAPSHOTS (.npy per column)
+# =======================================================
+# Each dataset is cached as one uncompressed .npy file per column plus meta.json.
+# Numeric columns are memory-mapped on load; text columns are stored as categorical
+# codes + categories, so restarts skip CSV parsing entirely.
+# Every write goes to a new version directory; the CURRENT pointer file is then
+# replaced atomically, so a reader always sees one complete version.
+
+
+def _source_signature(source: Path) -> Dict[str, int]:
+    stat = source.stat()
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def _prune_versions(snapshot_dir: Path, keep: str) -> None:
+    """Deletes superseded versions (and files of the old unversioned layout) past the grace period."""
+    cutoff = time.time() - SNAPSHOT_GRACE_S
+    for entry in snapshot_dir.iterdir():
+        if entry.name in (keep, SNAPSHOT_POINTER):
+            continue
+        try:
+            if entry.stat().st_mtime >= cutoff:
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink()
+        except OSError:
+            continue # Removed by another worker meanwhile
+
+
+def write_snapshot(df: pd.DataFrame, snapshot_dir: Path, source: Path) -> None:
+    """Writes df as a typed columnar snapshot in a new version and atomically makes it current."""
+    version = f"v{time.time_ns()}-{os.getpid()}"
+    tmp_dir = snapshot_dir / version
+    tmp_dir.mkdir(parents=True)
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        file_name = f"col{i}.npy"
+        if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+            np.save(tmp_dir / file_name, series.to_numpy())
+            columns.append({'name': name, 'kind': 'numeric', 'file': file_name})
+        else:
+            categorical = pd.Categorical(series.astype(object).where(series.notna(), None))
+            codes = categorical.codes.astype(np.int32 if len(categorical.categories) > 32767 else np.int16)
+            np.save(tmp_dir / file_name, codes)
+            columns.append({
+                'name': name, 'kind': 'categorical', 'file': file_name,
+                'categories': [str(c) for c in categorical.categories],
+            })
+
+    meta = {'version': SNAPSHOT_VERSION, 'source': _source_signature(source), 'rows': len(df), 'columns': columns}
+    (tmp_dir / 'meta.json').write_text(json.dumps(meta))
+
+    pointer_tmp = snapshot_dir / f"{SNAPSHOT_POINTER}.{os.getpid()}.tmp"
+    pointer_tmp.write_text(version)
+    os.replace(pointer_tmp, snapshot_dir / SNAPSHOT_POINTER) # Last writer wins; every version is complete
+    _prune_versions(snapshot_dir, keep=version)
+
+
+def read_snapshot(snapshot_dir: Path, source: Path) -> Optional[pd.DataFrame]:
+    """
+    Memory-maps the current snapshot if it exists and still matches the source file,
+    else None. A version pruned or damaged mid-read is also None (the caller re-parses
+    the CSV), never an error.
+    """
+    try:
+        version_dir = snapshot_dir / (snapshot_dir / SNAPSHOT_POINTER).read_text().strip()
+        meta = json.loads((version_dir / 'meta.json').read_text())
+        if meta.get('version') != SNAPSHOT_VERSION or meta.get('source') != _source_signature(source):
+            return None
+
+        data = {}
+        for column in meta['columns']:
+            array = np.load(version_dir / column['file'], mmap_mode='r')
+            if column['kind'] == 'categorical':
+                data[column['name']] = pd.Categorical.from_codes(np.asarray(array), categories=column['categories'])
+            else:
+                data[column['name']] = array
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return pd.DataFrame(data, copy=False)
+
+
+def load_csv_dataset(data_path: Path, key: str) -> pd.DataFrame:
+    """Loads one registered dataset: snapshot if fresh, otherwise parse the CSV and re-snapshot."""
+    file_name, dtypes = CSV_DATASETS[key]
+    source = data_path / file_name
+    snapshot_dir = data_path / SNAPSHOT_DIR_NAME / key.lower()
+
+    df = read_snapshot(snapshot_dir, source)
+    if df is not None:
+        return df
+
+    df = pd.read_csv(source, dtype=dtypes or None)
+    try:
+        write_snapshot(df, snapshot_dir, source)
+    except OSError as e:
+        print(f"WARNING: Could not write snapshot for {key}: {e}")
+    return df
+
+
+def load_waste_model(data_path: Path) -> Any:
+    return joblib.load(data_path / MODEL_FILE)
+
+
+# =======================================================
+#               STARTUP LOADER
+# =======================================================
+
+def _timed(timings: Dict[str, float], name: str, loader, *args):
+    start = time.perf_counter()
+    result = loader(*args)
+    timings[name] = (time.perf_counter() - start) * 1000
+    print(f"INFO: Loaded {name} in {timings[name]:.1f} ms")
+    return result
+
+
+def load_app_state(app_state: Dict[str, Any], data_path: Path) -> Dict[str, float]:
+    """
+    Loads every dataset and the model into APP_STATE exactly once (called from the
+    app lifespan). Returns per-dataset load timings in milliseconds.
+    """
+    timings: Dict[str, float] = {}
+    app_state['DATA_PATH'] = data_path
+    for key in CSV_DATASETS:
+        app_state[key] = _timed(timings, key, load_csv_dataset, data_path, key)
+    app_state['WASTE_MODEL'] = _timed(timings, 'WASTE_MODEL', load_waste_model, data_path)
+    app_state['LOAD_TIMINGS'] = timings
+    return timings
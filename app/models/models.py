@@ -1,7 +1,9 @@
 # models.py (Partial Update to the model handling seller input)
 
-from typing import List, Optional # Ensure List and Optional are imported
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional # Ensure List and Optional are imported
 from fastapi import UploadFile # Required if the model is used for file upload validation
+from pydantic import BaseModel
 
 class SellerOfferInput(BaseModel):
     # --- REQUIRED MANUAL FIELDS ---
@@ -21,4 +23,59 @@ class SellerOfferInput(BaseModel):
     # The file input is often handled separately by FastAPI's endpoint signature, 
     # but these fields cover the manual override need.
 
-# NOTE: The final logic will prioritize using manual_waste_type IF provided.
\ No newline at end of file
+# NOTE: The final logic will prioritize using manual_waste_type IF provided.
+
+
+# --- FARMER / RECOMMENDATION MODELS (used by routes/agent) ---
+
+class FarmerInput(BaseModel):
+    crop_type: str
+    soil_nitrogen: float
+    soil_phosphorus: float
+    soil_potassium: float
+    farmer_lat: float
+    farmer_lon: float
+
+
+# --- RESPONSE MODELS ---
+# Slotted dataclasses rather than BaseModels: built straight from the offer/producer
+# indexes (no validation pass) and rendered by FastJSONResponse, which serializes them
+# natively. FastAPI still reads them for the OpenAPI schema.
+
+@dataclass(slots=True)
+class SupplierOffer:
+    """One ranked offer plus its producer's location and contact."""
+    offer_id: str
+    producer_id: str
+    waste_type: str
+    quantity_kg: Optional[float]
+    cost_per_kg: Optional[float]
+    is_available: bool
+    listing_date: Optional[str]
+    N_score: Optional[float]
+    P_score: Optional[float]
+    K_score: Optional[float]
+    distance_km: float
+    latitude: float
+    longitude: float
+    producer_name: Optional[str]
+    contact: Optional[str]
+    npk_similarity: Optional[float] = None # Substitutes only: cosine similarity to the requested waste's N:P:K
+
+
+@dataclass(slots=True)
+class RecommendationResponse:
+    crop_target: str
+    soil_status: str
+    deficiencies: List[str]
+    recommended_waste: str
+    video_recommendation_link: str
+    location_message: str
+    nearest_suppliers: List[SupplierOffer] # Ranked offers (cheapest first)
+    substitute_suppliers: List[SupplierOffer] = field(default_factory=list) # Similar-NPK wastes, filled when no exact listing is nearby
+
+
+@dataclass(slots=True, kw_only=True)
+class BatchRecommendationResponse(RecommendationResponse):
+    """One NDJSON line of the batch endpoint; index points back to the input list."""
+    index: int
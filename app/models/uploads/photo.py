@@ -0,0 +1,21 @@
+# models/uploads/photo.py
+from dataclasses import dataclass
+from typing import Dict
+
+
+# --- UPLOAD RESPONSE MODELS (slotted; rendered by FastJSONResponse) ---
+
+@dataclass(slots=True)
+class WasteAnalysis:
+    waste_type: str
+    calculated_npk_score: Dict[str, float] # {'N': .., 'P': .., 'K': ..}
+    estimated_quantity_proxy: float
+    seller_price_per_kg: float
+
+
+@dataclass(slots=True)
+class OfferUploadResult:
+    status: str
+    listing_id: str
+    seller_input_source: str
+    final_analysis: WasteAnalysis
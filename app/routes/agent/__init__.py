@@ -1,12 +1,38 @@
-routes/agent/__init__.py 
+# routes/agent/__init__.py 
 
-from fastapi import APIRouter, Depends
-from models import FarmerInput, RecommendationResponse
-from .recommendation import get_recommendation_data 
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from app.models.models import FarmerInput, RecommendationResponse
+from app.services.serialization import FastJSONResponse, dumps
+from .recommendation import get_recommendation_data, iter_batch_recommendations, get_recommendation_cache, BATCH_MAX_FARMERS
 
 router = APIRouter(tags=["Agent/Recommendation"])
 
-@router.post("/recommend\_fertilizer", response_model=RecommendationResponse)
+@router.post("/recommend_fertilizer", response_model=RecommendationResponse, response_class=FastJSONResponse)
 def post_recommendation(farmer_data: FarmerInput):
     """Endpoint for fertilizer and bargain recommendation."""
-    return get_recommendation_data(farmer_data)
\ No newline at end of file
+    # Rendered here (orjson) rather than re-validated against the response model
+    return FastJSONResponse(get_recommendation_data(farmer_data))
+
+
+@router.post("/recommend_fertilizer/batch")
+def post_batch_recommendation(farmers: List[FarmerInput]):
+    """
+    Batch endpoint for cooperatives / field agents. Streams one JSON object per farmer
+    (NDJSON) as soon as its crop group is ranked; "index" points back to the input list.
+    """
+    if len(farmers) > BATCH_MAX_FARMERS:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {BATCH_MAX_FARMERS} farmers).")
+
+    def ndjson_lines():
+        for result in iter_batch_recommendations(farmers):
+            yield dumps(result) + b"\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
+@router.get("/recommend_fertilizer/cache/stats", summary="Recommendation response cache hit ratio and counters.")
+def recommendation_cache_stats():
+    cache = get_recommendation_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
@@ -1,8 +1,12 @@
-import google as genai
+from google import genai
+from google.genai import types
 import json
 from PIL import Image
-from io import BytesIO
 import os 
+from typing import Any, Dict, List, Union
+
+from app.config.constants import GEMINI_VISION_MODEL
+
 # 1. Define the Expected Output Schema (using a Python dictionary)
 DETECTION_SCHEMA = {
     "type": "array",
@@ -16,40 +20,56 @@ DETECTION_SCHEMA = {
     }
 }
 
-def call_gemini_vision_api(image_bytes: bytes, client: genai.Client) -> List[Dict]:
-    """Sends image and detailed prompt for structured detection and quantity estimation."""
-    
-    # 2. Prepare Multimodal Content
-    image = Image.open(BytesIO(image_bytes))
-    
-    # SYSTEM PROMPT: Forces the model to use strict rules
-    system_instruction = (
-        "You are a waste assessment expert. Analyze all organic waste items. "
-        "Your response MUST be a JSON array of objects that strictly adheres to the provided schema. "
-        "DO NOT include any text outside the JSON block."
-    )
-    
-    user_prompt = (
-        "Identify ALL distinct organic waste items. For each item, provide a 'relative_quantity_score' "
-        "from 1 (very small/trace) to 10 (very large/dominant)."
-    )
-
-    # 3. Call the API with Structured Output Config
-    response = client.models.generate_content(
-        model='gemini-2.5-flash', # Fastest multimodal model
-        contents=[image, user_prompt],
-        config={
+# SYSTEM PROMPT: Forces the model to use strict rules
+SYSTEM_INSTRUCTION = (
+    "You are a waste assessment expert. Analyze all organic waste items. "
+    "Your response MUST be a JSON array of objects that strictly adheres to the provided schema. "
+    "DO NOT include any text outside the JSON block."
+)
+
+USER_PROMPT = (
+    "Identify ALL distinct organic waste items. For each item, provide a 'relative_quantity_score' "
+    "from 1 (very small/trace) to 10 (very large/dominant)."
+)
+
+
+def build_vision_request(image: Union[bytes, Image.Image]) -> Dict[str, Any]:
+    """
+    Prepares the multimodal request (shared by the sync and async call paths).
+    Pre-encoded JPEG bytes (see upload_service) are sent as-is, without re-encoding.
+    """
+    if isinstance(image, Image.Image):
+        image_part = image
+    else:
+        image_part = types.Part.from_bytes(data=image, mime_type="image/jpeg")
+    return {
+        "model": GEMINI_VISION_MODEL, # Fastest multimodal model
+        "contents": [image_part, USER_PROMPT],
+        "config": {
             "response_mime_type": "application/json",
             "response_schema": DETECTION_SCHEMA,
-            "system_instruction": system_instruction,
+            "system_instruction": SYSTEM_INSTRUCTION,
             "temperature": 0.1 # Low temperature for reliable data extraction
-        }
-    )
-    
-    # 4. Parse the result and prepare it for the NPK calculation
-    # The output is a JSON string, which must be loaded back into a Python list/dict
+        },
+    }
+
+
+def parse_detections(response) -> List[Dict]:
+    """The output is a JSON string, which must be loaded back into a Python list/dict."""
     try:
         return json.loads(response.text)
     except json.JSONDecodeError:
         print("ERROR: Gemini did not return valid JSON.")
-        return []
\ No newline at end of file
+        return []
+
+
+def call_gemini_vision_api(image: Union[bytes, Image.Image], client: genai.Client) -> List[Dict]:
+    """Sends image and detailed prompt for structured detection and quantity estimation (blocking)."""
+    response = client.models.generate_content(**build_vision_request(image))
+    return parse_detections(response)
+
+
+async def call_gemini_vision_api_async(image: Union[bytes, Image.Image], client: genai.Client) -> List[Dict]:
+    """Same as call_gemini_vision_api, but through the client's native async API (client.aio)."""
+    response = await client.aio.models.generate_content(**build_vision_request(image))
+    return parse_detections(response)
@@ -1,38 +1,46 @@
 # recommendation.py 
-import pandas as pd
-from geopy.distance import geodesic
+import dataclasses
 import numpy as np
-from typing import List, Literal 
-
-try:
-    from app.config.api import APP_STATE 
-except ImportError:
-    print("Warning: APP_STATE not found. Using mock data for local testing.")
-    APP_STATE = {
-        'CROP_DF': pd.DataFrame({'N': [90], 'P': [45], 'K': [45], 'label': ['rice']}),
-        'WASTE_MODEL': None, 
-    }
-
-CROP_DF = APP_STATE.get('CROP_DF')
-WASTE_MODEL = APP_STATE.get('WASTE_MODEL')
-PRODUCER_DF = APP_STATE.get('PRODUCER_DF')
-OFFERS_DF = APP_STATE.get('OFFERS_DF')
+from fastapi import HTTPException
+from typing import Any, Dict, Iterable, Iterator, List, Literal, Mapping, Optional, Tuple
+
+from app.services.geo_index import haversine_km, within_bounding_box
+from app.services.regions import RegionalProducerIndex
+from app.services.marketplace_services import get_offer_store
+from app.services.recommendation_table import get_recommendation_table
+from app.services.npk_similarity import NpkProfiler, NpkSimilarityIndex
+from app.services.waste_calculator import get_waste_lookup
+from app.services.recommendation_cache import RecommendationCache, recommendation_cache_key
+from app.services.metrics import stage
+from app.models.models import BatchRecommendationResponse, RecommendationResponse, SupplierOffer
+from app.config.constants import (
+    RECOMMENDATION_CACHE_MAX_ENTRIES,
+    RECOMMENDATION_CACHE_TTL_S,
+    RECOMMENDATION_CACHE_STALE_TTL_S,
+    RECOMMENDATION_CACHE_SWR,
+    RECOMMENDATION_CACHE_CELL_DEG,
+    REGION_ASSIGN_RADIUS_KM,
+)
+
+from app.config.state import APP_STATE # Populated by the lifespan loader (app/config/data_loader.py)
 
 DEFICIENCY_THRESHOLD = 0.6 
 MAX_SEARCH_RADIUS_KM = 50 
+BATCH_DISTANCE_CHUNK = 256 # Farmers per distance-matrix block (bounds matrix memory)
+BATCH_MAX_FARMERS = 5000
 
 # =======================================================
 #               UTILITY FUNCTIONS
 # =======================================================
 
-def check_soil_deficiency(farmer_data, crop_target_row: pd.Series) -> List[str]:
-    """Compares farmer's soil to crop target and returns list of deficiencies (N, P, K)."""
+def check_soil_deficiency(farmer_data, crop_target: Mapping[str, float]) -> List[str]:
+    """Compares farmer's soil to crop target (N/P/K) and returns list of deficiencies (N, P, K)."""
     deficiencies = []
-    if farmer_data.soil_nitrogen < (crop_target_row['N'].iloc[0] * DEFICIENCY_THRESHOLD):
+    if farmer_data.soil_nitrogen < (crop_target['N'] * DEFICIENCY_THRESHOLD):
         deficiencies.append('N')
-    if farmer_data.soil_phosphorus < (crop_target_row['P'].iloc[0] * DEFICIENCY_THRESHOLD):
+    if farmer_data.soil_phosphorus < (crop_target['P'] * DEFICIENCY_THRESHOLD):
         deficiencies.append('P')
-    if farmer_data.soil_potassium < (crop_target_row['K'].iloc[0] * DEFICIENCY_THRESHOLD):
+    if farmer_data.soil_potassium < (crop_target['K'] * DEFICIENCY_THRESHOLD):
         deficiencies.append('K')
     return deficiencies
 
@@ -44,82 +52,338 @@ def find_video_link(waste_type: str, deficiency: str) -> str:
     return f"https://www.youtube.com/results?search_query={'+'.join(search_query.split())}"
 
 
-def find_best_offers(farmer_lat, farmer_lon, required_waste: str):
+def get_producer_index() -> RegionalProducerIndex:
+    """Returns the shared producer spatial index (one shard per city), building it from PRODUCER_DF on first use."""
+    index = APP_STATE.get('PRODUCER_INDEX')
+    if index is None:
+        index = RegionalProducerIndex.from_dataframe(APP_STATE['PRODUCER_DF'], assign_radius_km=REGION_ASSIGN_RADIUS_KM)
+        APP_STATE['PRODUCER_INDEX'] = index
+    return index
+
+
+def get_npk_similarity_index() -> NpkSimilarityIndex:
+    """Returns the shared NPK k-NN index, attached to the offer store on first use."""
+    index = APP_STATE.get('NPK_INDEX')
+    if index is None:
+        profiler = NpkProfiler(get_waste_lookup(APP_STATE['WASTE_DF_PROCESSED']))
+        index = NpkSimilarityIndex(profiler.offer_profile)
+        get_offer_store().attach_index(index) # Follows new offers and availability changes
+        APP_STATE['NPK_PROFILER'] = profiler
+        APP_STATE['NPK_INDEX'] = index
+    return index
+
+
+def get_recommendation_cache() -> RecommendationCache | None:
+    """Returns the shared response cache (None when disabled), attached to the offer store on first use."""
+    if RECOMMENDATION_CACHE_MAX_ENTRIES <= 0:
+        return None
+    cache = APP_STATE.get('RECOMMENDATION_CACHE')
+    if cache is None:
+        cache = RecommendationCache(
+            max_entries=RECOMMENDATION_CACHE_MAX_ENTRIES,
+            ttl_s=RECOMMENDATION_CACHE_TTL_S,
+            stale_ttl_s=RECOMMENDATION_CACHE_STALE_TTL_S,
+            stale_while_revalidate=RECOMMENDATION_CACHE_SWR,
+            search_radius_km=MAX_SEARCH_RADIUS_KM,
+            locate=lambda producer_id: get_producer_index().location(producer_id),
+            refresh=get_offer_store().refresh, # Rate-limited: one change_seq lookup per shard at most every refresh_interval_s
+        )
+        get_offer_store().attach_index(cache) # Offer changes invalidate the affected entries
+        APP_STATE['RECOMMENDATION_CACHE'] = cache
+    return cache
+
+
+def get_producer_directory() -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """producer_id -> (producer_name, contact), built once from PRODUCER_DF (plain Python values)."""
+    directory = APP_STATE.get('PRODUCER_DIRECTORY')
+    if directory is None:
+        producer_df = APP_STATE['PRODUCER_DF']
+        names = producer_df['producer_name'].astype(object).where(producer_df['producer_name'].notna(), None)
+        contacts = producer_df['contact'].astype(object).where(producer_df['contact'].notna(), None)
+        directory = dict(zip(producer_df['producer_id'].tolist(), zip(names.tolist(), contacts.tolist())))
+        APP_STATE['PRODUCER_DIRECTORY'] = directory
+    return directory
+
+
+def _supplier(
+    record: Mapping[str, Any], distance_km: float, lat: float, lon: float,
+    details: Tuple[Optional[str], Optional[str]], npk_similarity: Optional[float] = None,
+) -> SupplierOffer:
+    return SupplierOffer(
+        record['offer_id'], record['producer_id'], record['waste_type'], record['quantity_kg'],
+        record['cost_per_kg'], record['is_available'], record['listing_date'],
+        record['N_score'], record['P_score'], record['K_score'],
+        distance_km, lat, lon, details[0], details[1], npk_similarity,
+    )
+
+
+def _with_producer_details(ranked: Iterable[Tuple[Mapping[str, Any], float, Optional[float]]]) -> List[SupplierOffer]:
     """
-    Finds available offers, joins location, calculates distance, and ranks 
-    by cost (lowest first) then distance (BARGAIN MODEL).
+    Attaches producer name/contact/location to the (already ranked, top-k) offers:
+    (record, distance_km, npk_similarity) -> SupplierOffer. Offers of producers missing
+    from the producer table are dropped (as the old DataFrame inner join did).
     """
-    farmer_location = (farmer_lat, farmer_lon)
-    
-    available_offers = OFFERS_DF[
-        (OFFERS_DF['waste_type'] == required_waste) & 
-        (OFFERS_DF['is_available'] == True)
-    ].copy()
-    
-    if available_offers.empty:
+    directory = get_producer_directory()
+    producer_index = get_producer_index()
+    suppliers = []
+    with stage("producer_join"):
+        for record, distance, similarity in ranked:
+            details = directory.get(record['producer_id'])
+            location = producer_index.location(record['producer_id'])
+            if details is None or location is None:
+                continue
+            suppliers.append(_supplier(record, distance, location[0], location[1], details, similarity))
+    return suppliers
+
+
+def find_substitute_offers(farmer_lat, farmer_lon, required_waste: str, k: int = 5) -> List[SupplierOffer]:
+    """
+    Nearest substitutes by nutrient profile: available offers of OTHER waste types
+    within MAX_SEARCH_RADIUS_KM whose N:P:K balance is closest to required_waste.
+    Ranked by similarity (then distance); each row carries 'npk_similarity'.
+    """
+    index = get_npk_similarity_index()
+    target = APP_STATE['NPK_PROFILER'].waste_profile(required_waste)
+    if target is None:
+        return []
+
+    nearby_ids, nearby_distances = get_producer_index().query_radius(
+        farmer_lat, farmer_lon, MAX_SEARCH_RADIUS_KM
+    )
+    if not nearby_ids:
+        return []
+
+    with stage("substitute_search"):
+        matches = index.nearest(
+            target, dict(zip(nearby_ids, nearby_distances.tolist())), k=k, exclude_waste_type=required_waste
+        )
+    store = get_offer_store()
+    rows = []
+    for offer_id, similarity, distance in matches:
+        record = store.get(offer_id)
+        if record is not None:
+            rows.append((record, distance, round(similarity, 4)))
+    return _with_producer_details(rows)
+
+
+def find_best_offers(farmer_lat, farmer_lon, required_waste: str) -> List[SupplierOffer]:
+    """
+    Finds available offers from producers within MAX_SEARCH_RADIUS_KM and ranks 
+    them by cost (lowest first) then distance (BARGAIN MODEL).
+    """
+    # 1. Spatial prefilter: only the region shards the search circle reaches, then only
+    #    producers inside the circle (grid cells + vectorized haversine)
+    with stage("geo_prefilter"):
+        producer_index = get_producer_index()
+        regions = producer_index.regions_within(farmer_lat, farmer_lon, MAX_SEARCH_RADIUS_KM)
+        nearby_ids, nearby_distances = producer_index.query_radius(
+            farmer_lat, farmer_lon, MAX_SEARCH_RADIUS_KM, regions
+        )
+    if not nearby_ids:
         return []
 
-    merged_df = available_offers.merge(
-        PRODUCER_DF[['producer_id', 'latitude', 'longitude', 'producer_name', 'contact']], 
-        on='producer_id'
-    ).copy()
-    
-    def calculate_distance(row):
-        producer_location = (row['latitude'], row['longitude'])
-        return geodesic(farmer_location, producer_location).km
+    # 2. Cheapest nearby offers from those regions' waste_type/availability indexes (bounded heap, early exit)
+    with stage("offer_search"):
+        ranked_offers = get_offer_store().cheapest_available(
+            required_waste, dict(zip(nearby_ids, nearby_distances.tolist())), k=5, regions=regions
+        )
 
-    merged_df['distance_km'] = merged_df.apply(calculate_distance, axis=1)
-    
-    final_offers = merged_df[
-        merged_df['distance_km'] <= MAX_SEARCH_RADIUS_KM
-    ].sort_values(by=['cost_per_kg', 'distance_km'], ascending=[True, True])
-    
-    return final_offers.head(5).to_dict('records')
+    # 3. Join producer details only for the final top-5 rows
+    return _with_producer_details((offer, offer['distance_km'], None) for offer in ranked_offers)
 
 
 # =======================================================
 #               MAIN INTEGRATION FUNCTION
 # =======================================================
 
-def get_recommendation_data(farmer_data):
+def get_recommendation_data(farmer_data) -> RecommendationResponse:
     """
     Runs the full ML prediction, deficiency check, video generation, 
     and geospatial bargain matching.
     """
-    crop_target_row = CROP_DF[CROP_DF['label'] == farmer_data.crop_type.lower()]
-    if crop_target_row.empty:
+    # Model output depends only on the crop: precomputed at startup (no sklearn call here)
+    with stage("crop_lookup"):
+        crop_entry = get_recommendation_table().lookup(farmer_data.crop_type, APP_STATE.get('CROP_DF'))
+    if crop_entry is None:
         raise HTTPException(status_code=404, detail=f"Crop '{farmer_data.crop_type}' not found.")
 
-    target_npk_features_df = pd.DataFrame(
-        crop_target_row[['N', 'P', 'K']].values[0].reshape(1, -1), 
-        columns=['N', 'P', 'K']
+    cache = get_recommendation_cache()
+    if cache is None:
+        return _compute_recommendation(farmer_data, crop_entry)
+
+    # Same crop + same deficiency bucket + same ~1 km cell -> same answer
+    key = recommendation_cache_key(
+        crop_entry, check_soil_deficiency(farmer_data, crop_entry),
+        farmer_data.farmer_lat, farmer_data.farmer_lon, RECOMMENDATION_CACHE_CELL_DEG,
+    )
+    payload = cache.get_or_compute(
+        key, farmer_data.farmer_lat, farmer_data.farmer_lon,
+        lambda: _compute_recommendation(farmer_data, crop_entry),
     )
-    predicted_class = APP_STATE['WASTE_MODEL'].predict(target_npk_features_df)[0]
+    return dataclasses.replace(payload, crop_target=farmer_data.crop_type) # Echo the caller's spelling of the crop
 
-    specific_waste = APP_STATE['WASTE_DF_PROCESSED'][
-        APP_STATE['WASTE_DF_PROCESSED']['target_class'] == predicted_class
-    ].iloc[0]
 
-    best_waste_type = specific_waste['Waste_Type']
-    
-    deficiencies = check_soil_deficiency(farmer_data, crop_target_row)
-    deficiency_str = ", ".join(deficiencies)
-    video_link = find_video_link(best_waste_type, deficiency_str)
-    
+def _compute_recommendation(farmer_data, crop_entry) -> RecommendationResponse:
+    """Geospatial matching + payload assembly for one farmer (the uncached path)."""
     nearest_suppliers_data = find_best_offers(
         farmer_data.farmer_lat, 
         farmer_data.farmer_lon, 
-        best_waste_type
+        crop_entry.best_waste_type
     )
 
-    location_msg = f"Predicted Class: {predicted_class}. Ranked offers by lowest price (₹/kg)."
-
-    return {
-        "crop_target": farmer_data.crop_type,
-        "soil_status": f"Soil needs boost in: {deficiency_str}",
-        "deficiencies": deficiencies,
-        "recommended_waste": best_waste_type,
-        "video_recommendation_link": video_link, 
-        "location_message": location_msg,
-        "nearest_suppliers": nearest_suppliers_data # List of dictionaries
-    }
\ No newline at end of file
+    # No exact listing nearby: offer the closest nutrient-profile substitutes instead
+    substitutes = []
+    if not nearest_suppliers_data:
+        substitutes = find_substitute_offers(farmer_data.farmer_lat, farmer_data.farmer_lon, crop_entry.best_waste_type)
+
+    return _build_recommendation(farmer_data, crop_entry, nearest_suppliers_data, substitutes)
+
+
+def _build_recommendation(
+    farmer_data,
+    crop_entry,
+    nearest_suppliers_data: List[SupplierOffer],
+    substitute_suppliers: List[SupplierOffer] = (),
+    model: type = RecommendationResponse,
+    **extra: Any,
+) -> RecommendationResponse:
+    """Assembles the response payload (shared by the single and batch endpoints)."""
+    best_waste_type = crop_entry.best_waste_type
+    deficiencies = check_soil_deficiency(farmer_data, crop_entry)
+    deficiency_str = ", ".join(deficiencies)
+    video_link = find_video_link(best_waste_type, deficiency_str)
+
+    location_msg = f"Predicted Class: {crop_entry.predicted_class}. Ranked offers by lowest price (₹/kg)."
+    if substitute_suppliers:
+        location_msg += f" No {best_waste_type} listed nearby; showing wastes with a similar NPK profile."
+
+    return model(
+        crop_target=farmer_data.crop_type,
+        soil_status=f"Soil needs boost in: {deficiency_str}",
+        deficiencies=deficiencies,
+        recommended_waste=best_waste_type,
+        video_recommendation_link=video_link, 
+        location_message=location_msg,
+        nearest_suppliers=nearest_suppliers_data, # Ranked SupplierOffer rows
+        substitute_suppliers=list(substitute_suppliers),
+        **extra,
+    )
+
+
+# =======================================================
+#               BATCH (COOPERATIVE) RECOMMENDATIONS
+# =======================================================
+
+def _batch_candidates(waste_type: str, regions: List[str], directory: Mapping[str, Any]):
+    """
+    Available offers of one waste type from the given regions' shards, kept only when the
+    producer is both located and in the producer table. Returns (records, costs, lat, lon,
+    offer indices per region) as arrays for the distance pass.
+    """
+    producer_index = get_producer_index()
+    producer_lat, producer_lon = producer_index.coordinates()
+    records = [
+        record for record in get_offer_store().available_offers(waste_type, regions=regions)
+        if record['producer_id'] in directory
+    ]
+    positions = producer_index.positions_of([record['producer_id'] for record in records])
+    located = np.flatnonzero(positions >= 0)
+    records = [records[j] for j in located]
+    positions = positions[located]
+    costs = np.array(
+        [np.nan if record['cost_per_kg'] is None else record['cost_per_kg'] for record in records],
+        dtype=np.float64,
+    )
+    by_region: Dict[Optional[str], List[int]] = {}
+    for j, record in enumerate(records):
+        by_region.setdefault(producer_index.region_of(record['producer_id']), []).append(j)
+    by_region = {region: np.array(ids, dtype=np.int64) for region, ids in by_region.items()}
+    return records, costs, producer_lat[positions], producer_lon[positions], by_region
+
+
+def iter_batch_recommendations(farmers: List[Any]) -> Iterator[BatchRecommendationResponse | Dict[str, Any]]:
+    """
+    Yields one result per farmer, grouped by crop so the crop lookup runs once per crop.
+    Candidate offers are loaded once per waste type, and only from the regions within
+    MAX_SEARCH_RADIUS_KM of some farmer in the batch. Within a chunk, farmers near the
+    same regions share one candidate list (those regions' offers, cut to the farmers'
+    bounding box widened by the radius), and their distances to it are one vectorized
+    haversine matrix. Every result carries the farmer's input "index".
+    """
+    table = get_recommendation_table()
+    crop_df = APP_STATE.get('CROP_DF')
+    producer_index = get_producer_index()
+    directory = get_producer_directory()
+
+    all_lat = np.array([farmer.farmer_lat for farmer in farmers], dtype=np.float64)
+    all_lon = np.array([farmer.farmer_lon for farmer in farmers], dtype=np.float64)
+    regions, near = producer_index.regions_within_many(all_lat, all_lon, MAX_SEARCH_RADIUS_KM)
+    batch_regions = [regions[r] for r in np.flatnonzero(near.any(axis=0))]
+    candidates_by_waste: Dict[str, tuple] = {}
+    no_offers = np.empty(0, dtype=np.int64)
+
+    # 1. Group farmers by crop (input order kept inside each group)
+    groups: Dict[str, List[int]] = {}
+    for i, farmer in enumerate(farmers):
+        groups.setdefault(farmer.crop_type.lower(), []).append(i)
+
+    for crop_key, farmer_indices in groups.items():
+        crop_entry = table.lookup(crop_key, crop_df)
+        if crop_entry is None:
+            for i in farmer_indices:
+                yield {"index": i, "status_code": 404, "detail": f"Crop '{farmers[i].crop_type}' not found."}
+            continue
+
+        # 2. Candidate offers for this crop's waste type (one index bucket per region, shared by crops)
+        waste_type = crop_entry.best_waste_type
+        if waste_type not in candidates_by_waste:
+            candidates_by_waste[waste_type] = _batch_candidates(waste_type, batch_regions, directory)
+        offer_records, offer_costs, offer_lat, offer_lon, offers_by_region = candidates_by_waste[waste_type]
+
+        # 3. Distances (farmers x nearby candidate offers), computed in bounded chunks
+        for start in range(0, len(farmer_indices), BATCH_DISTANCE_CHUNK):
+            chunk = farmer_indices[start:start + BATCH_DISTANCE_CHUNK]
+            chunk_positions = np.array(chunk)
+            neighbourhoods: Dict[bytes, List[int]] = {}
+            for row, i in enumerate(chunk):
+                neighbourhoods.setdefault(near[i].tobytes(), []).append(row)
+
+            ranked: List[Optional[Tuple[np.ndarray, np.ndarray]]] = [None] * len(chunk)
+            for rows in neighbourhoods.values():
+                members = chunk_positions[rows]
+                # Ascending offer order, so equal (cost, distance) ties rank as in a full scan
+                candidates = np.sort(np.concatenate(
+                    [no_offers] + [offers_by_region.get(regions[r], no_offers) for r in np.flatnonzero(near[members[0]])]
+                ))
+                if candidates.size:
+                    candidates = candidates[within_bounding_box(
+                        offer_lat[candidates], offer_lon[candidates], all_lat[members], all_lon[members],
+                        MAX_SEARCH_RADIUS_KM,
+                    )]
+                distances = haversine_km(
+                    all_lat[members, None], all_lon[members, None],
+                    offer_lat[None, candidates], offer_lon[None, candidates]
+                )
+                for k, row in enumerate(rows):
+                    in_range = np.flatnonzero(distances[k] <= MAX_SEARCH_RADIUS_KM)
+                    # Rank by cost then distance (same BARGAIN MODEL as find_best_offers)
+                    top = in_range[np.lexsort((distances[k, in_range], offer_costs[candidates[in_range]]))][:5]
+                    ranked[row] = (candidates[top], distances[k, top])
+
+            for row, i in enumerate(chunk):
+                suppliers = [
+                    _supplier(
+                        offer_records[j], distance, offer_lat[j], offer_lon[j],
+                        directory[offer_records[j]['producer_id']],
+                    )
+                    for j, distance in zip(*ranked[row])
+                ]
+
+                substitutes = []
+                if not suppliers:
+                    substitutes = find_substitute_offers(
+                        farmers[i].farmer_lat, farmers[i].farmer_lon, crop_entry.best_waste_type
+                    )
+                yield _build_recommendation(
+                    farmers[i], crop_entry, suppliers, substitutes, model=BatchRecommendationResponse, index=i
+                )
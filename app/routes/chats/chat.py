@@ -0,0 +1,128 @@
+# routes/chats/chat.py
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Query, WebSocket
+from starlette.concurrency import run_in_threadpool
+
+from app.config.constants import (
+    AUTH_REQUIRED,
+    CHAT_MAX_MESSAGE_CHARS,
+    CHAT_MAX_FRAME_CHARS,
+    CHAT_HISTORY_ON_JOIN,
+    CHAT_HISTORY_MAX,
+)
+from app.config.state import APP_STATE
+from app.services.auth_service import authenticate_token
+from app.services.security import InvalidTokenError
+from app.services.chat_service import ChatHub, Subscriber
+from app.services.marketplace_services import get_offer_store
+
+router = APIRouter(prefix="/chats", tags=["Chat"])
+
+# Application close codes (4000-4999 are free for apps; 1009/1013 are standard)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_OFFER_NOT_FOUND = 4404
+CLOSE_MESSAGE_TOO_BIG = 1009
+CLOSE_TOO_SLOW = 1013
+
+
+def _get_chat_hub() -> Optional[ChatHub]:
+    return APP_STATE.get('CHAT_HUB')
+
+
+def _parse_body(text: str) -> str:
+    """Frames are either {"body": "..."} or plain text."""
+    if text.lstrip().startswith('{'):
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            return text
+        if isinstance(payload, dict):
+            return str(payload.get('body') or '')
+    return text
+
+
+async def _send_loop(websocket: WebSocket, subscriber: Subscriber) -> None:
+    """Drains one connection's inbox. The only coroutine that writes to the socket after join."""
+    while True:
+        frame = await subscriber.queue.get()
+        if frame is None: # Inbox overflowed (see Subscriber.deliver)
+            await websocket.close(code=CLOSE_TOO_SLOW, reason="Too slow: messages dropped, reconnect to resync.")
+            return
+        await websocket.send_text(frame) # Pre-encoded once by ChatHub.post
+
+
+# --- Live chat: one room per offer id ---
+@router.websocket("/offers/{offer_id}/ws")
+async def chat_socket(
+    websocket: WebSocket,
+    offer_id: str,
+    token: Optional[str] = Query(None, description="Access token (browsers cannot set headers on WebSockets)."),
+    user_id: Optional[str] = Query(None, min_length=1, max_length=64, description="Anonymous sender id; ignored with a token."),
+):
+    """
+    On join the client receives {"type": "history", "messages": [...]} (last
+    CHAT_HISTORY_ON_JOIN messages), then {"type": "message", ...} for every message
+    posted to the room, including its own (the echo carries the message_id).
+    Messages may duplicate the tail of history around the join; dedupe by message_id.
+    With a token the sender id is the token's user; anonymous user_id is refused under AUTH_REQUIRED=1.
+    """
+    await websocket.accept()
+    if token is not None:
+        try:
+            user_id = authenticate_token(token)['sub']
+        except InvalidTokenError as e:
+            await websocket.close(code=CLOSE_UNAUTHORIZED, reason=str(e))
+            return
+    elif AUTH_REQUIRED or user_id is None:
+        await websocket.close(code=CLOSE_UNAUTHORIZED, reason="Send ?token= to join the chat.")
+        return
+    hub = _get_chat_hub()
+    if hub is None or get_offer_store().get(offer_id) is None:
+        await websocket.close(code=CLOSE_OFFER_NOT_FOUND, reason=f"Offer '{offer_id}' not found.")
+        return
+
+    # Join before reading history so nothing posted in between is missed
+    subscriber = hub.join(offer_id)
+    sender = None
+    try:
+        history = await run_in_threadpool(hub.store.history, offer_id, None, CHAT_HISTORY_ON_JOIN)
+        await websocket.send_json({"type": "history", "messages": history})
+        sender = asyncio.create_task(_send_loop(websocket, subscriber))
+
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            text = frame.get("text")
+            if text is None:
+                text = (frame.get("bytes") or b"").decode("utf-8", errors="replace")
+            if len(text) > CHAT_MAX_FRAME_CHARS:
+                await websocket.close(code=CLOSE_MESSAGE_TOO_BIG, reason="Frame too large.")
+                break
+            body = _parse_body(text).strip()
+            if not body or len(body) > CHAT_MAX_MESSAGE_CHARS:
+                subscriber.deliver(json.dumps({"type": "error", "detail": f"Message must be 1-{CHAT_MAX_MESSAGE_CHARS} characters."}))
+                continue
+            await hub.post(offer_id, user_id, body)
+            if sender.done():
+                break # Closed for being too slow
+    finally:
+        hub.leave(offer_id, subscriber)
+        if sender is not None:
+            sender.cancel()
+
+
+# --- Message history (REST) ---
+@router.get("/offers/{offer_id}/messages", summary="Committed chat messages of an offer's room, oldest first.")
+def get_chat_history(
+    offer_id: str,
+    before: Optional[float] = Query(None, description="Only messages sent before this epoch time (page backwards)."),
+    limit: int = Query(50, ge=1, le=CHAT_HISTORY_MAX),
+) -> Dict[str, Any]:
+    hub = _get_chat_hub()
+    if hub is None:
+        raise HTTPException(status_code=503, detail="Chat is not running.")
+    messages: List[Dict[str, Any]] = hub.store.history(offer_id, before, limit)
+    return {"offer_id": offer_id, "messages": messages}
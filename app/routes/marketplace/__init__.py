@@ -0,0 +1,174 @@
+# routes/marketplace/__init__.py
+
+from typing import Any, Dict, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from app.config.constants import RESERVATION_HOLD_S, RESERVATION_MAX_HOLD_S
+from app.config.constants import BULK_IMPORT_CHUNK_ROWS, BULK_IMPORT_MAX_LINE_BYTES, BULK_IMPORT_MAX_ERRORS, BULK_EXPORT_PAGE_ROWS
+from app.config.state import APP_STATE
+from app.routes.agent.recommendation import get_producer_index
+from app.services.bulk_offers import (
+    BulkImportError,
+    OfferImporter,
+    detect_import_format,
+    iter_csv_records,
+    iter_lines,
+    iter_ndjson_records,
+    iter_offer_export,
+)
+from app.services.auth_service import get_current_user, get_optional_user
+from app.services.marketplace_services import get_offer_store, get_reservation_service
+from app.services.waste_calculator import get_waste_lookup
+from app.services.reservation_service import (
+    InsufficientStockError,
+    OfferNotFoundError,
+    ReservationConflictError,
+    ReservationAuthRequiredError,
+    ReservationExpiredError,
+    ReservationForbiddenError,
+    ReservationNotFoundError,
+)
+
+
+class ReservationInput(BaseModel):
+    quantity_kg: float = Field(..., gt=0)
+    buyer_id: Optional[str] = None # Ignored when a bearer token is sent: the token's user is the buyer. Anonymous: must be unset
+    hold_seconds: float = Field(RESERVATION_HOLD_S, gt=0, le=RESERVATION_MAX_HOLD_S)
+
+
+router = APIRouter(tags=["Marketplace"])
+
+# Sync handlers: FastAPI runs them in its thread pool, so short SQLite transactions never block the event loop.
+# Reservation routes accept an optional bearer token (required with AUTH_REQUIRED=1); it is checked on the
+# event loop by get_optional_user from the verified-token cache, so auth adds no database round trip.
+# A hold made with a token belongs to that buyer: only the same buyer's token can confirm or release it.
+# Anonymous holds carry no buyer_id (a buyer_id cannot be claimed without the buyer's token).
+
+# --- Bulk import / export (registered before /offers/{offer_id} so the paths do not collide) ---
+
+@router.post("/offers/import", summary="Stream a CSV or NDJSON file of offers; rows are validated and committed in chunks.")
+async def import_offers(
+    request: Request,
+    format: Optional[Literal['csv', 'ndjson']] = Query(None, description="Defaults to the Content-Type (text/csv or application/x-ndjson)."),
+    dry_run: bool = Query(False, description="Validate and score only; nothing is written."),
+    user: Dict[str, Any] = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    Requires a bearer token. Required fields per row: producer_id, waste_type, quantity_kg,
+    cost_per_kg. Optional: offer_id (re-importing the same id updates that offer, but cannot
+    change its producer or touch an offer with reservations on hold), is_available, listing_date.
+    NPK scores come from the waste lookup, as for manual uploads. Async (not a thread-pool
+    handler) so the body is read as a stream; each chunk is validated and committed in the
+    thread pool. Invalid rows are skipped and listed by line number in the summary.
+    """
+    fmt = format or detect_import_format(request.headers.get('content-type'))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson, or pass ?format=.")
+
+    importer = OfferImporter(
+        get_offer_store(),
+        get_waste_lookup(APP_STATE['WASTE_DF_PROCESSED']),
+        get_producer_index(),
+        chunk_rows=BULK_IMPORT_CHUNK_ROWS,
+        max_errors=BULK_IMPORT_MAX_ERRORS,
+        dry_run=dry_run,
+        held_offer_ids=get_reservation_service().held_offer_ids,
+    )
+    lines = iter_lines(request.stream(), BULK_IMPORT_MAX_LINE_BYTES)
+    records = iter_csv_records(lines) if fmt == 'csv' else iter_ndjson_records(lines)
+    try:
+        await importer.consume(records)
+    except BulkImportError as e:
+        # Chunks committed before the bad input stay imported; the summary says how far we got
+        raise HTTPException(status_code=e.status_code, detail={"error": str(e), **importer.summary()})
+    return importer.summary()
+
+
+@router.get("/offers/export", summary="Stream offers in offer_id order, optionally one cursor page at a time.")
+def export_offers(
+    format: Literal['csv', 'ndjson'] = 'ndjson',
+    cursor: Optional[str] = Query(None, description="Return offers after this offer_id (X-Next-Cursor of the previous page)."),
+    limit: Optional[int] = Query(None, ge=1, description="Page size; omit to stream everything after the cursor."),
+    waste_type: Optional[str] = None,
+    available_only: bool = False,
+):
+    """
+    Keyset pagination over the primary key: every page costs the same however deep it
+    is, and rows are streamed page by page (never materialized as one table). When more
+    rows follow, the X-Next-Cursor header carries the cursor for the next request.
+    """
+    store = get_offer_store()
+    store.flush() # Include offers still waiting for their group commit
+    if waste_type is not None:
+        waste_type = get_waste_lookup(APP_STATE['WASTE_DF_PROCESSED']).canonical_label(waste_type) or waste_type
+
+    end_cursor = store.cursor_after(cursor, limit, waste_type, available_only) if limit else None
+    headers = {"X-Next-Cursor": end_cursor} if end_cursor is not None else {}
+    page_rows = min(BULK_EXPORT_PAGE_ROWS, limit) if limit else BULK_EXPORT_PAGE_ROWS
+    return StreamingResponse(
+        iter_offer_export(store, format, cursor, end_cursor, page_rows, waste_type, available_only),
+        media_type="text/csv" if format == 'csv' else "application/x-ndjson",
+        headers=headers,
+    )
+
+
+@router.get("/offers/{offer_id}", summary="Current stock and availability of one offer.")
+def get_offer(offer_id: str) -> Dict[str, Any]:
+    offer = get_offer_store().get(offer_id)
+    if offer is None:
+        raise HTTPException(status_code=404, detail=f"Offer '{offer_id}' not found.")
+    return offer
+
+
+@router.post("/offers/{offer_id}/reservations", status_code=201, summary="Atomically hold stock from an offer.")
+def reserve_offer(
+    offer_id: str,
+    reservation: ReservationInput,
+    user: Optional[Dict[str, Any]] = Depends(get_optional_user),
+) -> Dict[str, Any]:
+    if user is None and reservation.buyer_id is not None:
+        raise HTTPException(
+            status_code=401, detail="Sign in to reserve as a buyer.", headers={"WWW-Authenticate": "Bearer"}
+        )
+    buyer_id = user['sub'] if user is not None else None
+    try:
+        return get_reservation_service().reserve(offer_id, reservation.quantity_kg, buyer_id, reservation.hold_seconds)
+    except OfferNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Offer '{offer_id}' not found.")
+    except (InsufficientStockError, ReservationConflictError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+def _reservation_auth_required(reservation_id: str) -> HTTPException:
+    return HTTPException(
+        status_code=401, detail=f"Reservation '{reservation_id}' is held by a signed-in buyer; send their token.",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+@router.post("/reservations/{reservation_id}/confirm", summary="Confirm a held reservation (purchase).")
+def confirm_reservation(reservation_id: str, user: Optional[Dict[str, Any]] = Depends(get_optional_user)) -> Dict[str, Any]:
+    try:
+        return get_reservation_service().confirm(reservation_id, user['sub'] if user is not None else None)
+    except ReservationNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Reservation '{reservation_id}' not found.")
+    except ReservationAuthRequiredError:
+        raise _reservation_auth_required(reservation_id)
+    except ReservationForbiddenError:
+        raise HTTPException(status_code=403, detail=f"Reservation '{reservation_id}' belongs to another buyer.")
+    except ReservationExpiredError:
+        raise HTTPException(status_code=410, detail=f"Reservation '{reservation_id}' is no longer held.")
+
+
+@router.delete("/reservations/{reservation_id}", summary="Release a hold and return its stock.")
+def release_reservation(reservation_id: str, user: Optional[Dict[str, Any]] = Depends(get_optional_user)) -> Dict[str, Any]:
+    try:
+        return get_reservation_service().release(reservation_id, user['sub'] if user is not None else None)
+    except ReservationNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Reservation '{reservation_id}' not found.")
+    except ReservationAuthRequiredError:
+        raise _reservation_auth_required(reservation_id)
+    except ReservationForbiddenError:
+        raise HTTPException(status_code=403, detail=f"Reservation '{reservation_id}' belongs to another buyer.")
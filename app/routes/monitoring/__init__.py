@@ -0,0 +1,27 @@
+# routes/monitoring/__init__.py
+
+import re
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.config.constants import PROFILING_ENABLED
+from app.services.metrics import METRICS, profile_dir
+
+router = APIRouter(tags=["Monitoring"])
+
+_PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+@router.get("/metrics", response_class=PlainTextResponse, summary="Prometheus metrics for this worker.")
+def get_metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/debug/profiles/{profile_id}", response_class=PlainTextResponse, summary="Folded stacks of a profiled request.")
+def get_profile(profile_id: str):
+    """Flame-graph input (flamegraph.pl / speedscope) for a request sent with "X-Profile: 1"."""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (set PROFILING_ENABLED=1).")
+    path = profile_dir() / f"{profile_id}.folded"
+    if not _PROFILE_ID.match(profile_id) or not path.exists():
+        raise HTTPException(status_code=404, detail=f"Profile '{profile_id}' not found.")
+    return PlainTextResponse(path.read_text())
@@ -1,16 +1,30 @@
 # routes/uploads/photo_upload.py
-from fastapi import APIRouter, File, UploadFile, HTTPException, Form
+import asyncio
+import hashlib
+import json
+from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
-from io import BytesIO
-import google as genai # Needed for the client initialization
-import json # Needed to parse the JSON response from Gemini
-from PIL import Image
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Any, List, Optional
 
 # --- IMPORTS for Services and Global State ---
-from app.services.waste_calculator import calculate_weighted_npk_score, calculate_manual_npk_score
+from app.services.waste_calculator import (
+    calculate_weighted_npk_score,
+    calculate_manual_npk_score,
+    calculate_batch_weighted_npk_scores,
+    calculate_batch_manual_npk_scores,
+    get_waste_lookup,
+)
 from app.services.marketplace_services import save_offer_to_marketplace
+from app.services.vision_service import analyze_waste_image, get_vision_detector, ClientDisconnectedError
+from app.services.upload_service import PreparedImage, preprocess_upload, prepare_spooled_upload, spool_upload
+from app.services.upload_jobs import UploadJobQueue, QueueFullError, IdempotencyConflictError, TERMINAL_STATUSES
+from app.services.metrics import stage
+from app.services.serialization import FastJSONResponse, dumps
+from app.models.uploads.photo import OfferUploadResult, WasteAnalysis
 from app.config.state import APP_STATE 
+from app.config.constants import UPLOAD_JOB_RETRY_AFTER_S, UPLOAD_JOB_MAX_WAIT_S, UPLOAD_JOB_STREAM_POLL_S
 
 # --- Define the Input Schemas ---
 # (SellerManualInput class remains the same)
@@ -19,106 +33,153 @@ class SellerManualInput(BaseModel):
     manual_quantity_kg: Optional[float] = None
     cost_per_kg: float 
     producer_id: str 
-    
-# --- Define the Expected Output Schema (MUST match what you send to Gemini) ---
-# NOTE: This is replicated here for context but should live in models.py
-DETECTION_SCHEMA = {
-    "type": "array",
-    "items": {
-        "type": "object",
-        "properties": {
-            "label": {"type": "string", "description": "The exact waste item name."},
-            "relative_quantity_score": {"type": "number", "description": "Score from 1 to 10."}
-        },
-        "required": ["label", "relative_quantity_score"]
-    }
-}
 
+# --- Batch scoring schemas (many bins per request) ---
+class DetectionItem(BaseModel):
+    label: str
+    box_w: float = 0.0
+    box_h: float = 0.0
+    relative_quantity_score: Optional[float] = None # Used when there is no box (Gemini-style detections)
+
+class ManualScoreItem(BaseModel):
+    waste_type: str
+    quantity_kg: float
+
+class BatchScoreInput(BaseModel):
+    detection_batches: List[List[DetectionItem]] = [] # One detection list per bin/photo
+    manual_items: List[ManualScoreItem] = [] # (waste_type, kg) pairs
+    
 router = APIRouter(
     prefix="/upload",
     tags=["Supplier Uploads"]
 )
 
 # --- Define the Image Processing Endpoint ---
-@router.post("/photo", summary="Uploads image, processes NPK via Gemini, and saves offer.")
+@router.post(
+    "/photo", summary="Uploads image, processes NPK via the vision backend, and saves offer.",
+    response_model=OfferUploadResult, response_class=FastJSONResponse,
+)
 async def upload_waste_photo(
+    request: Request,
     file: Optional[UploadFile] = File(None),
     cost_per_kg: float = Form(...),
     producer_id: str = Form(...),
     manual_waste_type: Optional[str] = Form(None),
     manual_quantity_kg: Optional[float] = Form(None),
-) -> Dict[str, Any]:
+) -> FastJSONResponse:
     
     # 1. INITIAL SETUP
+    offer_data = _seller_input(cost_per_kg, producer_id, manual_waste_type, manual_quantity_kg, has_file=file is not None)
+    prepared = None
+    if file is not None:
+        # Stream to a size-capped spool, check the header, decode at reduced size and
+        # re-encode a small JPEG. Bad or oversized images are rejected here (4xx).
+        with stage("upload_preprocess"):
+            prepared = await preprocess_upload(file)
+    return FastJSONResponse(await process_offer_upload(offer_data, prepared, request=request))
+
+
+def _seller_input(cost_per_kg, producer_id, manual_waste_type, manual_quantity_kg, has_file: bool) -> SellerManualInput:
     offer_data = SellerManualInput(
         cost_per_kg=cost_per_kg,
         producer_id=producer_id,
         manual_waste_type=manual_waste_type,
         manual_quantity_kg=manual_quantity_kg
     )
-    is_image_mode = (file is not None)
+    if not has_file and (offer_data.manual_waste_type is None or offer_data.manual_quantity_kg is None):
+        raise HTTPException(status_code=400, detail="Missing Data: Must upload an image OR provide manual details.")
+    return offer_data
+
+
+async def process_offer_upload(
+    offer_data: SellerManualInput,
+    prepared: Optional[PreparedImage],
+    request: Optional[Request] = None,
+) -> OfferUploadResult:
+    """
+    Analysis -> scoring -> persistence for one (already preprocessed) upload.
+    Shared by the synchronous endpoint and the async job workers (request=None:
+    nobody is connected, so there is no disconnect cancellation).
+    """
+    is_image_mode = (prepared is not None)
     final_npk_scores = {}
     final_waste_type = None
     final_quantity = 0.0
     source_message = ""
-    
-    if not is_image_mode and (offer_data.manual_waste_type is None or offer_data.manual_quantity_kg is None):
-        raise HTTPException(status_code=400, detail="Missing Data: Must upload an image OR provide manual details.")
 
     # --- 2. EXECUTE LOGIC (AI vs. Manual) ---
 
     if is_image_mode:
-        # **A. AI/VISION MODE (Gemini is Executed Here)**
+        # **A. AI/VISION MODE (Gemini / local detector is Executed Here)**
         try:
-            image_bytes = await file.read()
-            image_pil = Image.open(BytesIO(image_bytes))
-
-            # --- CRITICAL GEMINI API CALL ---
-            client = APP_STATE['GEMINI_CLIENT'] # Client loaded from global state
-            
-            response = client.models.generate_content(
-                model='gemini-2.5-flash',
-                contents=[image_pil, "Identify ALL distinct organic waste items and estimate their relative quantity score (1-10)."],
-                config={
-                    "response_mime_type": "application/json",
-                    "response_schema": DETECTION_SCHEMA,
-                    "temperature": 0.1
-                }
-            )
-            # --- END API CALL ---
+            # Repeat uploads (same bytes or a near-identical photo) skip the model entirely.
+            # Entries are scoped to the backend/model, so a backend switch never serves stale results.
+            detector = get_vision_detector() # Backend loaded once at startup
+            analysis_cache = APP_STATE.get('ANALYSIS_CACHE')
+            detection_results = None
+            if analysis_cache:
+                with stage("analysis_cache_lookup"):
+                    detection_results = analysis_cache.get_from_memory(prepared.content_hash, detector.cache_namespace)
+                    if detection_results is None: # Disk tier and perceptual hash block: run them off the loop
+                        detection_results = await run_in_threadpool(
+                            analysis_cache.get_blocking, prepared.content_hash, prepared.image, detector.cache_namespace
+                        )
 
-            # Parse the structured JSON response
-            detection_results = json.loads(response.text)
+            if detection_results is None:
+                # --- CRITICAL VISION CALL (Gemini or the local model, see VISION_BACKEND) ---
+                # Awaited off the event loop, with a concurrency cap, a per-call timeout
+                # and cancellation on client disconnect.
+                with stage("vision_call"):
+                    detection_results = await analyze_waste_image(prepared, detector, request=request)
+                # --- END VISION CALL ---
+                if analysis_cache and detection_results:
+                    await run_in_threadpool(
+                        analysis_cache.put, prepared.content_hash, detection_results, prepared.image, detector.cache_namespace
+                    )
             
             # Use the service function to calculate the weighted NPK score
-            npk_calc_result = calculate_weighted_npk_score(
-                detection_results=detection_results,
-                waste_npk_df=APP_STATE['WASTE_DF_PROCESSED']
-            )
+            with stage("npk_scoring"):
+                npk_calc_result = calculate_weighted_npk_score(
+                    detection_results=detection_results,
+                    waste_npk_df=APP_STATE['WASTE_DF_PROCESSED']
+                )
 
             if npk_calc_result.get("status") == "success":
                 final_waste_type = npk_calc_result['dominant_waste_type']
                 final_npk_scores = npk_calc_result['combined_npk_score']
                 final_quantity = npk_calc_result['total_area_proxy'] 
-                source_message = "Data sourced via Gemini Vision Analysis."
+                source_message = f"Data sourced via {detector.name} vision analysis."
             else:
                 is_image_mode = False # Fallback if classification fails
 
+        except ClientDisconnectedError:
+            # Nobody is waiting for this response any more; do not save a half-processed offer
+            raise HTTPException(status_code=499, detail="Client closed request during image analysis.")
+        except asyncio.TimeoutError:
+            print("WARNING: Vision call timed out.")
+            if not (offer_data.manual_waste_type and offer_data.manual_quantity_kg):
+                raise HTTPException(status_code=504, detail="Image analysis timed out.")
+            is_image_mode = False # Fallback to manual details
         except Exception as e:
-            print(f"WARNING: Image/Gemini processing failed: {e}")
+            print(f"WARNING: Image/vision processing failed: {e}")
             is_image_mode = False # Fallback if any error occurs
     
     
     # **B. MANUAL MODE (Fallback or Direct Input)**
     if not is_image_mode and offer_data.manual_waste_type and offer_data.manual_quantity_kg:
-        final_waste_type = offer_data.manual_waste_type
+        waste_lookup = get_waste_lookup(APP_STATE['WASTE_DF_PROCESSED'])
         final_quantity = offer_data.manual_quantity_kg
         
-        final_npk_scores = calculate_manual_npk_score(
-            final_waste_type, 
-            final_quantity, 
-            APP_STATE['WASTE_DF_PROCESSED']
-        )
+        try:
+            final_npk_scores = calculate_manual_npk_score(
+                offer_data.manual_waste_type, 
+                final_quantity, 
+                waste_lookup
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # Store the canonical name ("banana peel" -> "Banana Skin") so offer searches match it
+        final_waste_type = waste_lookup.canonical_label(offer_data.manual_waste_type)
         source_message = "Data provided manually by seller."
     
     # Final check for data completeness
@@ -127,27 +188,163 @@ async def upload_waste_photo(
 
     # --- 3. SAVE THE FINAL OFFER TO THE MARKETPLACE ---
     try:
-        # Call the persistence service
-        offer_id = save_offer_to_marketplace(
-            producer_id=offer_data.producer_id,
-            cost_per_kg=offer_data.cost_per_kg,
-            waste_type=final_waste_type,
-            estimated_quantity=final_quantity,
-            npk_scores=final_npk_scores,
-            offers_df=APP_STATE['OFFERS_DF']
-        )
+        # Call the persistence service (queues the offer for the next group commit)
+        with stage("offer_persist"):
+            offer_id, committed = save_offer_to_marketplace(
+                producer_id=offer_data.producer_id,
+                cost_per_kg=offer_data.cost_per_kg,
+                waste_type=final_waste_type,
+                estimated_quantity=final_quantity,
+                npk_scores=final_npk_scores,
+            )
+            await asyncio.wrap_future(committed) # Only hand out the listing id once it is durable
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database persistence failed on save: {e}")
 
     # --- 4. RETURN FINAL ANALYSIS INTERFACE ---
-    return {
-        "status": "ANALYSIS_SUCCESSFUL",
-        "listing_id": offer_id, 
-        "seller_input_source": source_message,
-        "final_analysis": {
-            "waste_type": final_waste_type,
-            "calculated_npk_score": final_npk_scores,
-            "estimated_quantity_proxy": round(final_quantity, 2),
-            "seller_price_per_kg": offer_data.cost_per_kg,
-        }
-    }
\ No newline at end of file
+    return OfferUploadResult(
+        status="ANALYSIS_SUCCESSFUL",
+        listing_id=offer_id, 
+        seller_input_source=source_message,
+        final_analysis=WasteAnalysis(
+            waste_type=final_waste_type,
+            calculated_npk_score=final_npk_scores,
+            estimated_quantity_proxy=round(final_quantity, 2),
+            seller_price_per_kg=offer_data.cost_per_kg,
+        ),
+    )
+
+
+# --- Asynchronous Upload Jobs (accept now, analyse in the background) ---
+def _get_upload_job_queue() -> UploadJobQueue:
+    job_queue = APP_STATE.get('UPLOAD_JOB_QUEUE')
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Upload job queue is not running.")
+    return job_queue
+
+
+def _job_response(request: Request, job: Dict[str, Any]) -> Dict[str, Any]:
+    return {**job, "status_url": str(request.url_for("get_upload_job", job_id=job["job_id"]))}
+
+
+@router.post("/photo/jobs", status_code=202, summary="Accepts an upload and returns a job id; analysis runs in the background.")
+async def submit_upload_job(
+    request: Request,
+    response: Response,
+    file: Optional[UploadFile] = File(None),
+    cost_per_kg: float = Form(...),
+    producer_id: str = Form(...),
+    manual_waste_type: Optional[str] = Form(None),
+    manual_quantity_kg: Optional[float] = Form(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+) -> Dict[str, Any]:
+    """
+    Same inputs as /photo. Only the size-capped spool happens in the request; decode,
+    vision analysis, scoring and persistence run on the job workers. Retrying with the
+    same Idempotency-Key returns the original job (200) instead of queueing new work,
+    unless it failed with a 5xx: then the same job is queued again (202). Reusing a key
+    for a different upload is a 422. A full queue answers 429 + Retry-After.
+    """
+    offer_data = _seller_input(cost_per_kg, producer_id, manual_waste_type, manual_quantity_kg, has_file=file is not None)
+    job_queue = _get_upload_job_queue()
+
+    spool, content_hash, original_bytes = None, None, 0
+    if file is not None:
+        spool, content_hash, original_bytes = await spool_upload(file) # 413 before anything is queued
+    request_hash = hashlib.sha256(
+        json.dumps([content_hash, offer_data.model_dump()], sort_keys=True).encode()
+    ).hexdigest()
+
+    async def work() -> OfferUploadResult:
+        prepared = None
+        if spool is not None:
+            with stage("upload_preprocess"):
+                prepared = await prepare_spooled_upload(spool, content_hash, original_bytes)
+        return await process_offer_upload(offer_data, prepared)
+
+    queued = False
+    try:
+        job, created = await job_queue.submit(idempotency_key, request_hash, work)
+        queued = created
+    except QueueFullError:
+        raise HTTPException(
+            status_code=429, detail="Upload queue is full, retry shortly.",
+            headers={"Retry-After": str(UPLOAD_JOB_RETRY_AFTER_S)},
+        )
+    except IdempotencyConflictError:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different upload.")
+    finally:
+        if spool is not None and not queued:
+            spool.close() # Rejected or duplicate: no job will read this image
+    if not created:
+        response.status_code = 200 # Replay of an earlier submission
+    return _job_response(request, job)
+
+
+@router.get("/jobs/{job_id}", summary="Status (and result, once finished) of an upload job.")
+async def get_upload_job(
+    request: Request,
+    job_id: str,
+    wait_s: float = Query(0.0, ge=0.0, le=UPLOAD_JOB_MAX_WAIT_S, description="Long-poll up to this long for the job to finish."),
+) -> Dict[str, Any]:
+    job = await _get_upload_job_queue().get(job_id, wait_s=wait_s)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Upload job '{job_id}' not found.")
+    return _job_response(request, job)
+
+
+@router.get("/jobs/{job_id}/events", summary="Server-sent events: one 'status' event per job state change.")
+async def stream_upload_job(request: Request, job_id: str):
+    job_queue = _get_upload_job_queue()
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Upload job '{job_id}' not found.")
+
+    async def events():
+        current, last_status = job, None
+        while True:
+            if current["status"] != last_status:
+                last_status = current["status"]
+                yield f"event: status\ndata: {dumps(_job_response(request, current)).decode()}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            if last_status in TERMINAL_STATUSES or await request.is_disconnected():
+                return
+            current = await job_queue.get(job_id, wait_s=UPLOAD_JOB_STREAM_POLL_S) or current
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+# --- Batch NPK Scoring (no persistence) ---
+@router.post(
+    "/score/batch", summary="Scores many detection lists and/or manual items in one vectorized pass.",
+    response_class=FastJSONResponse,
+)
+def score_batch(payload: BatchScoreInput) -> FastJSONResponse:
+    waste_lookup = get_waste_lookup(APP_STATE['WASTE_DF_PROCESSED'])
+
+    detection_results = calculate_batch_weighted_npk_scores(
+        [
+            [item.model_dump(exclude_none=True) for item in batch]
+            for batch in payload.detection_batches
+        ],
+        waste_lookup
+    )
+    manual_scores = calculate_batch_manual_npk_scores(
+        [(item.waste_type, item.quantity_kg) for item in payload.manual_items],
+        waste_lookup
+    )
+    manual_results = [
+        {"status": "success", "waste_type": waste_lookup.canonical_label(item.waste_type), "calculated_npk_score": score}
+        if score is not None else
+        {"status": "failed", "message": f"Waste type '{item.waste_type}' not found in NPK database."}
+        for item, score in zip(payload.manual_items, manual_scores)
+    ]
+
+    return FastJSONResponse({"detection_results": detection_results, "manual_results": manual_results})
+
+
+@router.get("/cache/stats", summary="Hit/miss counters for the image analysis cache.")
+def analysis_cache_stats() -> Dict[str, Any]:
+    analysis_cache = APP_STATE.get('ANALYSIS_CACHE')
+    return analysis_cache.stats() if analysis_cache else {}
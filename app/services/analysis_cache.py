@@ -0,0 +1,258 @@
+# app/services/analysis_cache.py
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+# =======================================================
+#               IMAGE FINGERPRINTS
+# =======================================================
+
+def perceptual_hash(image: Image.Image) -> int:
+    """
+    64-bit difference hash (dHash). Re-encoded or slightly resized copies of the
+    same photo land within a few bits of each other.
+    """
+    small = image.convert("L").resize((9, 8), Image.Resampling.BILINEAR)
+    pixels = small.tobytes() # 9 x 8 grayscale, row-major
+    bits = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+# =======================================================
+#               TWO-TIER DETECTION CACHE
+# =======================================================
+
+def _safe_namespace(namespace: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", namespace)
+
+
+class AnalysisCache:
+    """
+    Caches parsed vision detections so repeat uploads skip the model call.
+    Entries are keyed by the SHA-256 of the original upload (computed by
+    upload_service while streaming), within a namespace naming the detector
+    and model that produced them (Detector.cache_namespace): switching the
+    vision backend never serves the other model's results.
+
+    - Memory tier: LRU bounded by max_entries, entries expire after ttl_s.
+    - Disk tier (optional): one JSON file per content hash, survives restarts.
+      Files older than ttl_s, then the oldest beyond disk_max_entries, are pruned
+      at startup and after every few writes (in a background thread).
+    - Near-duplicates: when phash_max_distance > 0, a miss on the exact hash falls
+      back to the closest perceptual hash in the memory tier.
+
+    get_from_memory() never blocks; get_blocking() (disk tier, perceptual hash) and
+    put() do file I/O and image hashing, so async callers run them in a thread.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_s: float = 7 * 24 * 3600,
+        disk_dir: Optional[Path] = None,
+        phash_max_distance: int = 0,
+        disk_max_entries: int = 0,
+    ):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.disk_dir = Path(disk_dir) if disk_dir is not None else None
+        self.phash_max_distance = phash_max_distance
+        self.disk_max_entries = disk_max_entries
+        # Overshoot between prunes is at most ~1/8 of the bound
+        self._prune_every = max(16, disk_max_entries // 8) if disk_max_entries > 0 else 256
+        self._disk_writes = 0
+        self._pruning = False
+
+        self._lock = threading.Lock()
+        # "namespace/key" -> (created_at, phash, detections)
+        self._entries: "OrderedDict[str, Tuple[float, Optional[int], List[Dict[str, Any]]]]" = OrderedDict()
+        self.counters = {"hits": 0, "near_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._schedule_prune()
+
+    # --- INTERNAL HELPERS ---
+
+    def _is_fresh(self, created_at: float) -> bool:
+        return (time.time() - created_at) <= self.ttl_s
+
+    def _disk_path(self, key: str, namespace: str = "") -> Path:
+        base = self.disk_dir / _safe_namespace(namespace) if namespace else self.disk_dir
+        return base / key[:2] / f"{key}.json"
+
+    def _remember(self, key: str, created_at: float, phash: Optional[int], detections: List[Dict[str, Any]]) -> None:
+        """Inserts into the memory tier (caller holds the lock)."""
+        self._entries[key] = (created_at, phash, detections)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _read_disk(self, key: str, namespace: str) -> Optional[Tuple[float, Optional[int], List[Dict[str, Any]]]]:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key, namespace)
+        try:
+            payload = json.loads(path.read_text())
+            created_at, phash, detections = float(payload["created_at"]), payload.get("phash"), payload["detections"]
+        except OSError:
+            return None
+        except (KeyError, TypeError, ValueError, AttributeError): # Truncated or foreign file: drop it
+            path.unlink(missing_ok=True)
+            return None
+        if not self._is_fresh(created_at):
+            path.unlink(missing_ok=True)
+            return None
+        return created_at, phash, detections
+
+    def _write_disk(
+        self, key: str, namespace: str, created_at: float, phash: Optional[int], detections: List[Dict[str, Any]]
+    ) -> None:
+        path = self._disk_path(key, namespace)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"created_at": created_at, "phash": phash, "detections": detections}))
+        os.replace(tmp_path, path)
+
+    def prune_disk(self) -> int:
+        """Deletes disk files older than ttl_s, then the oldest beyond disk_max_entries. Returns files removed."""
+        if self.disk_dir is None:
+            return 0
+        cutoff = time.time() - self.ttl_s
+        removed, kept = 0, []
+        for path in self.disk_dir.rglob("*"): # Entries and leftover .tmp files (file mtime = write time)
+            try:
+                if not path.is_file():
+                    continue
+                modified = path.stat().st_mtime
+                if modified < cutoff:
+                    path.unlink()
+                    removed += 1
+                elif path.suffix == ".json":
+                    kept.append((modified, path))
+            except OSError:
+                continue
+        if 0 < self.disk_max_entries < len(kept):
+            kept.sort()
+            for _, path in kept[:len(kept) - self.disk_max_entries]:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    def _schedule_prune(self) -> None:
+        with self._lock:
+            if self._pruning:
+                return
+            self._pruning = True
+        threading.Thread(target=self._prune_in_background, name="analysis-cache-prune", daemon=True).start()
+
+    def _prune_in_background(self) -> None:
+        try:
+            removed = self.prune_disk()
+            if removed:
+                print(f"INFO: Pruned {removed} analysis cache files")
+        except OSError as e:
+            print(f"WARNING: Analysis cache prune failed: {e}")
+        finally:
+            with self._lock:
+                self._pruning = False
+
+    def _nearest_phash(self, phash: int, namespace: str) -> Optional[str]:
+        """Closest fresh memory-tier entry of namespace within phash_max_distance bits (caller holds the lock)."""
+        best_key, best_distance = None, self.phash_max_distance + 1
+        prefix = f"{namespace}/"
+        for key, (created_at, other, _) in self._entries.items():
+            if other is None or not key.startswith(prefix) or not self._is_fresh(created_at):
+                continue
+            distance = (phash ^ other).bit_count()
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+        return best_key
+
+    # --- PUBLIC API ---
+
+    def get(
+        self, key: str, image: Optional[Image.Image] = None, namespace: str = ""
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Returns cached detections for this content hash (or a near-duplicate image), else None."""
+        detections = self.get_from_memory(key, namespace)
+        return detections if detections is not None else self.get_blocking(key, image, namespace)
+
+    def get_from_memory(self, key: str, namespace: str = "") -> Optional[List[Dict[str, Any]]]:
+        """Exact-hash lookup in the memory tier only (no I/O; a miss is not counted)."""
+        memory_key = f"{namespace}/{key}"
+        with self._lock:
+            entry = self._entries.get(memory_key)
+            if entry is not None and self._is_fresh(entry[0]):
+                self._entries.move_to_end(memory_key)
+                self.counters["hits"] += 1
+                return entry[2]
+            if entry is not None:
+                del self._entries[memory_key] # Expired
+        return None
+
+    def get_blocking(
+        self, key: str, image: Optional[Image.Image] = None, namespace: str = ""
+    ) -> Optional[List[Dict[str, Any]]]:
+        """The rest of get() after a memory miss: disk tier, then near-duplicates."""
+        disk_entry = self._read_disk(key, namespace)
+        if disk_entry is not None:
+            with self._lock:
+                self._remember(f"{namespace}/{key}", *disk_entry)
+                self.counters["disk_hits"] += 1
+            return disk_entry[2]
+
+        if self.phash_max_distance > 0 and image is not None:
+            phash = perceptual_hash(image)
+            with self._lock:
+                near_key = self._nearest_phash(phash, namespace)
+                if near_key is not None:
+                    self._entries.move_to_end(near_key)
+                    self.counters["near_hits"] += 1
+                    return self._entries[near_key][2]
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(
+        self, key: str, detections: List[Dict[str, Any]], image: Optional[Image.Image] = None, namespace: str = ""
+    ) -> None:
+        """Stores parsed detections under the image's content hash (and perceptual hash)."""
+        created_at = time.time()
+        phash = perceptual_hash(image) if (self.phash_max_distance > 0 and image is not None) else None
+        with self._lock:
+            self._remember(f"{namespace}/{key}", created_at, phash, detections)
+        if self.disk_dir is not None:
+            try:
+                self._write_disk(key, namespace, created_at, phash, detections)
+            except OSError as e:
+                print(f"WARNING: Could not write analysis cache entry to disk: {e}")
+                return
+            with self._lock:
+                self._disk_writes += 1
+                due = self._disk_writes % self._prune_every == 0
+            if due:
+                self._schedule_prune()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = sum(self.counters[k] for k in ("hits", "near_hits", "disk_hits", "misses"))
+            hit_total = lookups - self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "hit_ratio": round(hit_total / lookups, 4) if lookups else 0.0,
+            }
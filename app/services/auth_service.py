@@ -1,59 +1,329 @@
-from fastapi import APIRouter
+import hashlib
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from app.config.constants import (
+    AUTH_SECRET_KEY,
+    AUTH_ACCESS_TOKEN_TTL_S,
+    AUTH_REQUIRED,
+    AUTH_TOKEN_CACHE_MAX_ENTRIES,
+    AUTH_RESET_TOKEN_TTL_S,
+    AUTH_RETURN_RESET_TOKEN,
+    AUTH_MIN_PASSWORD_CHARS,
+)
+from app.config.state import APP_STATE
+from app.services.marketplace_services import get_offer_store
+from app.services.offer_store import OfferStore
+from app.services.security import (
+    InvalidTokenError,
+    RevocationList,
+    TokenSigner,
+    TokenVerifier,
+    dummy_password_hash,
+    hash_password_async,
+    needs_rehash,
+    verify_password_async,
+)
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
-from fastapi import HTTPException, status
-from pydantic import BaseModel
+USERNAME_PATTERN = r'^[A-Za-z0-9_.-]{3,32}$'
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+MAX_PASSWORD_CHARS = 256
+
+_CREATE_USERS_SQL = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id       TEXT PRIMARY KEY,
+    username      TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    email         TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    password_hash TEXT NOT NULL,
+    created_at    REAL NOT NULL,
+    updated_at    REAL NOT NULL
+)
+"""
+_CREATE_RESETS_SQL = """
+CREATE TABLE IF NOT EXISTS password_resets (
+    token_hash TEXT PRIMARY KEY,
+    user_id    TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    used_at    REAL
+)
+"""
+
+_AUTH_INIT_LOCK = threading.Lock()
+
 
 class UserLogin(BaseModel):
-    username: str
-    password: str
+    username: str = Field(..., min_length=1, max_length=64)
+    password: str = Field(..., min_length=1, max_length=MAX_PASSWORD_CHARS)
 
 class UserRegister(BaseModel):
-    username: str
-    password: str
-    email: str
+    username: str = Field(..., pattern=USERNAME_PATTERN)
+    password: str = Field(..., min_length=AUTH_MIN_PASSWORD_CHARS, max_length=MAX_PASSWORD_CHARS)
+    email: str = Field(..., max_length=254)
 
 class UserForgotPassword(BaseModel):
-    email: str
+    email: str = Field(..., max_length=254)
 
 class UserResetPassword(BaseModel):
-    token: str
-    new_password: str
+    token: str = Field(..., min_length=1, max_length=128)
+    new_password: str = Field(..., min_length=AUTH_MIN_PASSWORD_CHARS, max_length=MAX_PASSWORD_CHARS)
+
+
+class UsernameTakenError(Exception):
+    pass
+
+
+class InvalidResetTokenError(Exception):
+    pass
+
+
+# =======================================================
+#               USERS + RESET TOKENS (offer database)
+# =======================================================
+
+class AuthService:
+    """
+    Accounts live in the offer database next to reservations. Every method here is
+    sync SQLite work (call it from the thread pool); password hashing itself happens
+    in the routes, on the hashing pool (app/services/security.py).
+    """
+
+    def __init__(self, store: OfferStore, secret: bytes, token_ttl_s: float, token_cache_max_entries: int, reset_ttl_s: float):
+        self.store = store
+        self.reset_ttl_s = reset_ttl_s
+        with store.write_transaction() as (conn, _):
+            conn.execute(_CREATE_USERS_SQL)
+            conn.execute(_CREATE_RESETS_SQL)
+        self.signer = TokenSigner(secret, token_ttl_s)
+        self.revocations = RevocationList(store, token_ttl_s)
+        self.verifier = TokenVerifier(self.signer, self.revocations, token_cache_max_entries)
+        dummy_password_hash() # Built now, or the first unknown-username login would be measurably slower
+
+    def find_user(self, username: str) -> Optional[Dict[str, Any]]:
+        with self.store.read_connection() as conn:
+            row = conn.execute(
+                "SELECT user_id, username, email, password_hash FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def create_user(self, username: str, email: str, password_hash: str) -> Dict[str, Any]:
+        now = time.time()
+        user = {'user_id': f"U-{uuid.uuid4().hex[:12].upper()}", 'username': username, 'email': email}
+        try:
+            with self.store.write_transaction() as (conn, _):
+                conn.execute(
+                    "INSERT INTO users (user_id, username, email, password_hash, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (user['user_id'], username, email, password_hash, now, now),
+                )
+        except sqlite3.IntegrityError:
+            raise UsernameTakenError(username) # Username or email already registered
+        return user
+
+    def update_password_hash(self, user_id: str, password_hash: str) -> None:
+        with self.store.write_transaction() as (conn, _):
+            conn.execute(
+                "UPDATE users SET password_hash = ?, updated_at = ? WHERE user_id = ?",
+                (password_hash, time.time(), user_id),
+            )
+
+    def create_reset_token(self, email: str) -> Optional[str]:
+        """One-time reset token for the account with this email (None if there is none). Only its hash is stored."""
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        with self.store.write_transaction() as (conn, _):
+            row = conn.execute("SELECT user_id FROM users WHERE email = ?", (email,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM password_resets WHERE expires_at < ?", (now,))
+            conn.execute(
+                "INSERT INTO password_resets (token_hash, user_id, expires_at) VALUES (?, ?, ?)",
+                (hashlib.sha256(token.encode()).hexdigest(), row['user_id'], now + self.reset_ttl_s),
+            )
+        return token
+
+    def reset_password(self, token: str, password_hash: str) -> str:
+        """Consumes a reset token, sets the new hash and revokes every token issued before. Returns the user_id."""
+        now = time.time()
+        with self.store.write_transaction() as (conn, _):
+            row = conn.execute(
+                "SELECT user_id FROM password_resets WHERE token_hash = ? AND used_at IS NULL AND expires_at > ?",
+                (hashlib.sha256(token.encode()).hexdigest(), now),
+            ).fetchone()
+            if row is None:
+                raise InvalidResetTokenError()
+            user_id = row['user_id']
+            conn.execute("UPDATE password_resets SET used_at = ? WHERE user_id = ? AND used_at IS NULL", (now, user_id))
+            conn.execute("UPDATE users SET password_hash = ?, updated_at = ? WHERE user_id = ?", (password_hash, now, user_id))
+            revoked_at, expires_at = self.revocations.insert(conn, user_id)
+        self.revocations.remember_local(user_id, None, revoked_at, expires_at)
+        return user_id
+
+
+def _load_secret(data_path: Path) -> bytes:
+    """AUTH_SECRET_KEY, or a key generated once into DATA_PATH/auth_secret.key (shared by every local worker)."""
+    if AUTH_SECRET_KEY:
+        return AUTH_SECRET_KEY.encode()
+    path = data_path / 'auth_secret.key'
+    if not path.exists():
+        tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(tmp, path) # Atomic and never overwrites: the first worker's key wins
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp)
+        print(f"WARNING: AUTH_SECRET_KEY not set; generated a signing key in {path} (set it explicitly across hosts)")
+    return path.read_text().strip().encode()
+
+
+def get_auth_service() -> AuthService:
+    """Returns the shared AuthService, creating its tables, signer and verification cache on first use."""
+    service = APP_STATE.get('AUTH_SERVICE')
+    if service is None:
+        store = get_offer_store()
+        with _AUTH_INIT_LOCK:
+            service = APP_STATE.get('AUTH_SERVICE')
+            if service is None:
+                service = AuthService(
+                    store,
+                    _load_secret(APP_STATE['DATA_PATH']),
+                    token_ttl_s=AUTH_ACCESS_TOKEN_TTL_S,
+                    token_cache_max_entries=AUTH_TOKEN_CACHE_MAX_ENTRIES,
+                    reset_ttl_s=AUTH_RESET_TOKEN_TTL_S,
+                )
+                APP_STATE['AUTH_SERVICE'] = service
+    return service
+
+
+# =======================================================
+#               DEPENDENCIES (stateless token checks)
+# =======================================================
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+def authenticate_token(token: str) -> Dict[str, Any]:
+    """Claims of a valid access token; raises InvalidTokenError. No I/O, safe on the event loop."""
+    return get_auth_service().verifier.verify(token)
+
+
+# Async on purpose: a cached check takes microseconds, less than a thread-pool hop would
+async def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> Dict[str, Any]:
+    if credentials is None:
+        raise _unauthorized("Not authenticated.")
+    try:
+        return authenticate_token(credentials.credentials)
+    except InvalidTokenError as e:
+        raise _unauthorized(str(e))
+
+
+async def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> Optional[Dict[str, Any]]:
+    """Like get_current_user, but anonymous callers get None unless AUTH_REQUIRED is set."""
+    if credentials is None:
+        if AUTH_REQUIRED:
+            raise _unauthorized("Not authenticated.")
+        return None
+    try:
+        return authenticate_token(credentials.credentials)
+    except InvalidTokenError as e:
+        raise _unauthorized(str(e))
+
+
+# =======================================================
+#               ROUTES
+# =======================================================
+
+@router.get("/")
+def hello_auth():
+    """Simple endpoint to test auth service."""
+    return {"message": "Hello from Auth Service!"}
 
 # POST /auth/login
 @router.post("/login")
-def login(user: UserLogin):
-    # Here you would check user credentials against the database
-    # user_record = db.get_user(user.username)
-    # if not user_record or not verify_password(user.password, user_record.password):
-    #     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-    return {"message": "Login successful (DB logic commented out)", "username": user.username}
+async def login(user: UserLogin):
+    service = get_auth_service()
+    record = await run_in_threadpool(service.find_user, user.username)
+    # Unknown users are verified against a dummy hash: same latency, no username probing
+    stored = record['password_hash'] if record is not None else dummy_password_hash()
+    if not await verify_password_async(user.password, stored) or record is None:
+        raise _unauthorized("Invalid credentials")
+    if needs_rehash(stored):
+        await run_in_threadpool(service.update_password_hash, record['user_id'], await hash_password_async(user.password))
+
+    token, claims = service.signer.issue(record['user_id'], record['username'])
+    return {
+        "access_token": token,
+        "token_type": "bearer",
+        "expires_in": int(service.signer.ttl_s),
+        "user_id": record['user_id'],
+        "username": record['username'],
+    }
 
 # POST /auth/register
-@router.post("/register")
-def register(user: UserRegister):
-    # Here you would create a new user in the database
-    # db.create_user(user.username, user.password, user.email)
-    return {"message": "Registration successful (DB logic commented out)", "username": user.username}
+@router.post("/register", status_code=status.HTTP_201_CREATED)
+async def register(user: UserRegister):
+    email = user.email.strip()
+    if not EMAIL_PATTERN.match(email):
+        raise HTTPException(status_code=422, detail="Invalid email address.")
+    service = get_auth_service()
+    password_hash = await hash_password_async(user.password)
+    try:
+        created = await run_in_threadpool(service.create_user, user.username, email, password_hash)
+    except UsernameTakenError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Username or email already registered.")
+    return {"message": "Registration successful", **created}
 
 # POST /auth/forgot-password
-@router.post("/forgot-password")
+@router.post("/forgot-password", status_code=status.HTTP_202_ACCEPTED)
 def forgot_password(data: UserForgotPassword):
-    # Here you would send a password reset email
-    # db.send_reset_email(data.email)
-    return {"message": "Password reset email sent (DB logic commented out)", "email": data.email}
+    # Same answer whether or not the email is registered
+    token = get_auth_service().create_reset_token(data.email.strip())
+    response = {"message": "If the email is registered, a password reset link has been sent."}
+    if token is not None:
+        # No mailer is wired up yet: deliver `token` by email here
+        print("INFO: Password reset token issued")
+        if AUTH_RETURN_RESET_TOKEN:
+            response["reset_token"] = token
+    return response
 
 # POST /auth/reset-password
 @router.post("/reset-password")
-def reset_password(data: UserResetPassword):
-    # Here you would verify the token and reset the password in the database
-    # db.reset_password(data.token, data.new_password)
-    return {"message": "Password reset successful (DB logic commented out)"}
+async def reset_password(data: UserResetPassword):
+    password_hash = await hash_password_async(data.new_password)
+    try:
+        await run_in_threadpool(get_auth_service().reset_password, data.token, password_hash)
+    except InvalidResetTokenError:
+        raise HTTPException(status_code=400, detail="Invalid or expired reset token.")
+    return {"message": "Password reset successful. Sessions issued before the reset are signed out."}
 
-router = APIRouter(prefix="/auth", tags=["Auth"])
+# POST /auth/logout
+@router.post("/logout")
+def logout(user: Dict[str, Any] = Depends(get_current_user)):
+    get_auth_service().revocations.revoke_token(user)
+    return {"message": "Logged out"}
 
-@router.get("/")
-def hello_auth():
-    """Simple endpoint to test auth service."""
-    return {"message": "Hello from Auth Service!"}
+# GET /auth/me
+@router.get("/me")
+async def me(user: Dict[str, Any] = Depends(get_current_user)):
+    return {"user_id": user['sub'], "username": user.get('name'), "expires_at": user['exp']}
@@ -0,0 +1,330 @@
+# app/services/bulk_offers.py
+import csv
+import io
+import json
+import math
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Container, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.services.offer_store import OFFER_COLUMNS
+from app.services.regional_store import RegionalOfferStore
+from app.services.serialization import dumps
+from app.services.waste_calculator import WasteNpkLookup, calculate_batch_manual_npk_scores
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+REQUIRED_IMPORT_FIELDS = ('producer_id', 'waste_type', 'quantity_kg', 'cost_per_kg')
+MAX_OFFER_ID_LENGTH = 64
+
+_TRUE_STRINGS = {'1', 'true', 'yes', 'y', 't'}
+_FALSE_STRINGS = {'0', 'false', 'no', 'n', 'f'}
+
+
+class BulkImportError(Exception):
+    """Malformed import stream (not a single bad row). Carries the HTTP status to answer with."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _RowError(ValueError):
+    pass
+
+
+def detect_import_format(content_type: Optional[str]) -> Optional[str]:
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines'):
+        return 'ndjson'
+    return None
+
+
+# =======================================================
+#               1. STREAM -> LINES -> RECORDS
+# =======================================================
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[str]:
+    """Splits a byte stream into decoded lines (newline kept) without buffering more than one line."""
+    buffer, first = b'', True
+    async for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split(b'\n')
+        buffer = lines.pop() # Incomplete tail waits for the next chunk
+        if len(buffer) > max_line_bytes:
+            raise BulkImportError(f"Line longer than {max_line_bytes} bytes.", status_code=413)
+        for line in lines:
+            text = line.decode('utf-8', errors='replace') + '\n'
+            if first:
+                text, first = text.lstrip('\ufeff'), False # Spreadsheet exports often start with a BOM
+            yield text
+    if buffer:
+        text = buffer.decode('utf-8', errors='replace')
+        yield text.lstrip('\ufeff') if first else text
+
+
+async def iter_csv_records(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Yields (line_number, {column: value}) per CSV record. Physical lines are joined
+    while a quoted field is still open, so cells containing newlines survive.
+    """
+    header: Optional[List[str]] = None
+    pending, first_line, line_number = '', 0, 0
+    async for line in lines:
+        line_number += 1
+        if not pending:
+            first_line = line_number
+        pending += line
+        if pending.count('"') % 2:
+            continue # Inside a quoted multi-line cell
+        text, pending = pending, ''
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            missing = [field for field in REQUIRED_IMPORT_FIELDS if field not in header]
+            if missing:
+                raise BulkImportError(f"CSV header is missing required columns: {', '.join(missing)}.")
+            continue
+        if len(values) != len(header):
+            yield first_line, _RowError(f"Expected {len(header)} columns, got {len(values)}.")
+            continue
+        yield first_line, dict(zip(header, values))
+    if pending.strip():
+        yield first_line, _RowError("Unterminated quoted field.")
+    if header is None:
+        raise BulkImportError("Empty CSV import (no header row).")
+
+
+async def iter_ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Any]]:
+    """Yields (line_number, object) per non-blank NDJSON line; unparsable lines become row errors."""
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError as e:
+            yield line_number, _RowError(f"Invalid JSON: {e}")
+            continue
+        yield line_number, value if isinstance(value, dict) else _RowError("Each line must be a JSON object.")
+
+
+# =======================================================
+#               2. CHUNK VALIDATION + SCORING + COMMIT
+# =======================================================
+
+def _parse_float(raw: Any, field: str) -> float:
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        raise _RowError(f"{field} must be a number, got {raw!r}.")
+    if not math.isfinite(value):
+        raise _RowError(f"{field} must be finite.")
+    return value
+
+
+def _parse_bool(raw: Any) -> bool:
+    if raw is None or raw == '':
+        return True # New listings are available unless stated otherwise
+    if isinstance(raw, bool):
+        return raw
+    text = str(raw).strip().lower()
+    if text in _TRUE_STRINGS:
+        return True
+    if text in _FALSE_STRINGS:
+        return False
+    raise _RowError(f"is_available must be a boolean, got {raw!r}.")
+
+
+class OfferImporter:
+    """
+    Validates and commits an import stream chunk by chunk: at most chunk_rows rows
+    are held in memory, each valid chunk is scored in one vectorized NPK pass and
+    written in one transaction per region (RegionalOfferStore.upsert_many). Bad rows are skipped and
+    reported by line number; good rows in the same chunk are still imported.
+
+    A row naming an existing offer_id updates it, but may not move it to another
+    producer, nor rewrite an offer with stock on hold (held_offer_ids, e.g.
+    ReservationService.held_offer_ids): its reservations would no longer add up.
+    """
+
+    def __init__(
+        self,
+        store: RegionalOfferStore,
+        lookup: WasteNpkLookup,
+        producer_ids: Container[str],
+        chunk_rows: int = 1000,
+        max_errors: int = 100,
+        dry_run: bool = False,
+        held_offer_ids: Optional[Callable[[Iterable[str]], Set[str]]] = None,
+    ):
+        self.store = store
+        self.held_offer_ids = held_offer_ids
+        self.lookup = lookup
+        self.producer_ids = producer_ids
+        self.chunk_rows = chunk_rows
+        self.max_errors = max_errors
+        self.dry_run = dry_run
+        self.rows = 0
+        self.imported = 0
+        self.rejected = 0
+        self.chunks = 0
+        self.errors: List[Dict[str, Any]] = []
+        self._owners: Dict[str, str] = {} # Dry run: offer_id -> producer_id of rows accepted so far (never written)
+
+    def _reject(self, line: int, message: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": message})
+
+    def _validate(self, raw: Dict[str, Any], listing_date: str) -> Dict[str, Any]:
+        missing = [field for field in REQUIRED_IMPORT_FIELDS if raw.get(field) in (None, '')]
+        if missing:
+            raise _RowError(f"Missing required fields: {', '.join(missing)}.")
+
+        producer_id = str(raw['producer_id']).strip()
+        if producer_id not in self.producer_ids:
+            raise _RowError(f"Unknown producer_id '{producer_id}'.")
+        waste_type = self.lookup.canonical_label(str(raw['waste_type']))
+        if waste_type is None:
+            raise _RowError(f"Waste type '{raw['waste_type']}' not found in NPK database.")
+        quantity_kg = _parse_float(raw['quantity_kg'], 'quantity_kg')
+        cost_per_kg = _parse_float(raw['cost_per_kg'], 'cost_per_kg')
+        if quantity_kg <= 0:
+            raise _RowError("quantity_kg must be positive.")
+        if cost_per_kg < 0:
+            raise _RowError("cost_per_kg must not be negative.")
+
+        offer_id = str(raw.get('offer_id') or '').strip() or f"O-{uuid.uuid4().hex[:12].upper()}"
+        if len(offer_id) > MAX_OFFER_ID_LENGTH:
+            raise _RowError(f"offer_id longer than {MAX_OFFER_ID_LENGTH} characters.")
+        return {
+            'offer_id': offer_id,
+            'producer_id': producer_id,
+            'waste_type': waste_type,
+            'quantity_kg': quantity_kg,
+            'cost_per_kg': cost_per_kg,
+            'is_available': _parse_bool(raw.get('is_available')),
+            'listing_date': str(raw.get('listing_date') or listing_date),
+        }
+
+    def _check_existing(self, validated: List[Tuple[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Rejects rows that would change an offer's producer or rewrite an offer with live holds."""
+        owners = {}
+        for _, record in validated:
+            offer_id = record['offer_id']
+            current = self.store.get(offer_id)
+            if current is not None:
+                owners[offer_id] = current['producer_id']
+            elif offer_id in self._owners:
+                owners[offer_id] = self._owners[offer_id]
+        held = self.held_offer_ids(owners) if owners and self.held_offer_ids is not None else set()
+
+        records = []
+        for line, record in validated:
+            offer_id = record['offer_id']
+            owner = owners.setdefault(offer_id, record['producer_id']) # Repeated new ids: the first row owns it
+            if owner != record['producer_id']:
+                self._reject(line, f"Offer '{offer_id}' belongs to producer '{owner}'.")
+            elif offer_id in held:
+                self._reject(line, f"Offer '{offer_id}' has reservations on hold.")
+            else:
+                records.append(record)
+        if self.dry_run:
+            self._owners.update(owners)
+        return records
+
+    def process_chunk(self, chunk: List[Tuple[int, Any]]) -> None:
+        """Validate -> score -> commit one chunk (sync: run it off the event loop)."""
+        self.chunks += 1
+        self.rows += len(chunk)
+        listing_date = datetime.now().isoformat()
+        validated = []
+        for line, raw in chunk:
+            if isinstance(raw, _RowError):
+                self._reject(line, str(raw))
+                continue
+            try:
+                validated.append((line, self._validate(raw, listing_date)))
+            except _RowError as e:
+                self._reject(line, str(e))
+        records = self._check_existing(validated)
+        if not records:
+            return
+
+        # Same formula as single uploads (calculate_manual_npk_score), one vectorized pass per chunk
+        scores = calculate_batch_manual_npk_scores(
+            [(record['waste_type'], record['quantity_kg']) for record in records], self.lookup
+        )
+        for record, score in zip(records, scores):
+            record['N_score'], record['P_score'], record['K_score'] = score['N'], score['P'], score['K']
+
+        if not self.dry_run:
+            self.store.upsert_many(records)
+        self.imported += len(records)
+
+    async def consume(self, records: AsyncIterator[Tuple[int, Any]]) -> None:
+        chunk: List[Tuple[int, Any]] = []
+        async for item in records:
+            chunk.append(item)
+            if len(chunk) >= self.chunk_rows:
+                await run_in_threadpool(self.process_chunk, chunk)
+                chunk = []
+        if chunk:
+            await run_in_threadpool(self.process_chunk, chunk)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "chunks": self.chunks,
+            "dry_run": self.dry_run,
+            "errors": self.errors,
+            "errors_truncated": self.rejected > len(self.errors),
+        }
+
+
+# =======================================================
+#               3. CURSOR-PAGINATED EXPORT
+# =======================================================
+
+def iter_offer_export(
+    store: RegionalOfferStore,
+    fmt: str,
+    cursor: Optional[str],
+    end_cursor: Optional[str],
+    page_rows: int,
+    waste_type: Optional[str] = None,
+    available_only: bool = False,
+) -> Iterator[str]:
+    """
+    Streams committed offers after `cursor` (up to and including end_cursor, or to the
+    end of the table) one keyset page at a time. A reader connection is borrowed per
+    page only, so a slow client never pins a snapshot or blocks WAL checkpoints.
+    """
+    if fmt == 'csv':
+        yield ','.join(OFFER_COLUMNS) + '\n'
+    after = cursor
+    while True:
+        page = store.page_committed(after, page_rows, waste_type, available_only)
+        if end_cursor is not None:
+            page = [record for record in page if record['offer_id'] <= end_cursor]
+        if not page:
+            return
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator='\n')
+            writer.writerows([record[column] for column in OFFER_COLUMNS] for record in page)
+            yield buffer.getvalue()
+        else:
+            yield b''.join(dumps(record) + b'\n' for record in page).decode()
+        after = page[-1]['offer_id']
+        if len(page) < page_rows or after == end_cursor:
+            return
@@ -0,0 +1,249 @@
+# app/services/chat_service.py
+import asyncio
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from app.services.metrics import METRICS
+
+_CREATE_MESSAGES_SQL = """
+CREATE TABLE IF NOT EXISTS chat_messages (
+    message_id TEXT PRIMARY KEY,
+    offer_id   TEXT NOT NULL,
+    sender_id  TEXT NOT NULL,
+    body       TEXT NOT NULL,
+    sent_at    REAL NOT NULL
+)
+"""
+_MESSAGE_COLUMNS = ['message_id', 'offer_id', 'sender_id', 'body', 'sent_at']
+
+CHAT_CONNECTIONS = METRICS.gauge("marketplace_chat_connections", "Open chat WebSocket connections in this worker.")
+CHAT_MESSAGES = METRICS.counter("marketplace_chat_messages_total", "Chat messages accepted.")
+CHAT_SLOW_CONSUMERS = METRICS.counter(
+    "marketplace_chat_slow_consumers_total", "Connections closed because their send queue overflowed."
+)
+
+
+# =======================================================
+#               1. PUB/SUB (swappable fan-out)
+# =======================================================
+
+class Subscriber:
+    """
+    One connection's inbox: a bounded queue, so a slow or stalled client can hold at
+    most max_pending messages in memory. On overflow the backlog is dropped and a
+    None sentinel is queued; the connection's sender sees it and closes the socket
+    (the client reconnects and resyncs from history).
+    """
+
+    __slots__ = ('queue', 'overflowed')
+
+    def __init__(self, max_pending: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending + 1) # +1 slot for the sentinel
+        self.overflowed = False
+
+    def deliver(self, frame: str) -> None:
+        if self.overflowed:
+            return
+        if self.queue.qsize() >= self.queue.maxsize - 1:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait() # Free the backlog now, not when the socket finally closes
+            self.queue.put_nowait(None)
+            CHAT_SLOW_CONSUMERS.inc()
+            return
+        self.queue.put_nowait(frame)
+
+
+class ChatBroker(ABC):
+    """
+    Fan-out interface used by ChatHub. Frames are JSON text, encoded once per message
+    (not once per recipient). The in-process implementation below reaches
+    subscribers in this worker only; with several workers, implement the same three
+    methods over a shared broker (Redis pub/sub, NATS, ...) and pass it to ChatHub.
+    """
+
+    @abstractmethod
+    async def publish(self, room: str, frame: str) -> None:
+        ...
+
+    @abstractmethod
+    def subscribe(self, room: str, subscriber: Subscriber) -> None:
+        ...
+
+    @abstractmethod
+    def unsubscribe(self, room: str, subscriber: Subscriber) -> None:
+        ...
+
+
+class InProcessBroker(ChatBroker):
+    """Room -> subscribers map on the event loop thread. Publish is O(room size), never awaits a client."""
+
+    def __init__(self):
+        self._rooms: Dict[str, Set[Subscriber]] = {}
+
+    async def publish(self, room: str, frame: str) -> None:
+        for subscriber in tuple(self._rooms.get(room, ())):
+            subscriber.deliver(frame)
+
+    def subscribe(self, room: str, subscriber: Subscriber) -> None:
+        self._rooms.setdefault(room, set()).add(subscriber)
+
+    def unsubscribe(self, room: str, subscriber: Subscriber) -> None:
+        members = self._rooms.get(room)
+        if members is not None:
+            members.discard(subscriber)
+            if not members:
+                del self._rooms[room] # Idle rooms cost nothing
+
+    def room_count(self) -> int:
+        return len(self._rooms)
+
+
+# =======================================================
+#               2. PERSISTENCE (batched appends)
+# =======================================================
+
+class ChatStore:
+    """
+    Message log in its own SQLite WAL file (chat traffic never contends with offer
+    writes). append() only enqueues; a writer thread group-commits whatever arrived
+    within flush_interval_s (up to batch_size rows) in one transaction.
+    """
+
+    def __init__(self, db_path: Path, batch_size: int = 256, flush_interval_s: float = 0.05):
+        self.db_path = Path(db_path)
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self._conn = self._connect()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_CREATE_MESSAGES_SQL)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chat_messages_room ON chat_messages(offer_id, sent_at)")
+        self._reader = self._connect()
+        self._reader_lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, name="chat-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def append(self, message: Dict[str, Any]) -> None:
+        if self._closed:
+            raise RuntimeError("ChatStore is closed.")
+        self._queue.put(tuple(message[column] for column in _MESSAGE_COLUMNS))
+
+    def _commit(self, rows: List[tuple]) -> None:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO chat_messages ({', '.join(_MESSAGE_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in _MESSAGE_COLUMNS)})",
+                rows,
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _writer_loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                self._queue.task_done()
+                return
+            batch = [first]
+            try:
+                while len(batch) < self.batch_size:
+                    item = self._queue.get(timeout=self.flush_interval_s)
+                    if item is None:
+                        self._queue.put(None) # Re-queue the shutdown marker after this batch
+                        self._queue.task_done()
+                        break
+                    batch.append(item)
+            except queue.Empty:
+                pass
+            try:
+                self._commit(batch)
+            except sqlite3.Error as e:
+                print(f"ERROR: Chat batch commit failed ({len(batch)} messages): {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self) -> None:
+        """Blocks until every appended message has been committed."""
+        self._queue.join()
+
+    def history(self, offer_id: str, before: Optional[float] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Up to `limit` committed messages of a room sent before `before`, oldest first."""
+        where, params = "offer_id = ?", [offer_id]
+        if before is not None:
+            where, params = where + " AND sent_at < ?", params + [before]
+        with self._reader_lock:
+            rows = self._reader.execute(
+                f"SELECT {', '.join(_MESSAGE_COLUMNS)} FROM chat_messages "
+                f"WHERE {where} ORDER BY sent_at DESC LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        self._reader.close()
+        self._conn.close()
+
+
+# =======================================================
+#               3. HUB (rooms = offer ids)
+# =======================================================
+
+class ChatHub:
+    """Ties connections, the broker and the message log together for one worker."""
+
+    def __init__(self, store: ChatStore, broker: Optional[ChatBroker] = None, max_pending_per_connection: int = 256):
+        self.store = store
+        self.broker = broker or InProcessBroker()
+        self.max_pending_per_connection = max_pending_per_connection
+
+    def join(self, offer_id: str) -> Subscriber:
+        subscriber = Subscriber(self.max_pending_per_connection)
+        self.broker.subscribe(offer_id, subscriber)
+        CHAT_CONNECTIONS.inc()
+        return subscriber
+
+    def leave(self, offer_id: str, subscriber: Subscriber) -> None:
+        self.broker.unsubscribe(offer_id, subscriber)
+        CHAT_CONNECTIONS.dec()
+
+    async def post(self, offer_id: str, sender_id: str, body: str) -> Dict[str, Any]:
+        """Persists (queued for the next batch) and fans the message out to the room."""
+        message = {
+            'message_id': uuid.uuid4().hex,
+            'offer_id': offer_id,
+            'sender_id': sender_id,
+            'body': body,
+            'sent_at': time.time(),
+        }
+        self.store.append(message)
+        CHAT_MESSAGES.inc()
+        await self.broker.publish(offer_id, json.dumps({'type': 'message', **message}))
+        return message
+
+    def close(self) -> None:
+        self.store.close()
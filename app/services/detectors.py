@@ -0,0 +1,349 @@
+# app/services/detectors.py
+import ast
+import asyncio
+import hashlib
+import json
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.services.metrics import METRICS
+
+# --- NOTE: Every backend returns the same detection dicts:
+#   {'label': str, 'relative_quantity_score': 1-10, ['box_w', 'box_h': 0-1 of the frame], ['confidence']}
+# Box detectors derive the score from the box area (10 = fills the frame), so the
+# NPK weighting (waste_calculator.detection_area) means the same thing for either.
+
+LOCAL_BATCH_SIZE = METRICS.histogram(
+    "marketplace_vision_local_batch_size", "Images per local detector inference call.", buckets=(1, 2, 4, 8, 16, 32)
+)
+CASCADE_ROUTES = METRICS.counter(
+    "marketplace_vision_cascade_total", "Cascade analyses by the backend that produced the answer.", ["backend"]
+)
+
+_LETTERBOX_FILL = (114, 114, 114)
+_MAX_DETECTIONS = 100
+
+
+def _quantity_score(area: float) -> float:
+    return round(min(max(area * 10.0, 1.0), 10.0), 2)
+
+
+def normalize_detections(raw: Any) -> List[Dict[str, Any]]:
+    """
+    Validates model output into the shared detection shape: entries without a label,
+    or with a non-numeric score, are dropped; scores are clamped to 1-10.
+    """
+    detections = []
+    for item in raw if isinstance(raw, list) else []:
+        if not isinstance(item, dict) or not str(item.get('label') or '').strip():
+            continue
+        detection = {'label': str(item['label']).strip()}
+        try:
+            for key in ('box_w', 'box_h', 'confidence'):
+                if item.get(key) is not None:
+                    detection[key] = float(item[key])
+            if 'box_w' in detection and 'box_h' in detection:
+                score = _quantity_score(detection['box_w'] * detection['box_h'])
+            else:
+                score = min(max(float(item.get('relative_quantity_score')), 1.0), 10.0)
+        except (TypeError, ValueError):
+            continue
+        detection['relative_quantity_score'] = score
+        detections.append(detection)
+    return detections
+
+
+# =======================================================
+#               1. DETECTOR INTERFACE
+# =======================================================
+
+class Detector(ABC):
+    """
+    A vision backend. detect() gets a PreparedImage (decoded `image` + re-encoded JPEG
+    `encoded`) and returns normalized detections. Concurrency caps, timeouts and
+    disconnect handling live in vision_service.analyze_waste_image, not here.
+    """
+
+    name = "detector"
+
+    @property
+    def cache_namespace(self) -> str:
+        """Names the backend and model behind detect() results (AnalysisCache scope)."""
+        return self.name
+
+    @abstractmethod
+    async def detect(self, prepared: Any) -> List[Dict[str, Any]]:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+# =======================================================
+#               2. LOCAL BACKEND (ONNX Runtime, YOLO-style)
+# =======================================================
+
+class _MicroBatcher:
+    """
+    One inference thread fed by a queue: the first waiting image opens a batch, which
+    closes after max_batch images or max_wait_s, whichever comes first. Concurrent
+    uploads (requests and job workers alike) therefore share one model call.
+    Items whose caller already gave up (timeout, disconnect) are skipped.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], List[Any]], max_batch: int, max_wait_s: float):
+        self._run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait_s = max_wait_s
+        self._queue: "queue.Queue[Optional[Tuple[Any, Future]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="vision-local", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self, first: Tuple[Any, Future]) -> Tuple[List[Tuple[Any, Future]], bool]:
+        batch, stopping = [first], False
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                stopping = True
+                break
+            batch.append(entry)
+        return batch, stopping
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stopping = self._collect(first)
+            live = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if live:
+                LOCAL_BATCH_SIZE.observe(len(live))
+                try:
+                    results = self._run_batch([item for item, _ in live])
+                    for (_, future), result in zip(live, results):
+                        future.set_result(result)
+                except Exception as e:
+                    for _, future in live:
+                        future.set_exception(e)
+            if stopping:
+                return
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+def _load_labels(labels_path: Optional[Path], metadata: Dict[str, str]) -> List[str]:
+    """Class names: one per line in labels_path, else the 'names' metadata of an Ultralytics export."""
+    if labels_path:
+        return [line.strip() for line in Path(labels_path).read_text().splitlines() if line.strip()]
+    names = metadata.get('names')
+    if not names:
+        raise ValueError("Local vision model has no 'names' metadata; set VISION_LOCAL_LABELS_PATH.")
+    parsed = ast.literal_eval(names) # "{0: 'banana skin', 1: ...}"
+    return [str(parsed[i]) for i in sorted(parsed)] if isinstance(parsed, dict) else [str(name) for name in parsed]
+
+
+def _nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> List[int]:
+    """Greedy non-maximum suppression over (x1, y1, x2, y2) boxes. Returns kept indices, best first."""
+    x1, y1, x2, y2 = boxes.T
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    order = np.argsort(-scores)
+    keep = []
+    while order.size and len(keep) < _MAX_DETECTIONS:
+        best, rest = order[0], order[1:]
+        keep.append(int(best))
+        inter_w = np.maximum(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0)
+        inter_h = np.maximum(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0)
+        inter = inter_w * inter_h
+        iou = inter / np.maximum(areas[best] + areas[rest] - inter, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return keep
+
+
+class OnnxYoloDetector(Detector):
+    """
+    Local CPU backend: a YOLO-style ONNX export (YOLOv8/11 'B x (4+classes) x N' or
+    YOLOv5 'B x N x (5+classes)' output), loaded once per worker. Images are
+    letterboxed to the model's input size and run through _MicroBatcher, so
+    concurrent uploads are stacked into one batched call (models exported with a
+    fixed batch of 1 still share the session, one image at a time).
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        model_path: Path,
+        labels_path: Optional[Path] = None,
+        confidence: float = 0.35,
+        iou_threshold: float = 0.5,
+        max_batch: int = 8,
+        batch_wait_s: float = 0.005,
+        threads: int = 0,
+    ):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("The local vision backend needs onnxruntime (pip install onnxruntime).")
+        options = onnxruntime.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self._session = onnxruntime.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        model_input = self._session.get_inputs()[0]
+        self._input_name = model_input.name
+        batch_dim, _, height, width = model_input.shape
+        self.input_size = (width, height) if isinstance(width, int) and isinstance(height, int) else (640, 640)
+        self._fixed_batch = isinstance(batch_dim, int)
+        self.labels = _load_labels(labels_path, self._session.get_modelmeta().custom_metadata_map)
+        self.confidence = confidence
+        self.iou_threshold = iou_threshold
+        self._batcher = _MicroBatcher(self._infer, max_batch, batch_wait_s)
+        model_file = Path(model_path).stat()
+        self._fingerprint = hashlib.sha256(json.dumps([
+            Path(model_path).name, model_file.st_size, model_file.st_mtime_ns, self.labels, confidence, iou_threshold,
+        ]).encode()).hexdigest()[:16] # A replaced model file or new thresholds start a fresh cache
+        print(f"INFO: Local vision model {Path(model_path).name} loaded ({len(self.labels)} classes, input {self.input_size})")
+
+    @property
+    def cache_namespace(self) -> str:
+        return f"{self.name}-{self._fingerprint}"
+
+    async def detect(self, prepared: Any) -> List[Dict[str, Any]]:
+        return await asyncio.wrap_future(self._batcher.submit(prepared.image))
+
+    def close(self) -> None:
+        self._batcher.close()
+
+    # --- PRE/POST PROCESSING ---
+
+    def _letterbox(self, image: Image.Image) -> Tuple[np.ndarray, float, Tuple[float, float]]:
+        """Aspect-preserving resize + padding. Returns (CHW float32 tensor, scale, (pad_x, pad_y))."""
+        target_w, target_h = self.input_size
+        scale = min(target_w / image.width, target_h / image.height)
+        resized_w, resized_h = max(1, round(image.width * scale)), max(1, round(image.height * scale))
+        canvas = Image.new("RGB", (target_w, target_h), _LETTERBOX_FILL)
+        pad = ((target_w - resized_w) // 2, (target_h - resized_h) // 2)
+        canvas.paste(image.convert("RGB").resize((resized_w, resized_h), Image.Resampling.BILINEAR), pad)
+        tensor = np.asarray(canvas, dtype=np.float32).transpose(2, 0, 1) / 255.0
+        return tensor, scale, pad
+
+    def _decode(self, output: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """One image's raw output -> (boxes cx/cy/w/h in input pixels, class scores)."""
+        num_classes = len(self.labels)
+        if output.shape[0] == 4 + num_classes: # YOLOv8/11: (4 + classes) x N
+            output = output.T
+        if output.shape[1] == 4 + num_classes:
+            return output[:, :4], output[:, 4:]
+        if output.shape[1] == 5 + num_classes: # YOLOv5: N x (5 + classes), objectness in column 4
+            return output[:, :4], output[:, 5:] * output[:, 4:5]
+        raise ValueError(f"Unexpected detector output shape {output.shape} for {num_classes} classes.")
+
+    def _postprocess(self, output: np.ndarray, scale: float, original_size: Tuple[int, int]) -> List[Dict[str, Any]]:
+        boxes, class_scores = self._decode(output)
+        classes = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(classes)), classes]
+        keep = scores >= self.confidence
+        boxes, classes, scores = boxes[keep], classes[keep], scores[keep]
+        if not len(scores):
+            return []
+
+        # Class-aware NMS: boxes of different classes are shifted apart so they never overlap
+        corners = np.concatenate([boxes[:, :2] - boxes[:, 2:] / 2, boxes[:, :2] + boxes[:, 2:] / 2], axis=1)
+        offsets = classes[:, None].astype(np.float32) * (max(self.input_size) + 1)
+        kept = _nms(corners + offsets, scores, self.iou_threshold)
+
+        width, height = original_size
+        detections = []
+        for i in kept:
+            box_w = float(min(boxes[i, 2] / scale / width, 1.0))
+            box_h = float(min(boxes[i, 3] / scale / height, 1.0))
+            detections.append({
+                'label': self.labels[classes[i]],
+                'box_w': round(box_w, 4),
+                'box_h': round(box_h, 4),
+                'confidence': round(float(scores[i]), 4),
+                'relative_quantity_score': _quantity_score(box_w * box_h),
+            })
+        return detections
+
+    def _infer(self, images: Sequence[Image.Image]) -> List[List[Dict[str, Any]]]:
+        """Runs on the batcher thread: letterbox -> one session.run per batch -> per-image detections."""
+        prepared = [self._letterbox(image) for image in images]
+        tensors = [tensor for tensor, _, _ in prepared]
+        if self._fixed_batch:
+            outputs = [self._session.run(None, {self._input_name: tensor[None]})[0][0] for tensor in tensors]
+        else:
+            outputs = list(self._session.run(None, {self._input_name: np.stack(tensors)})[0])
+        return [
+            self._postprocess(output, scale, image.size)
+            for output, (_, scale, _), image in zip(outputs, prepared, images)
+        ]
+
+
+# =======================================================
+#               3. CASCADE (local first, Gemini as fallback)
+# =======================================================
+
+class CascadeDetector(Detector):
+    """
+    Answers from the local model when it is sure: at least one detection at or above
+    min_confidence whose label is a known waste type. Anything else (unknown wastes,
+    low-confidence or empty results, local failures) goes to the remote backend.
+    """
+
+    name = "cascade"
+
+    def __init__(
+        self,
+        local: Detector,
+        remote: Detector,
+        is_known_label: Callable[[str], bool],
+        min_confidence: float = 0.6,
+    ):
+        self.local = local
+        self.remote = remote
+        self.is_known_label = is_known_label
+        self.min_confidence = min_confidence
+
+    @property
+    def cache_namespace(self) -> str:
+        return f"{self.name}-{self.min_confidence:g}-{self.local.cache_namespace}-{self.remote.cache_namespace}"
+
+    async def detect(self, prepared: Any) -> List[Dict[str, Any]]:
+        try:
+            detections = await self.local.detect(prepared)
+        except Exception as e:
+            print(f"WARNING: Local vision model failed, using {self.remote.name}: {e}")
+            detections = []
+        confident = [
+            d for d in detections
+            if d.get('confidence', 0.0) >= self.min_confidence and self.is_known_label(d['label'])
+        ]
+        if confident:
+            CASCADE_ROUTES.inc(backend=self.local.name)
+            return confident
+        CASCADE_ROUTES.inc(backend=self.remote.name)
+        return await self.remote.detect(prepared)
+
+    def close(self) -> None:
+        self.local.close()
+        self.remote.close()
@@ -0,0 +1,91 @@
+# app/services/fake_gemini.py
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# --- Offline stand-in for google.genai.Client ---
+# Mirrors the two call surfaces the app uses (client.models.generate_content and
+# client.aio.models.generate_content) with a configurable latency, and records how
+# many calls were in flight at once so concurrency limits can be checked without
+# network access or an API key.
+
+DEFAULT_DETECTIONS = [
+    {"label": "Banana Skin", "relative_quantity_score": 7},
+    {"label": "Coffee Grounds", "relative_quantity_score": 3},
+]
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _CallTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def enter(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def exit(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+
+class _FakeModels:
+    def __init__(self, client: "FakeGeminiClient"):
+        self._client = client
+
+    def generate_content(self, model: str, contents: List[Any], config: Optional[Dict] = None) -> FakeResponse:
+        self._client.tracker.enter()
+        try:
+            time.sleep(self._client.latency_s)
+            return FakeResponse(json.dumps(self._client.detections))
+        finally:
+            self._client.tracker.exit()
+
+
+class _FakeAsyncModels:
+    def __init__(self, client: "FakeGeminiClient"):
+        self._client = client
+
+    async def generate_content(self, model: str, contents: List[Any], config: Optional[Dict] = None) -> FakeResponse:
+        self._client.tracker.enter()
+        try:
+            await asyncio.sleep(self._client.latency_s)
+            return FakeResponse(json.dumps(self._client.detections))
+        finally:
+            self._client.tracker.exit()
+
+
+class _FakeAio:
+    def __init__(self, client: "FakeGeminiClient"):
+        self.models = _FakeAsyncModels(client)
+
+
+class FakeGeminiClient:
+    """
+    Fake Gemini client. `latency_s` simulates a slow vision call; set `sync_only=True`
+    to hide the .aio surface and exercise the thread-pool path instead.
+    """
+
+    def __init__(
+        self,
+        detections: Optional[List[Dict[str, Any]]] = None,
+        latency_s: float = 0.5,
+        sync_only: bool = False,
+    ):
+        self.detections = detections if detections is not None else DEFAULT_DETECTIONS
+        self.latency_s = latency_s
+        self.tracker = _CallTracker()
+        self.models = _FakeModels(self)
+        if not sync_only:
+            self.aio = _FakeAio(self)
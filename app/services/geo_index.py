@@ -0,0 +1,161 @@
+# app/services/geo_index.py
+import math
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+# Grid cell size in degrees. ~0.5 deg (~55 km) keeps a 50 km search inside a 3x3 block of cells.
+DEFAULT_CELL_DEG = 0.5
+
+# =======================================================
+#               VECTORIZED DISTANCE
+# =======================================================
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in km. Accepts scalars or NumPy arrays (broadcasts)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def within_bounding_box(lat: np.ndarray, lon: np.ndarray, center_lat: np.ndarray, center_lon: np.ndarray, radius_km: float) -> np.ndarray:
+    """
+    Mask of the points (lat, lon) inside the bounding box of the centers widened by
+    radius_km: a cheap superset of the points within radius_km of any center, to cut
+    candidates before haversine_km.
+    """
+    delta = radius_km / EARTH_RADIUS_KM # Angular radius (rad)
+    dlat = math.degrees(delta)
+    mask = (lat >= np.min(center_lat) - dlat) & (lat <= np.max(center_lat) + dlat)
+    # Widest longitude span of a circle is at the center farthest from the equator
+    cos_lat = math.cos(math.radians(float(np.max(np.abs(center_lat)))))
+    if math.sin(delta) < cos_lat:
+        dlon = math.degrees(math.asin(math.sin(delta) / cos_lat))
+        lon_min, lon_max = np.min(center_lon) - dlon, np.max(center_lon) + dlon
+        if lon_min >= -180.0 and lon_max <= 180.0: # Across the antimeridian: latitude test only
+            mask &= (lon >= lon_min) & (lon <= lon_max)
+    return mask
+
+
+def grid_cell(lat: float, lon: float, cell_deg: float = DEFAULT_CELL_DEG) -> Tuple[int, int]:
+    """Maps a coordinate to its (row, col) cell on a fixed lat/lon grid."""
+    return (int(math.floor(lat / cell_deg)), int(math.floor(lon / cell_deg)))
+
+
+def cells_covering(lat: float, lon: float, radius_km: float, cell_deg: float = DEFAULT_CELL_DEG) -> List[Tuple[int, int]]:
+    """Every grid cell overlapping the bounding box of a search circle."""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlon = min(radius_km / (KM_PER_DEGREE_LAT * cos_lat), 180.0)
+
+    row_min, col_min = grid_cell(lat - dlat, lon - dlon, cell_deg)
+    row_max, col_max = grid_cell(lat + dlat, lon + dlon, cell_deg)
+    return [(row, col) for row in range(row_min, row_max + 1) for col in range(col_min, col_max + 1)]
+
+
+# =======================================================
+#               PRODUCER SPATIAL INDEX
+# =======================================================
+
+class ProducerGeoIndex:
+    """
+    Grid index over producer coordinates. Producers are bucketed into fixed
+    lat/lon cells; a radius query only gathers the cells overlapping the search
+    circle and runs one vectorized haversine pass over those candidates.
+    """
+
+    def __init__(self, cell_deg: float = DEFAULT_CELL_DEG):
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        self._positions: Dict[str, int] = {}
+        self._ids: List[str] = []
+        # Contiguous coordinate arrays (grown by doubling so inserts stay amortized O(1))
+        self._lat = np.empty(64, dtype=np.float64)
+        self._lon = np.empty(64, dtype=np.float64)
+
+    @classmethod
+    def from_dataframe(cls, producer_df: pd.DataFrame, cell_deg: float = DEFAULT_CELL_DEG) -> "ProducerGeoIndex":
+        """Builds the index from a producer table with producer_id/latitude/longitude columns."""
+        index = cls(cell_deg=cell_deg)
+        for producer_id, lat, lon in zip(
+            producer_df['producer_id'], producer_df['latitude'], producer_df['longitude']
+        ):
+            index.add(producer_id, lat, lon)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, producer_id: str) -> bool:
+        return producer_id in self._positions
+
+    def add(self, producer_id: str, lat: float, lon: float) -> None:
+        """Adds (or moves) a producer. Keeps the index current as producers register."""
+        lat, lon = float(lat), float(lon)
+        if producer_id in self._positions:
+            pos = self._positions[producer_id]
+            old_cell = grid_cell(self._lat[pos], self._lon[pos], self.cell_deg)
+            self._cells[old_cell].remove(pos)
+        else:
+            pos = len(self._ids)
+            if pos == len(self._lat):
+                self._lat = np.resize(self._lat, pos * 2)
+                self._lon = np.resize(self._lon, pos * 2)
+            self._ids.append(producer_id)
+            self._positions[producer_id] = pos
+
+        self._lat[pos] = lat
+        self._lon[pos] = lon
+        self._cells.setdefault(grid_cell(lat, lon, self.cell_deg), []).append(pos)
+
+    def location(self, producer_id: str) -> Tuple[float, float] | None:
+        """Returns the (lat, lon) of a producer, or None if unknown."""
+        pos = self._positions.get(producer_id)
+        if pos is None:
+            return None
+        return float(self._lat[pos]), float(self._lon[pos])
+
+    @property
+    def producer_ids(self) -> List[str]:
+        return self._ids
+
+    def coordinates(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(lat, lon) arrays for every indexed producer, in position order (read-only views)."""
+        n = len(self._ids)
+        lat, lon = self._lat[:n], self._lon[:n]
+        lat.flags.writeable = False
+        lon.flags.writeable = False
+        return lat, lon
+
+    def positions_of(self, producer_ids) -> np.ndarray:
+        """Maps producer ids to their row in coordinates() (-1 for unknown producers)."""
+        positions = self._positions
+        return np.fromiter((positions.get(pid, -1) for pid in producer_ids), dtype=np.int64, count=len(producer_ids))
+
+    def _candidate_positions(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Collects positions from every grid cell overlapping the search circle's bounding box."""
+        candidates: List[int] = []
+        for cell in cells_covering(lat, lon, radius_km, self.cell_deg):
+            bucket = self._cells.get(cell)
+            if bucket:
+                candidates.extend(bucket)
+        return np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+
+    def query_radius(self, lat: float, lon: float, radius_km: float) -> Tuple[List[str], np.ndarray]:
+        """
+        Returns (producer_ids, distances_km) for all producers within radius_km,
+        in no particular order.
+        """
+        positions = self._candidate_positions(lat, lon, radius_km)
+        if positions.size == 0:
+            return [], np.empty(0, dtype=np.float64)
+
+        distances = haversine_km(lat, lon, self._lat[positions], self._lon[positions])
+        in_range = distances <= radius_km
+        ids = [self._ids[pos] for pos in positions[in_range]]
+        return ids, distances[in_range]
@@ -1,9 +1,73 @@
 # app/services/marketplace_service.py (Final Save Logic)
 
 import pandas as pd
+import threading
 import uuid
+from concurrent.futures import Future
 from datetime import datetime
-from app.config.api import APP_STATE # Required for global access
+from typing import Dict, Tuple
+from app.config.state import APP_STATE # Required for global access
+from app.services.regional_store import RegionalOfferStore
+from app.services.reservation_service import ReservationService
+
+_STORE_INIT_LOCK = threading.Lock()
+
+
+def get_offer_store() -> RegionalOfferStore:
+    """
+    Returns the shared offer store, creating it on first use: one shard per producer
+    region in DATA_PATH/regions/<region>.db, plus DATA_PATH/offers.db for producers
+    outside every region. Offers left in offers.db by an unsharded store are moved to
+    their region; an empty store is seeded once from the legacy offers.csv.
+    """
+    store = APP_STATE.get('OFFER_STORE')
+    if store is None:
+        from app.routes.agent.recommendation import get_producer_index # Import here: that module imports this one
+        with _STORE_INIT_LOCK:
+            store = APP_STATE.get('OFFER_STORE')
+            if store is None:
+                store = RegionalOfferStore(
+                    APP_STATE['DATA_PATH'] / 'offers.db',
+                    APP_STATE['DATA_PATH'] / 'regions',
+                    get_producer_index().regions,
+                    lambda producer_id: get_producer_index().region_of(producer_id),
+                )
+                store.rehome_offers()
+                store.import_csv(APP_STATE['DATA_PATH'] / 'offers.csv')
+                APP_STATE['OFFER_STORE'] = store
+    return store
+
+
+def get_reservation_service() -> ReservationService:
+    """Returns the shared ReservationService (same database as the offer store)."""
+    service = APP_STATE.get('RESERVATION_SERVICE')
+    if service is None:
+        store = get_offer_store()
+        with _STORE_INIT_LOCK:
+            service = APP_STATE.get('RESERVATION_SERVICE')
+            if service is None:
+                service = ReservationService(store)
+                APP_STATE['RESERVATION_SERVICE'] = service
+    return service
+
+
+def shutdown_offer_store() -> None:
+    """
+    Flushes pending writes and compacts the WAL. The SQLite shards are the source of
+    truth: offers.csv is only the one-time seed and is never rewritten (use
+    GET /offers/export for a CSV copy).
+    """
+    APP_STATE.pop('RESERVATION_SERVICE', None)
+    store = APP_STATE.pop('OFFER_STORE', None)
+    if store is not None:
+        store.snapshot()
+        store.close()
+
+
+def get_offers_df() -> pd.DataFrame:
+    """Current offers as a DataFrame (read path for the recommendation service)."""
+    return get_offer_store().dataframe()
+
 
 def save_offer_to_marketplace(
     producer_id: str,
@@ -11,9 +75,11 @@ def save_offer_to_marketplace(
     waste_type: str,
     estimated_quantity: float,
     npk_scores: Dict[str, float],
-) -> str: # Returns the new offer ID
+) -> Tuple[str, Future]: # Returns the new offer ID and its commit
     """
-    Saves the final calculated offer details to the OFFERS_DF and the CSV file.
+    Saves the final calculated offer details to the offer store (SQLite WAL).
+    Wait on the returned Future before reporting the offer as saved: it raises
+    if the group commit failed (the offer is then gone from the store again).
     """
     
     # Generate unique ID and structure the data
@@ -31,16 +97,9 @@ def save_offer_to_marketplace(
         'K_score': npk_scores['K'],
     }
     
-    # 1. APPEND TO GLOBAL DATAFRAME (Makes data available to live API requests instantly)
-    # Convert the new data to a DataFrame row
-    new_row_df = pd.DataFrame([new_data])
-    
-    # Use pd.concat to update the global OFFERS_DF object in memory
-    # NOTE: This requires APP_STATE['OFFERS_DF'] to be a mutable object (a DataFrame).
-    # Since DataFrames are generally mutable, this works in a prototype environment.
-    APP_STATE['OFFERS_DF'] = pd.concat([APP_STATE['OFFERS_DF'], new_row_df], ignore_index=True)
-    
-    # 2. PERSISTENCE: Write back to CSV (Ensures data survives server restart)
-    APP_STATE['OFFERS_DF'].to_csv(APP_STATE['DATA_PATH'] / 'offers.csv', index=False)
+    # 1. APPEND TO THE OFFER STORE
+    # O(1): updates the in-memory index (visible to live API requests instantly) and queues
+    # the row for the next group commit to SQLite. No full-table concat or CSV rewrite.
+    committed = get_offer_store().append(new_data)
     
-    return new_offer_id
\ No newline at end of file
+    return new_offer_id, committed
@@ -0,0 +1,356 @@
+# app/services/metrics.py
+import asyncio
+import bisect
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.config.state import APP_STATE
+
+# Latency buckets in seconds (sub-ms index lookups up to slow vision calls)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_LabelValues = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: _LabelValues, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+# =======================================================
+#               METRIC TYPES (Prometheus text format)
+# =======================================================
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> _LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[_LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[_LabelValues, List] = {} # labels -> [per-bucket counts (+Inf last), sum, count]
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(s[0]), s[1], s[2]) for key, s in self._series.items()]
+        lines = self.header()
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Named metrics plus scrape-time collectors. A collector is a callable yielding
+    (name, kind, help, labelnames, {label values: value}) for numbers that already
+    live elsewhere (e.g. cache counters), so the hot path pays nothing for them.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[tuple]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                for name, kind, documentation, labelnames, samples in collector():
+                    lines.append(f"# HELP {name} {documentation}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    lines.extend(f"{name}{_format_labels(labelnames, key)} {value}" for key, value in samples.items())
+            except Exception as e:
+                print(f"WARNING: Metrics collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+# =======================================================
+#               SHARED METRICS + STAGE TIMING
+# =======================================================
+
+METRICS = MetricsRegistry()
+
+STAGE_SECONDS = METRICS.histogram(
+    "marketplace_stage_seconds", "Latency of each hot-path stage.", ["stage"]
+)
+STAGE_IN_FLIGHT = METRICS.gauge(
+    "marketplace_stage_in_flight", "Calls currently inside each stage.", ["stage"]
+)
+STAGE_ERRORS = METRICS.counter(
+    "marketplace_stage_errors_total", "Stages that raised.", ["stage"]
+)
+HTTP_REQUEST_SECONDS = METRICS.histogram(
+    "marketplace_http_request_seconds", "HTTP request latency by route template.", ["method", "route", "status"]
+)
+HTTP_IN_FLIGHT = METRICS.gauge(
+    "marketplace_http_requests_in_flight", "HTTP requests currently being served."
+)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Times a block into marketplace_stage_seconds{stage=name} and tracks it as in flight."""
+    STAGE_IN_FLIGHT.inc(stage=name)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+        STAGE_IN_FLIGHT.dec(stage=name)
+
+
+# =======================================================
+#               SAMPLING PROFILER (opt-in, per request)
+# =======================================================
+
+# Innermost frames that mean "this thread is parked", not doing work
+_IDLE_FRAMES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("queue.py", "get"),
+    ("selectors.py", "select"), ("thread.py", "_worker"),
+}
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampler: a background thread snapshots every thread's stack
+    (sys._current_frames) each interval_s and tallies folded stacks
+    ("outer;inner;leaf count") ready for flamegraph.pl / speedscope.
+    Costs nothing unless started; parked threads are skipped.
+    """
+
+    def __init__(self, interval_s: float = 0.005, max_depth: int = 64):
+        self.interval_s = interval_s
+        self.max_depth = max_depth
+        self.samples: _Tally = _Tally()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _fold(self, frame) -> Optional[str]:
+        code = frame.f_code
+        if (code.co_filename.rsplit("/", 1)[-1], code.co_name) in _IDLE_FRAMES:
+            return None
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                folded = self._fold(frame)
+                if folded:
+                    self.samples[folded] += 1
+
+    def start(self) -> "SamplingProfiler":
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> str:
+        """Stops sampling and returns the folded-stack text."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+
+# =======================================================
+#               SCRAPE-TIME COLLECTORS
+# =======================================================
+
+_CACHE_COUNTER_KEYS = ("hits", "near_hits", "disk_hits", "stale_hits", "misses", "invalidations", "evictions", "revalidations")
+
+
+def _cache_samples():
+    """Hit/miss counters and sizes of the analysis and recommendation caches."""
+    counters: Dict[_LabelValues, float] = {}
+    entries: Dict[_LabelValues, float] = {}
+    for cache_name, state_key in (("analysis", "ANALYSIS_CACHE"), ("recommendation", "RECOMMENDATION_CACHE")):
+        cache = APP_STATE.get(state_key)
+        if cache is None:
+            continue
+        stats = cache.stats()
+        for key in _CACHE_COUNTER_KEYS:
+            if key in stats:
+                counters[(cache_name, key)] = stats[key]
+        entries[(cache_name,)] = stats.get("entries", 0)
+    yield "marketplace_cache_events_total", "counter", "Cache lookups and maintenance events.", ("cache", "event"), counters
+    yield "marketplace_cache_entries", "gauge", "Entries currently held in memory.", ("cache",), entries
+
+
+METRICS.add_collector(_cache_samples)
+
+
+# =======================================================
+#               HTTP MIDDLEWARE (request metrics + profiling)
+# =======================================================
+
+def profile_dir() -> Path:
+    return Path(APP_STATE['DATA_PATH']) / 'profiles'
+
+
+def _save_profile(profiler: SamplingProfiler, profile_id: str) -> None:
+    folded = profiler.stop()
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / f"{profile_id}.folded").write_text(folded)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware: per-route latency histogram and in-flight gauge.
+    With profiling enabled, a request carrying "X-Profile: 1" is sampled by
+    SamplingProfiler while it runs; the response gets an X-Profile-Id header
+    and the folded stacks land in DATA_PATH/profiles/<id>.folded. One profile
+    runs at a time (the sampler sees every thread, so overlapping captures
+    would mix their stacks); further X-Profile requests are served unprofiled.
+    """
+
+    def __init__(self, app, profiling_enabled: bool = False, profiling_interval_s: float = 0.005):
+        self.app = app
+        self.profiling_enabled = profiling_enabled
+        self.profiling_interval_s = profiling_interval_s
+        self._profile_slot = threading.Lock()
+
+    def _wants_profile(self, scope) -> bool:
+        if not self.profiling_enabled:
+            return False
+        return any(name == b"x-profile" and value.strip() == b"1" for name, value in scope.get("headers", ()))
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profiler, profile_id = None, None
+        if self._wants_profile(scope) and self._profile_slot.acquire(blocking=False):
+            profile_id = uuid.uuid4().hex
+            profiler = SamplingProfiler(self.profiling_interval_s).start()
+
+        status = 500 # Reported if the app raises before starting a response
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile_id is not None:
+                    message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route") # Set by the router: label by template, not raw path
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope.get("method", ""), route=getattr(route, "path", "unmatched"), status=str(status),
+            )
+            if profiler is not None:
+                try:
+                    await asyncio.to_thread(_save_profile, profiler, profile_id)
+                except OSError as e:
+                    print(f"WARNING: Could not save profile {profile_id}: {e}")
+                finally:
+                    self._profile_slot.release()
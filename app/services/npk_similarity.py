@@ -0,0 +1,178 @@
+# app/services/npk_similarity.py
+import threading
+import numpy as np
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from app.services.waste_calculator import WasteNpkLookup
+
+# Cosine similarity a substitute needs to reach (1.0 = identical N:P:K proportions)
+SUBSTITUTE_MIN_SIMILARITY = 0.9
+
+
+# =======================================================
+#               NPK PROFILES
+# =======================================================
+
+class NpkProfiler:
+    """
+    Turns offers into unit-length nutrient profile vectors. Each nutrient is first
+    divided by its mean concentration in the waste table (so N does not drown out
+    P and K), then the vector is L2-normalized: similarity is about N:P:K balance,
+    not about how many kilograms are on offer.
+    """
+
+    def __init__(self, lookup: WasteNpkLookup):
+        self.lookup = lookup
+        table = np.column_stack((lookup.nitrogen, lookup.phosphorus, lookup.potassium))
+        self.scale = np.where(table.mean(axis=0) > 0, table.mean(axis=0), 1.0)
+
+    def normalize(self, npk) -> Optional[np.ndarray]:
+        vector = np.asarray(npk, dtype=np.float64) / self.scale
+        norm = np.linalg.norm(vector)
+        if not np.isfinite(norm) or norm == 0:
+            return None
+        return (vector / norm).astype(np.float32)
+
+    def waste_profile(self, waste_type: str) -> Optional[np.ndarray]:
+        """Profile of a waste type from the NPK table (None for unknown labels)."""
+        index = self.lookup.index_of(waste_type)
+        if index is None:
+            return None
+        return self.normalize((self.lookup.nitrogen[index], self.lookup.phosphorus[index], self.lookup.potassium[index]))
+
+    def offer_profile(self, record: Mapping[str, Any]) -> Optional[np.ndarray]:
+        """Uses the offer's saved N/P/K scores; legacy offers without scores fall back to their waste type."""
+        scores = [record.get('N_score'), record.get('P_score'), record.get('K_score')]
+        if all(score is not None and score == score for score in scores):
+            profile = self.normalize(scores)
+            if profile is not None:
+                return profile
+        return self.waste_profile(record.get('waste_type'))
+
+
+# =======================================================
+#               K-NN INDEX OVER AVAILABLE OFFERS
+# =======================================================
+
+class NpkSimilarityIndex:
+    """
+    Brute-force k-NN over the profiles of available offers, stored as contiguous
+    float32 rows with integer producer / waste-type codes. A query masks the rows
+    whose producer is inside the search radius (geo index) and scores only those
+    with one matrix-vector product: no Python loop over offers.
+    Attached to OfferStore (attach_index) so it follows inserts and availability changes.
+    """
+
+    def __init__(self, profile_of: Callable[[Mapping[str, Any]], Optional[np.ndarray]]):
+        self._profile_of = profile_of
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._vectors = np.zeros((64, 3), dtype=np.float32)
+        self._producer_codes = np.full(64, -1, dtype=np.int32)
+        self._waste_codes = np.full(64, -1, dtype=np.int32)
+        self._active = np.zeros(64, dtype=bool)
+        self._size = 0 # High-water mark of used rows
+        self._offer_ids: List[Optional[str]] = []
+        self._positions: Dict[str, int] = {} # offer_id -> row
+        self._producer_code_of: Dict[str, int] = {}
+        self._waste_code_of: Dict[str, int] = {}
+        self._free: List[int] = [] # Rows freed by offers that went unavailable
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def rebuild(self, records: Iterable[Mapping[str, Any]]) -> None:
+        with self._lock:
+            self._reset()
+        for record in records:
+            self.upsert(record)
+
+    def _code(self, codes: Dict[str, int], value: str) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+        return code
+
+    def upsert(self, record: Mapping[str, Any]) -> None:
+        """Indexes an available offer with a known profile; anything else is removed."""
+        offer_id = record['offer_id']
+        profile = self._profile_of(record) if record.get('is_available') else None
+        with self._lock:
+            self._remove_locked(offer_id)
+            if profile is None:
+                return
+            if self._free:
+                pos = self._free.pop()
+            else:
+                pos = self._size
+                self._size += 1
+                self._offer_ids.append(None)
+                if pos == len(self._active):
+                    capacity = pos * 2
+                    self._vectors = np.resize(self._vectors, (capacity, 3))
+                    self._producer_codes = np.resize(self._producer_codes, capacity)
+                    self._waste_codes = np.resize(self._waste_codes, capacity)
+                    self._active = np.resize(self._active, capacity)
+                    self._active[pos:] = False
+            self._vectors[pos] = profile
+            self._producer_codes[pos] = self._code(self._producer_code_of, record['producer_id'])
+            self._waste_codes[pos] = self._code(self._waste_code_of, str(record.get('waste_type')))
+            self._active[pos] = True
+            self._offer_ids[pos] = offer_id
+            self._positions[offer_id] = pos
+
+    def remove(self, record: Mapping[str, Any]) -> None:
+        with self._lock:
+            self._remove_locked(record['offer_id'])
+
+    def _remove_locked(self, offer_id: str) -> None:
+        pos = self._positions.pop(offer_id, None)
+        if pos is None:
+            return
+        self._active[pos] = False
+        self._offer_ids[pos] = None
+        self._free.append(pos)
+
+    def nearest(
+        self,
+        target: np.ndarray,
+        producer_distances: Mapping[str, float],
+        k: int = 5,
+        exclude_waste_type: Optional[str] = None,
+        min_similarity: float = SUBSTITUTE_MIN_SIMILARITY,
+    ) -> List[Tuple[str, float, float]]:
+        """
+        k offers from the given producers whose profile is closest to target (cosine).
+        Returns [(offer_id, similarity, distance_km)], most similar first (closer first on ties).
+        """
+        with self._lock:
+            # 1. Per-producer-code distance table (inf = outside the radius)
+            producer_distance = np.full(len(self._producer_code_of) + 1, np.inf)
+            for producer_id, distance in producer_distances.items():
+                code = self._producer_code_of.get(producer_id)
+                if code is not None:
+                    producer_distance[code] = distance
+
+            # 2. Rows of nearby, available offers (free rows have code -1 -> the trailing inf slot)
+            n = self._size
+            distances = producer_distance[self._producer_codes[:n]]
+            mask = self._active[:n] & np.isfinite(distances)
+            if exclude_waste_type is not None:
+                excluded = self._waste_code_of.get(exclude_waste_type)
+                if excluded is not None:
+                    mask &= self._waste_codes[:n] != excluded
+            rows = np.flatnonzero(mask)
+            if rows.size == 0:
+                return []
+
+            # 3. Cosine similarity (unit vectors) and bounded top-k
+            similarity = self._vectors[rows] @ np.asarray(target, dtype=np.float32)
+            keep = np.flatnonzero(similarity >= min_similarity)
+            if keep.size > k:
+                keep = keep[np.argpartition(-similarity[keep], k - 1)[:k]]
+            order = keep[np.lexsort((distances[rows[keep]], -similarity[keep]))]
+            return [
+                (self._offer_ids[rows[i]], float(similarity[i]), float(distances[rows[i]])) for i in order
+            ]
@@ -0,0 +1,111 @@
+# app/services/offer_index.py
+import heapq
+import math
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+# Sort key inside a bucket: (cost_per_kg, offer_id). offer_id makes every key unique.
+_IndexKey = Tuple[float, str]
+
+
+def _cost_key(cost: Any) -> float:
+    """Offers without a price sort last."""
+    if cost is None:
+        return math.inf
+    cost = float(cost)
+    return math.inf if cost != cost else cost
+
+
+# =======================================================
+#               OFFER INDEX (waste_type -> availability)
+# =======================================================
+
+class OfferIndex:
+    """
+    In-memory secondary index: waste_type -> is_available -> offers sorted by
+    cost_per_kg. Kept current by OfferStore on every insert, refresh and
+    availability/quantity change, so queries never scan the full offer table.
+    Not thread-safe on its own; OfferStore guards it with its record lock.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[str, Dict[bool, List[_IndexKey]]] = {}
+        self._entries: Dict[str, Tuple[str, bool, _IndexKey, str]] = {} # offer_id -> (waste, available, key, producer)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _bucket(self, waste_type: str, available: bool) -> List[_IndexKey]:
+        return self._buckets.setdefault(waste_type, {}).setdefault(available, [])
+
+    def upsert(self, record: Mapping[str, Any]) -> None:
+        """Inserts an offer, or moves it if its waste type, availability or price changed."""
+        offer_id = record['offer_id']
+        waste_type = record['waste_type']
+        available = bool(record['is_available'])
+        key = (_cost_key(record.get('cost_per_kg')), offer_id)
+
+        previous = self._entries.get(offer_id)
+        if previous is not None:
+            if previous == (waste_type, available, key, record['producer_id']):
+                return
+            self._remove_key(*previous[:3])
+
+        insort(self._bucket(waste_type, available), key)
+        self._entries[offer_id] = (waste_type, available, key, record['producer_id'])
+
+    def remove(self, offer_id: str) -> None:
+        previous = self._entries.pop(offer_id, None)
+        if previous is not None:
+            self._remove_key(*previous[:3])
+
+    def _remove_key(self, waste_type: str, available: bool, key: _IndexKey) -> None:
+        bucket = self._buckets[waste_type][available]
+        pos = bisect_left(bucket, key)
+        if pos < len(bucket) and bucket[pos] == key:
+            del bucket[pos]
+
+    def iter_offer_ids(self, waste_type: str, available: bool = True) -> Iterator[str]:
+        """Offer ids of one waste type / availability, cheapest first."""
+        for _, offer_id in self._buckets.get(waste_type, {}).get(available, ()):
+            yield offer_id
+
+    def cheapest_within(
+        self,
+        waste_type: str,
+        producer_distances: Mapping[str, float],
+        k: int = 5,
+    ) -> List[Tuple[str, float]]:
+        """
+        Top-k available offers of waste_type whose producer is in producer_distances,
+        ranked by (cost, distance). Walks the cost-sorted bucket with a bounded max-heap
+        and stops as soon as the next offer costs more than the current k-th best.
+        Returns [(offer_id, distance_km)] in rank order.
+        """
+        bucket = self._buckets.get(waste_type, {}).get(True)
+        if not bucket or k <= 0:
+            return []
+
+        entries = self._entries
+        heap: List[Tuple[float, float, str]] = [] # (-cost, -distance, offer_id): root is the worst kept offer
+        for cost, offer_id in bucket:
+            if len(heap) == k and cost > -heap[0][0]:
+                break # Every remaining offer is strictly more expensive than the k-th best
+            distance = producer_distances.get(entries[offer_id][3])
+            if distance is None:
+                continue
+            item = (-cost, -distance, offer_id)
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+        ranked = sorted(heap, key=lambda item: (-item[0], -item[1]))
+        return [(offer_id, -neg_distance) for _, neg_distance, offer_id in ranked]
+
+    @classmethod
+    def from_records(cls, records: Optional[Mapping[str, Mapping[str, Any]]] = None) -> "OfferIndex":
+        index = cls()
+        for record in (records or {}).values():
+            index.upsert(record)
+        return index
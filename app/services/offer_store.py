@@ -0,0 +1,585 @@
+# app/services/offer_store.py
+import os
+import queue
+import sqlite3
+import threading
+import time
+import pandas as pd
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from app.services.offer_index import OfferIndex
+from app.services.metrics import METRICS, stage
+
+COMMIT_BATCH_ROWS = METRICS.histogram(
+    "marketplace_offer_commit_batch_rows", "Offers written per group commit.", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+
+# Column order matches offers.csv (extra NPK/date columns are written by save_offer_to_marketplace)
+OFFER_COLUMNS = [
+    'offer_id', 'producer_id', 'waste_type', 'quantity_kg', 'cost_per_kg',
+    'is_available', 'listing_date', 'N_score', 'P_score', 'K_score',
+]
+
+_CREATE_OFFERS_SQL = """
+CREATE TABLE IF NOT EXISTS offers (
+    offer_id     TEXT PRIMARY KEY,
+    producer_id  TEXT NOT NULL,
+    waste_type   TEXT NOT NULL,
+    quantity_kg  REAL,
+    cost_per_kg  REAL,
+    is_available INTEGER NOT NULL DEFAULT 1,
+    listing_date TEXT,
+    N_score      REAL,
+    P_score      REAL,
+    K_score      REAL,
+    change_seq   INTEGER NOT NULL DEFAULT 0,
+    version      INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+# Single-row counter bumped by every committed write batch (from any process)
+_CREATE_META_SQL = "CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+
+# Upsert keeps (and bumps) the row version, so compare-and-swap writers never see it go backwards
+_INSERT_OFFER_SQL = (
+    f"INSERT INTO offers ({', '.join(OFFER_COLUMNS)}, change_seq) "
+    f"VALUES ({', '.join('?' for _ in OFFER_COLUMNS)}, ?) "
+    f"ON CONFLICT(offer_id) DO UPDATE SET "
+    f"{', '.join(f'{c} = excluded.{c}' for c in OFFER_COLUMNS[1:])}, "
+    f"change_seq = excluded.change_seq, version = version + 1"
+)
+_SELECT_OFFERS_SQL = f"SELECT {', '.join(OFFER_COLUMNS)}, change_seq, version FROM offers"
+
+SQLITE_BUSY_TIMEOUT_MS = 5000
+COMMIT_ATTEMPTS = 3 # Tries per group-commit batch before its appends are rolled back
+COMMIT_RETRY_DELAY_S = 0.05 # Backoff step between tries (grows linearly)
+
+
+def _clean(value: Any) -> Any:
+    """Converts pandas/NumPy scalars (and NaN) into plain SQLite-friendly values."""
+    if value is None:
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def _record_to_row(record: Dict[str, Any]) -> tuple:
+    row = []
+    for column in OFFER_COLUMNS:
+        value = _clean(record.get(column))
+        if column == 'is_available':
+            value = 1 if value in (True, 1, 'True', 'true') else 0
+        row.append(value)
+    return tuple(row)
+
+
+def _row_to_record(row: sqlite3.Row) -> Dict[str, Any]:
+    record = {column: row[column] for column in OFFER_COLUMNS}
+    record['is_available'] = bool(record['is_available'])
+    return record
+
+
+def _connect(db_path: Path, read_only: bool = False) -> sqlite3.Connection:
+    if read_only:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False, isolation_level=None)
+    else:
+        conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}") # Wait (don't fail) while another worker writes
+    return conn
+
+
+class _ReaderPool:
+    """Small pool of read-only connections. WAL lets them read while any process writes."""
+
+    def __init__(self, db_path: Path, size: int):
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all = [_connect(db_path, read_only=True) for _ in range(size)]
+        for conn in self._all:
+            self._pool.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def close(self) -> None:
+        for conn in self._all:
+            conn.close()
+
+
+# =======================================================
+#               OFFER STORE (SQLite WAL)
+# =======================================================
+
+class OfferStore:
+    """
+    Append-only offer persistence on an embedded SQLite database in WAL mode.
+
+    - append() is O(1): it updates the in-memory index and enqueues the row.
+    - A background writer drains the queue and group-commits rows in batches
+      (one transaction per batch), so concurrent uploads never lose a write.
+      append() returns a Future resolved once its batch is committed; a batch
+      that keeps failing is rolled back in memory and fails its futures.
+    - Multi-worker: every commit stamps its rows with a new change_seq. Reads
+      poll that counter (one indexed lookup) through a read-only connection
+      pool and merge only the rows other workers changed since the last poll.
+    - snapshot() checkpoints the WAL (and can export a CSV copy).
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        batch_size: int = 256,
+        flush_interval_s: float = 0.05,
+        reader_pool_size: int = 4,
+        refresh_interval_s: float = 0.05,
+    ):
+        self.db_path = Path(db_path)
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.refresh_interval_s = refresh_interval_s
+
+        self._conn = _connect(self.db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL") # Durable at each WAL checkpoint, fast commits
+        self._migrate()
+        self._readers = _ReaderPool(self.db_path, reader_pool_size)
+
+        # In-memory index (offer_id -> record), updated incrementally on every append
+        self._db_lock = threading.Lock() # Serializes use of the shared writer connection
+        self._lock = threading.Lock()
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._index = OfferIndex() # waste_type -> availability -> offers sorted by cost
+        self._attached_indexes: List[Any] = [] # Extra indexes kept in sync (see attach_index)
+        self._frame: Optional[pd.DataFrame] = None
+        self._pending_frame_rows: List[Dict[str, Any]] = []
+        self._seen_seq = 0 # Highest change_seq merged into the in-memory index
+        self._last_refresh = 0.0
+
+        self._queue: "queue.Queue[Optional[Tuple[Dict[str, Any], Future]]]" = queue.Queue()
+        self._closed = False
+        self._load()
+        self._writer = threading.Thread(target=self._writer_loop, name="offer-store-writer", daemon=True)
+        self._writer.start()
+
+    # --- SCHEMA ---
+
+    def _migrate(self) -> None:
+        self._conn.execute(_CREATE_OFFERS_SQL)
+        self._conn.execute(_CREATE_META_SQL)
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(offers)")}
+        if 'change_seq' not in columns: # Stores created before multi-worker support
+            self._conn.execute("ALTER TABLE offers ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0")
+        if 'version' not in columns: # Stores created before reservations
+            self._conn.execute("ALTER TABLE offers ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS offers_change_seq ON offers(change_seq)")
+        self._conn.execute("INSERT OR IGNORE INTO store_meta (key, value) VALUES ('change_seq', 0)")
+
+    # --- LOADING ---
+
+    def _load(self) -> None:
+        with self._readers.connection() as conn:
+            conn.execute("BEGIN") # One consistent snapshot for counter + rows
+            try:
+                seq = conn.execute("SELECT value FROM store_meta WHERE key = 'change_seq'").fetchone()[0]
+                rows = conn.execute(_SELECT_OFFERS_SQL).fetchall()
+            finally:
+                conn.execute("COMMIT")
+        self._records = {row['offer_id']: _row_to_record(row) for row in rows}
+        self._index = OfferIndex.from_records(self._records)
+        for index in self._attached_indexes:
+            index.rebuild(self._records.values())
+        self._frame = None
+        self._seen_seq = seq
+
+    def import_csv(self, csv_path: Path) -> int:
+        """One-time migration: loads offers.csv into an empty store. Returns rows imported."""
+        if self._records or not Path(csv_path).exists():
+            return 0
+        return self.import_records(pd.read_csv(csv_path).to_dict('records'))
+
+    def import_records(self, records: List[Dict[str, Any]]) -> int:
+        """Seeds an empty store with records (no-op once the table has rows). Returns rows imported."""
+        rows = [_record_to_row(record) for record in records]
+        with self._db_lock:
+            self._conn.execute("BEGIN IMMEDIATE") # Another worker may be importing at the same time
+            try:
+                if self._conn.execute("SELECT COUNT(*) FROM offers").fetchone()[0] == 0:
+                    seq = self._next_seq()
+                    self._conn.executemany(_INSERT_OFFER_SQL, [row + (seq,) for row in rows])
+                else:
+                    rows = []
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+        with self._lock:
+            self._load()
+        return len(rows)
+
+    def reload(self) -> None:
+        """Re-reads every row (after rows were deleted directly, e.g. moved to another store)."""
+        with self._lock:
+            self._load()
+
+    # --- WRITES ---
+
+    def _next_seq(self) -> int:
+        """Bumps the shared change counter (caller holds an open write transaction)."""
+        self._conn.execute("UPDATE store_meta SET value = value + 1 WHERE key = 'change_seq'")
+        return self._conn.execute("SELECT value FROM store_meta WHERE key = 'change_seq'").fetchone()[0]
+
+    @contextmanager
+    def write_transaction(self) -> Iterator[Tuple[sqlite3.Connection, int]]:
+        """
+        Short BEGIN IMMEDIATE transaction on the writer connection, stamped with a fresh
+        change_seq. Yields (connection, seq); rows written must set change_seq = seq so
+        other workers pick them up. Commits on exit, rolls back on any exception.
+        """
+        with stage("store_write_lock_wait"):
+            self._db_lock.acquire()
+        try:
+            with stage("store_write_transaction"):
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    seq = self._next_seq()
+                    yield self._conn, seq
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    if self._conn.in_transaction:
+                        self._conn.execute("ROLLBACK")
+                    raise
+        finally:
+            self._db_lock.release()
+        with self._lock:
+            if seq == self._seen_seq + 1:
+                self._seen_seq = seq # No other worker wrote in between: skip re-reading our own rows
+
+    def _commit_rows(self, rows: List[tuple]) -> None:
+        """Writes one batch in a single transaction stamped with a fresh change_seq."""
+        COMMIT_BATCH_ROWS.observe(len(rows))
+        with stage("offer_commit"), self.write_transaction() as (conn, seq):
+            conn.executemany(_INSERT_OFFER_SQL, [row + (seq,) for row in rows])
+
+    def _commit_batch(self, batch: List[Tuple[Dict[str, Any], Future]]) -> None:
+        """Commits a group of appends, retrying transient errors, and settles their futures."""
+        rows = [_record_to_row(record) for record, _ in batch]
+        for attempt in range(1, COMMIT_ATTEMPTS + 1):
+            try:
+                self._commit_rows(rows)
+                break
+            except sqlite3.Error as e:
+                if attempt < COMMIT_ATTEMPTS:
+                    print(f"WARNING: Offer batch commit failed ({len(rows)} rows, attempt {attempt}/{COMMIT_ATTEMPTS}): {e}")
+                    time.sleep(COMMIT_RETRY_DELAY_S * attempt)
+                    continue
+                print(f"ERROR: Offer batch commit failed ({len(rows)} rows), rolling the appends back: {e}")
+                self._forget(record for record, _ in batch)
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+        for _, future in batch:
+            future.set_result(None)
+
+    def _forget(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Puts appends that never committed back to the committed row (or drops them)."""
+        for record in records:
+            offer_id = record['offer_id']
+            try:
+                committed = self.read_committed(offer_id)
+            except sqlite3.Error:
+                committed = None
+            with self._lock:
+                if self._records.get(offer_id) is not record:
+                    continue # Replaced since (a later append or another worker's row)
+                self._frame = None
+                if committed is None:
+                    del self._records[offer_id]
+                    self._index.remove(offer_id)
+                    for index in self._attached_indexes:
+                        index.remove(record)
+                else:
+                    self._records[offer_id] = committed[0]
+                    self._upsert_indexes(committed[0])
+
+    def attach_index(self, index: Any, rebuild: bool = True) -> None:
+        """
+        Keeps an extra in-memory index in sync with the store. The index must provide
+        upsert(record), remove(record) (an append that never committed) and
+        rebuild(records); all are called under the record lock.
+        rebuild=False when the caller already filled it (an index shared by several stores).
+        """
+        with self._lock:
+            if rebuild:
+                index.rebuild(self._records.values())
+            self._attached_indexes.append(index)
+
+    def _upsert_indexes(self, record: Dict[str, Any]) -> None:
+        self._index.upsert(record)
+        for index in self._attached_indexes:
+            index.upsert(record)
+
+    def append(self, record: Dict[str, Any]) -> Future:
+        """
+        Adds one offer. Visible to readers immediately; committed by the next group commit.
+        Returns a Future that resolves once the row is durable, or raises the sqlite3.Error
+        that made its batch fail (the offer is then rolled back in memory too).
+        """
+        if self._closed:
+            raise RuntimeError("OfferStore is closed.")
+        record = {column: _clean(record.get(column)) for column in OFFER_COLUMNS}
+        with self._lock:
+            if record['offer_id'] in self._records:
+                self._frame = None # Replacing an offer: rebuild the frame on next read
+            self._records[record['offer_id']] = record
+            self._upsert_indexes(record)
+            self._pending_frame_rows.append(record)
+        committed: Future = Future()
+        self._queue.put((record, committed))
+        return committed
+
+    def upsert_many(self, records: List[Dict[str, Any]]) -> int:
+        """
+        Bulk path: writes a batch of offers in ONE transaction, synchronously (not via the
+        group-commit queue), so the batch is durable when this returns. Existing offer ids
+        are replaced. Returns the number of rows written.
+        """
+        if self._closed:
+            raise RuntimeError("OfferStore is closed.")
+        records = [{column: _clean(record.get(column)) for column in OFFER_COLUMNS} for record in records]
+        rows = [_record_to_row(record) for record in records]
+        COMMIT_BATCH_ROWS.observe(len(rows))
+        with stage("offer_commit"), self.write_transaction() as (conn, seq):
+            conn.executemany(_INSERT_OFFER_SQL, [row + (seq,) for row in rows])
+        with self._lock:
+            for record in records:
+                if record['offer_id'] in self._records:
+                    self._frame = None
+                else:
+                    self._pending_frame_rows.append(record)
+                self._records[record['offer_id']] = record
+                self._upsert_indexes(record)
+        return len(rows)
+
+    def _writer_loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                self._queue.task_done()
+                return
+            batch = [first]
+            # Group commit: gather whatever else arrives within the flush window
+            try:
+                while len(batch) < self.batch_size:
+                    item = self._queue.get(timeout=self.flush_interval_s)
+                    if item is None:
+                        self._queue.put(None) # Re-queue the shutdown marker after this batch
+                        self._queue.task_done()
+                        break
+                    batch.append(item)
+            except queue.Empty:
+                pass
+            try:
+                self._commit_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self) -> None:
+        """Blocks until every appended offer has been committed."""
+        self._queue.join()
+
+    @contextmanager
+    def read_connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrows a pooled read-only connection (sees committed data from every worker)."""
+        with self._readers.connection() as conn:
+            yield conn
+
+    def read_committed(self, offer_id: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        """Reads (record, version) straight from the database (pending appends are not visible)."""
+        with self._readers.connection() as conn:
+            row = conn.execute(f"{_SELECT_OFFERS_SQL} WHERE offer_id = ?", (offer_id,)).fetchone()
+        if row is None:
+            return None
+        return _row_to_record(row), row['version']
+
+    def apply_committed(self, record: Dict[str, Any]) -> None:
+        """Folds a row this worker just committed via write_transaction() into memory and the index."""
+        with self._lock:
+            self._records[record['offer_id']] = record
+            self._upsert_indexes(record)
+            self._frame = None
+
+    # --- KEYSET PAGINATION (committed rows, ordered by offer_id) ---
+
+    @staticmethod
+    def _page_filter(after: Optional[str], waste_type: Optional[str], available_only: bool) -> Tuple[str, list]:
+        clauses, params = ["offer_id > ?"], [after or ""]
+        if waste_type is not None:
+            clauses.append("waste_type = ?")
+            params.append(waste_type)
+        if available_only:
+            clauses.append("is_available = 1")
+        return " AND ".join(clauses), params
+
+    def page_committed(
+        self,
+        after: Optional[str],
+        limit: int,
+        waste_type: Optional[str] = None,
+        available_only: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Up to `limit` committed offers with offer_id > after (primary-key range scan, no OFFSET)."""
+        where, params = self._page_filter(after, waste_type, available_only)
+        with self._readers.connection() as conn:
+            rows = conn.execute(
+                f"{_SELECT_OFFERS_SQL} WHERE {where} ORDER BY offer_id LIMIT ?", params + [limit]
+            ).fetchall()
+        return [_row_to_record(row) for row in rows]
+
+    def cursor_after(
+        self,
+        after: Optional[str],
+        count: int,
+        waste_type: Optional[str] = None,
+        available_only: bool = False,
+    ) -> Optional[str]:
+        """
+        The offer_id ending a page of `count` rows after `after`, or None if the rows run
+        out within the page (i.e. there is no next page). Reads ids from the index only.
+        """
+        where, params = self._page_filter(after, waste_type, available_only)
+        with self._readers.connection() as conn:
+            rows = conn.execute(
+                f"SELECT offer_id FROM offers WHERE {where} ORDER BY offer_id LIMIT 2 OFFSET ?", params + [count - 1]
+            ).fetchall()
+        return rows[0]['offer_id'] if len(rows) == 2 else None
+
+    def committed_ids_after(
+        self,
+        after: Optional[str],
+        limit: int,
+        waste_type: Optional[str] = None,
+        available_only: bool = False,
+    ) -> List[str]:
+        """The next `limit` committed offer ids after `after`, in order (index-only scan)."""
+        where, params = self._page_filter(after, waste_type, available_only)
+        with self._readers.connection() as conn:
+            rows = conn.execute(
+                f"SELECT offer_id FROM offers WHERE {where} ORDER BY offer_id LIMIT ?", params + [limit]
+            ).fetchall()
+        return [row['offer_id'] for row in rows]
+
+    # --- CROSS-WORKER REFRESH ---
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Merges rows committed by any worker since the last refresh. The common case
+        (nothing changed) costs one primary-key lookup on store_meta. Returns rows merged.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_interval_s:
+            return 0
+        self._last_refresh = now
+
+        with self._readers.connection() as conn:
+            seq = conn.execute("SELECT value FROM store_meta WHERE key = 'change_seq'").fetchone()[0]
+            if seq == self._seen_seq:
+                return 0
+            rows = conn.execute(f"{_SELECT_OFFERS_SQL} WHERE change_seq > ?", (self._seen_seq,)).fetchall()
+
+        with self._lock:
+            for row in rows:
+                record = _row_to_record(row)
+                existing = self._records.get(record['offer_id'])
+                if existing == record:
+                    continue # Our own write coming back from the database
+                self._records[record['offer_id']] = record
+                self._upsert_indexes(record)
+                if existing is None:
+                    self._pending_frame_rows.append(record)
+                else:
+                    self._frame = None # An existing offer changed: rebuild the frame on next read
+            self._seen_seq = max([seq] + [row['change_seq'] for row in rows])
+        return len(rows)
+
+    # --- READS ---
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(self, offer_id: str) -> Optional[Dict[str, Any]]:
+        self.refresh()
+        return self._records.get(offer_id)
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Every offer currently in memory (a list copy; the records themselves are shared)."""
+        self.refresh()
+        with self._lock:
+            return list(self._records.values())
+
+    def cheapest_available(
+        self,
+        waste_type: str,
+        producer_distances: Mapping[str, float],
+        k: int = 5,
+    ) -> List[Dict[str, Any]]:
+        """
+        Top-k available offers of waste_type from the given producers, ranked by cost then
+        distance. Reads only the cost-sorted index bucket (early exit), never the full table.
+        Each returned record is a copy with an extra 'distance_km' field.
+        """
+        self.refresh()
+        with self._lock:
+            ranked = self._index.cheapest_within(waste_type, producer_distances, k)
+            return [{**self._records[offer_id], 'distance_km': distance} for offer_id, distance in ranked]
+
+    def available_offers(self, waste_type: str) -> List[Dict[str, Any]]:
+        """Available offers of one waste type, cheapest first (index bucket, no table scan)."""
+        self.refresh()
+        with self._lock:
+            return [self._records[offer_id] for offer_id in self._index.iter_offer_ids(waste_type)]
+
+    def dataframe(self) -> pd.DataFrame:
+        """Returns the offers as a DataFrame. New rows are folded in once per read, not per write."""
+        self.refresh()
+        with self._lock:
+            if self._frame is None:
+                self._frame = pd.DataFrame(list(self._records.values()), columns=OFFER_COLUMNS)
+                self._pending_frame_rows = []
+            elif self._pending_frame_rows:
+                new_rows = pd.DataFrame(self._pending_frame_rows, columns=OFFER_COLUMNS)
+                self._frame = pd.concat([self._frame, new_rows], ignore_index=True)
+                self._pending_frame_rows = []
+            return self._frame
+
+    # --- COMPACTION / SHUTDOWN ---
+
+    def snapshot(self, csv_path: Optional[Path] = None) -> None:
+        """Checkpoints the WAL into the main DB file and optionally exports a CSV snapshot."""
+        self.flush()
+        with self._db_lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if csv_path is not None:
+            tmp_path = Path(f"{csv_path}.{os.getpid()}.tmp") # Per-worker temp file
+            self.dataframe().to_csv(tmp_path, index=False)
+            os.replace(tmp_path, csv_path) # Atomic swap, readers never see a half-written file
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        self._readers.close()
+        self._conn.close()
@@ -0,0 +1,224 @@
+# app/services/recommendation_cache.py
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, Mapping, Optional, Set, Tuple
+
+from app.services.geo_index import DEFAULT_CELL_DEG, cells_covering, grid_cell
+
+# Tag matching "any waste type": used by responses with no exact listing nearby,
+# which a new offer of ANY (similar) waste could change.
+ANY_WASTE = '*'
+
+_Tag = Tuple[str, Tuple[int, int]] # (waste_type, region cell)
+
+
+def recommendation_cache_key(crop_entry: Hashable, deficiencies, lat: float, lon: float, cell_deg: float) -> tuple:
+    """
+    (crop recommendation, deficiency bucket, location cell). The crop entry is the frozen
+    table row, so a retrained/reloaded table naturally yields new keys. The deficiency
+    bucket is the N/P/K deficiency set: every soil reading in the same bucket gets the
+    same advice.
+    """
+    return (crop_entry, tuple(deficiencies), grid_cell(lat, lon, cell_deg))
+
+
+class _Entry:
+    __slots__ = ('created_at', 'payload', 'tags', 'stale')
+
+    def __init__(self, payload: Any, tags: FrozenSet[_Tag]):
+        self.created_at = time.time()
+        self.payload = payload
+        self.tags = tags
+        self.stale = False # Set by invalidation in stale-while-revalidate mode
+
+
+# =======================================================
+#               RECOMMENDATION RESPONSE CACHE
+# =======================================================
+
+class RecommendationCache:
+    """
+    LRU cache of recommendation payloads for farmers asking the same thing from
+    (almost) the same place.
+
+    - Each entry is tagged with (waste_type, region cell) for every coarse cell its
+      search circle overlaps. An offer change (added, reserved, sold out) at a
+      producer invalidates exactly the entries tagged with that offer's waste type
+      and the producer's cell. Wired in as an OfferStore index (upsert/rebuild).
+    - refresh (the store's rate-limited refresh()) runs before every lookup, so
+      offers committed by OTHER workers invalidate entries before they are served.
+    - stale_while_revalidate: invalidated or expired entries are still served
+      (up to stale_ttl_s) while one background recompute refreshes them.
+    - A compute that raced with an invalidation of its tags is not stored.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        ttl_s: float = 300.0,
+        stale_ttl_s: float = 3600.0,
+        stale_while_revalidate: bool = False,
+        search_radius_km: float = 50.0,
+        region_cell_deg: float = DEFAULT_CELL_DEG,
+        locate: Optional[Callable[[str], Optional[Tuple[float, float]]]] = None,
+        refresh: Optional[Callable[[], Any]] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.stale_ttl_s = stale_ttl_s
+        self.stale_while_revalidate = stale_while_revalidate
+        self.search_radius_km = search_radius_km
+        self.region_cell_deg = region_cell_deg
+        self._locate = locate
+        self._refresh = refresh
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._by_tag: Dict[_Tag, Set[Hashable]] = {}
+        self._tag_seq: Dict[_Tag, int] = {} # Last invalidation sequence per tag
+        self._seq = 0
+        self._cleared_seq = 0
+        self._revalidating: Set[Hashable] = set()
+        self._revalidator = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rec-cache-revalidate")
+        self.counters = {
+            "hits": 0, "stale_hits": 0, "misses": 0, "invalidations": 0,
+            "evictions": 0, "revalidations": 0, "discarded_races": 0,
+        }
+
+    # --- INTERNAL HELPERS ---
+
+    def _tags_for(self, payload: Any, lat: float, lon: float) -> FrozenSet[_Tag]:
+        """payload is a RecommendationResponse (anything with nearest_suppliers / recommended_waste)."""
+        waste_type = ANY_WASTE if not payload.nearest_suppliers else payload.recommended_waste
+        cells = cells_covering(lat, lon, self.search_radius_km, self.region_cell_deg)
+        return frozenset((waste_type, cell) for cell in cells)
+
+    def _drop(self, key: Hashable) -> None:
+        """Removes an entry and its tag links (caller holds the lock)."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def _store(self, key: Hashable, entry: _Entry) -> None:
+        self._drop(key)
+        self._entries[key] = entry
+        for tag in entry.tags:
+            self._by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.counters["evictions"] += 1
+
+    def _put(self, key: Hashable, payload: Any, lat: float, lon: float, started_seq: int) -> None:
+        tags = self._tags_for(payload, lat, lon)
+        with self._lock:
+            if started_seq < self._cleared_seq or any(self._tag_seq.get(tag, 0) > started_seq for tag in tags):
+                self.counters["discarded_races"] += 1 # Data changed while we computed: don't cache it
+                self._drop(key)
+                return
+            self._store(key, _Entry(payload, tags))
+
+    def _revalidate(self, key: Hashable, lat: float, lon: float, compute: Callable[[], Any]) -> None:
+        started_seq = self._seq
+        try:
+            self._put(key, compute(), lat, lon, started_seq)
+            with self._lock:
+                self.counters["revalidations"] += 1
+        except Exception as e:
+            print(f"WARNING: Recommendation cache revalidation failed: {e}")
+            with self._lock:
+                self._drop(key)
+        finally:
+            with self._lock:
+                self._revalidating.discard(key)
+
+    # --- PUBLIC API ---
+
+    def get_or_compute(self, key: Hashable, lat: float, lon: float, compute: Callable[[], Any]) -> Any:
+        """Returns the cached payload for key, computing (and caching) it on a miss."""
+        if self._refresh is not None:
+            self._refresh() # Merges other workers' offer changes (upsert() invalidates their entries)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry.created_at
+                if not entry.stale and age <= self.ttl_s:
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return entry.payload
+                if self.stale_while_revalidate and age <= self.stale_ttl_s:
+                    self._entries.move_to_end(key)
+                    self.counters["stale_hits"] += 1
+                    if key not in self._revalidating:
+                        self._revalidating.add(key)
+                        self._revalidator.submit(self._revalidate, key, lat, lon, compute)
+                    return entry.payload
+                self._drop(key)
+            self.counters["misses"] += 1
+            started_seq = self._seq
+
+        payload = compute()
+        self._put(key, payload, lat, lon, started_seq)
+        return payload
+
+    def invalidate_offer(self, waste_type: str, lat: float, lon: float) -> int:
+        """Invalidates entries whose search region covers a producer at (lat, lon) for this waste type."""
+        cell = grid_cell(lat, lon, self.region_cell_deg)
+        tags = ((waste_type, cell), (ANY_WASTE, cell))
+        with self._lock:
+            self._seq += 1
+            keys = set()
+            for tag in tags:
+                self._tag_seq[tag] = self._seq
+                keys |= self._by_tag.get(tag, set())
+            for key in keys:
+                if self.stale_while_revalidate:
+                    self._entries[key].stale = True
+                else:
+                    self._drop(key)
+            self.counters["invalidations"] += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._seq += 1
+            self._entries.clear()
+            self._by_tag.clear()
+            self._tag_seq.clear()
+            self._cleared_seq = self._seq # Rejects every compute that started before the clear
+
+    # --- OfferStore index protocol (see OfferStore.attach_index) ---
+
+    def upsert(self, record: Mapping[str, Any]) -> None:
+        """Called by OfferStore whenever an offer is added or changes (reserved, sold out, ...)."""
+        location = self._locate(record['producer_id']) if self._locate is not None else None
+        if location is not None:
+            self.invalidate_offer(record['waste_type'], *location)
+
+    def remove(self, record: Mapping[str, Any]) -> None:
+        """Called when an offer is dropped (its append never committed)."""
+        self.upsert(record)
+
+    def rebuild(self, records: Iterable[Mapping[str, Any]]) -> None:
+        self.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["stale_hits"] + self.counters["misses"]
+            hit_total = self.counters["hits"] + self.counters["stale_hits"]
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "hit_ratio": round(hit_total / lookups, 4) if lookups else 0.0,
+            }
+
+    def close(self) -> None:
+        self._revalidator.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,205 @@
+# app/services/recommendation_table.py
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+from app.config.state import APP_STATE
+from app.config.data_loader import CSV_DATASETS, MODEL_FILE, load_csv_dataset, load_waste_model
+
+CROP_CSV = CSV_DATASETS['CROP_DF'][0]
+WASTE_CSV = CSV_DATASETS['WASTE_DF_PROCESSED'][0]
+
+SOURCE_CHECK_INTERVAL_S = 5.0 # How often (at most) source files are stat()ed for changes
+PREDICT_MEMO_SIZE = 4096
+
+
+@dataclass(frozen=True)
+class CropRecommendation:
+    """Precomputed model output for one crop (everything that depends only on crop type)."""
+    crop: str
+    N: float
+    P: float
+    K: float
+    predicted_class: str
+    best_waste_type: str
+
+    def __getitem__(self, nutrient: str) -> float:
+        # Lets the entry stand in for the old crop target row (entry['N'], ...)
+        return getattr(self, nutrient)
+
+
+class CropRecommendationTable:
+    """
+    crop -> (predicted class, best waste type), computed with ONE batched model call
+    at build time. Unseen NPK targets go through a small memoized predict path, so
+    sklearn is off the request hot path.
+    """
+
+    def __init__(self, crop_df: pd.DataFrame, waste_model: Any, waste_df_processed: pd.DataFrame):
+        self._model = waste_model
+        # First waste row per target class (same as the old .iloc[0] scan)
+        first_per_class = waste_df_processed.drop_duplicates(subset='target_class', keep='first')
+        self._waste_by_class: Dict[str, str] = dict(
+            zip(first_per_class['target_class'], first_per_class['Waste_Type'])
+        )
+
+        crops = crop_df.drop_duplicates(subset='label', keep='first')
+        predictions = waste_model.predict(crops[['N', 'P', 'K']]) if len(crops) else []
+
+        self._by_crop: Dict[str, CropRecommendation] = {}
+        for (label, n, p, k), predicted_class in zip(
+            crops[['label', 'N', 'P', 'K']].itertuples(index=False), predictions
+        ):
+            self._by_crop[str(label).lower()] = self._entry(str(label), n, p, k, predicted_class)
+
+        self._memo_lock = threading.Lock()
+        self._predict_memo: "OrderedDict[Tuple[float, float, float], str]" = OrderedDict()
+
+    def _entry(self, crop: str, n: float, p: float, k: float, predicted_class: Any) -> CropRecommendation:
+        predicted_class = str(predicted_class)
+        return CropRecommendation(
+            crop=crop,
+            N=float(n), P=float(p), K=float(k),
+            predicted_class=predicted_class,
+            best_waste_type=self._waste_by_class[predicted_class],
+        )
+
+    def __len__(self) -> int:
+        return len(self._by_crop)
+
+    def predict_class(self, n: float, p: float, k: float) -> str:
+        """Memoized model call for NPK targets not in the precomputed table."""
+        key = (float(n), float(p), float(k))
+        with self._memo_lock:
+            cached = self._predict_memo.get(key)
+            if cached is not None:
+                self._predict_memo.move_to_end(key)
+                return cached
+        features = pd.DataFrame([key], columns=['N', 'P', 'K'])
+        predicted_class = str(self._model.predict(features)[0])
+        with self._memo_lock:
+            self._predict_memo[key] = predicted_class
+            if len(self._predict_memo) > PREDICT_MEMO_SIZE:
+                self._predict_memo.popitem(last=False)
+        return predicted_class
+
+    def lookup(self, crop_type: str, crop_df: Optional[pd.DataFrame] = None) -> Optional[CropRecommendation]:
+        """
+        O(1) crop lookup. If the crop is missing from the table but present in crop_df
+        (e.g. added after the build), it is resolved through the memoized predict path.
+        """
+        crop_key = crop_type.lower()
+        entry = self._by_crop.get(crop_key)
+        if entry is not None or crop_df is None:
+            return entry
+
+        rows = crop_df[crop_df['label'] == crop_key]
+        if rows.empty:
+            return None
+        n, p, k = rows[['N', 'P', 'K']].values[0]
+        entry = self._entry(crop_key, n, p, k, self.predict_class(n, p, k))
+        self._by_crop[crop_key] = entry
+        return entry
+
+
+# =======================================================
+#               SHARED TABLE + INVALIDATION
+# =======================================================
+
+_TABLE_LOCK = threading.Lock()
+_last_source_check = 0.0
+_checking = False # A background source check is running
+
+
+def _source_signature(data_path: Path) -> Tuple:
+    """(mtime_ns, size) of every file the table is derived from."""
+    signature = []
+    for name in (CROP_CSV, WASTE_CSV, MODEL_FILE):
+        try:
+            stat = (data_path / name).stat()
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append((name, None, None))
+    return tuple(signature)
+
+
+def _load_sources(data_path: Path) -> Dict[str, Any]:
+    """Re-reads the CSVs (refreshing their snapshots) and the joblib model."""
+    return {
+        'CROP_DF': load_csv_dataset(data_path, 'CROP_DF'),
+        'WASTE_DF_PROCESSED': load_csv_dataset(data_path, 'WASTE_DF_PROCESSED'),
+        'WASTE_MODEL': load_waste_model(data_path),
+    }
+
+
+def build_recommendation_table() -> CropRecommendationTable:
+    """(Re)builds the table from APP_STATE and records the source file signature."""
+    table = CropRecommendationTable(
+        APP_STATE['CROP_DF'], APP_STATE['WASTE_MODEL'], APP_STATE['WASTE_DF_PROCESSED']
+    )
+    APP_STATE['RECOMMENDATION_TABLE'] = table
+    data_path = APP_STATE.get('DATA_PATH')
+    APP_STATE['RECOMMENDATION_TABLE_SOURCES'] = _source_signature(data_path) if data_path else None
+    return table
+
+
+def _check_sources(data_path: Path) -> None:
+    """
+    Background thread: if a source file changed, loads the new sources and builds a new
+    table off the request path, then swaps it in (requests keep the old table until then).
+    """
+    global _checking
+    try:
+        signature = _source_signature(data_path)
+        if APP_STATE.get('RECOMMENDATION_TABLE') is not None and signature != APP_STATE.get('RECOMMENDATION_TABLE_SOURCES'):
+            print("INFO: Crop/waste data or model changed on disk; rebuilding recommendation table.")
+            sources = _load_sources(data_path)
+            table = CropRecommendationTable(sources['CROP_DF'], sources['WASTE_MODEL'], sources['WASTE_DF_PROCESSED'])
+            APP_STATE.update(sources)
+            APP_STATE['RECOMMENDATION_TABLE'] = table # Single reference swap
+            APP_STATE['RECOMMENDATION_TABLE_SOURCES'] = signature # From before the load: a later edit is seen next check
+    except Exception as e:
+        print(f"WARNING: Could not rebuild recommendation table, keeping the current one: {e}")
+    finally:
+        with _TABLE_LOCK:
+            _checking = False
+
+
+def _schedule_source_check(data_path: Path, now: float) -> None:
+    global _last_source_check, _checking
+    with _TABLE_LOCK:
+        if _checking or now - _last_source_check < SOURCE_CHECK_INTERVAL_S:
+            return
+        _last_source_check = now
+        _checking = True
+    threading.Thread(target=_check_sources, args=(data_path,), name="recommendation-table-check", daemon=True).start()
+
+
+def get_recommendation_table() -> CropRecommendationTable:
+    """
+    Returns the shared table without ever waiting on disk: at most every
+    SOURCE_CHECK_INTERVAL_S a background thread stats the model and CSV files and,
+    if any changed, reloads them and swaps in a rebuilt table (_check_sources).
+    Only the very first call (no table yet) builds synchronously.
+    """
+    table = APP_STATE.get('RECOMMENDATION_TABLE')
+    data_path = APP_STATE.get('DATA_PATH')
+    if table is None:
+        with _TABLE_LOCK:
+            table = APP_STATE.get('RECOMMENDATION_TABLE')
+            if table is None:
+                if data_path is not None and any(APP_STATE.get(key) is None for key in ('CROP_DF', 'WASTE_DF_PROCESSED', 'WASTE_MODEL')):
+                    APP_STATE.update(_load_sources(data_path))
+                table = build_recommendation_table()
+        return table
+
+    if data_path is not None:
+        now = time.monotonic()
+        if now - _last_source_check >= SOURCE_CHECK_INTERVAL_S:
+            _schedule_source_check(data_path, now)
+    return table
@@ -0,0 +1,258 @@
+# app/services/regional_store.py
+import heapq
+import os
+import sqlite3
+from concurrent.futures import Future
+from contextlib import contextmanager
+from itertools import chain, islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import pandas as pd
+
+from app.services.offer_index import _cost_key
+from app.services.offer_store import OFFER_COLUMNS, OfferStore
+from app.services.regions import DEFAULT_REGION
+
+
+# =======================================================
+#               REGION-SHARDED OFFER STORE
+# =======================================================
+
+class RegionalOfferStore:
+    """
+    Offers partitioned by their producer's region: one OfferStore (own SQLite WAL
+    file, writer thread, offer index) per region under shard_dir, so writes to one
+    city never wait on another city's write lock and a local search only reads the
+    shards it overlaps. Exposes the OfferStore API; writes go to the shard already
+    holding the offer id (else the producer's), reads are fanned out and merged
+    (reads by offer id, exports, batch scans).
+
+    The home store (offers.db) is the DEFAULT_REGION shard. It also keeps the
+    tables that are not per region (upload jobs, users, token revocations):
+    write_transaction() / read_connection() go there.
+    """
+
+    def __init__(
+        self,
+        home_path: Path,
+        shard_dir: Path,
+        regions: Iterable[str],
+        region_of_producer: Callable[[str], Optional[str]],
+        **store_options: Any,
+    ):
+        self.home = OfferStore(home_path, **store_options)
+        self._region_of_producer = region_of_producer
+        self._shards: Dict[str, OfferStore] = {DEFAULT_REGION: self.home}
+        shard_dir = Path(shard_dir)
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        for region in sorted(set(regions) - {DEFAULT_REGION}):
+            self._shards[region] = OfferStore(shard_dir / f"{region}.db", **store_options)
+
+    # --- ROUTING ---
+
+    @property
+    def shards(self) -> Dict[str, OfferStore]:
+        return self._shards
+
+    def shard_for_producer(self, producer_id: str) -> OfferStore:
+        """The producer's region shard (home for unknown producers or regions created after startup)."""
+        return self._shards.get(self._region_of_producer(producer_id) or DEFAULT_REGION, self.home)
+
+    def shard_for_offer(self, offer_id: str) -> Optional[OfferStore]:
+        for shard in self._shards.values():
+            if shard.get(offer_id) is not None:
+                return shard
+        return None
+
+    def _shards_for(self, regions: Optional[Iterable[str]]) -> List[OfferStore]:
+        if regions is None:
+            return list(self._shards.values())
+        shards = {id(shard): shard for shard in (self._shards.get(region, self.home) for region in regions)}
+        return list(shards.values())
+
+    def shard_for_write(self, record: Dict[str, Any]) -> OfferStore:
+        """
+        The shard that already holds record's offer id, else its producer's shard. An offer
+        is never copied into a second shard (its reservations live next to it), even when a
+        write names a producer from another region.
+        """
+        return self.shard_for_offer(record['offer_id']) or self.shard_for_producer(record['producer_id'])
+
+    def _group_by_shard(
+        self,
+        records: Iterable[Dict[str, Any]],
+        route: Optional[Callable[[Dict[str, Any]], OfferStore]] = None,
+    ) -> Dict[int, Tuple[OfferStore, List[Dict[str, Any]]]]:
+        """Records grouped by shard (by producer unless `route` is given)."""
+        route = route or (lambda record: self.shard_for_producer(record['producer_id']))
+        groups: Dict[int, Tuple[OfferStore, List[Dict[str, Any]]]] = {}
+        for record in records:
+            shard = route(record)
+            groups.setdefault(id(shard), (shard, []))[1].append(record)
+        return groups
+
+    # --- STARTUP / MIGRATION ---
+
+    def import_csv(self, csv_path: Path) -> int:
+        """One-time migration: splits offers.csv across the (all empty) shards. Returns rows imported."""
+        if len(self) or not Path(csv_path).exists():
+            return 0
+        records = pd.read_csv(csv_path).to_dict('records')
+        return sum(shard.import_records(group) for shard, group in self._group_by_shard(records).values())
+
+    def rehome_offers(self) -> int:
+        """
+        Moves offers whose producer now belongs to a region shard out of the home store
+        (stores created before sharding kept every offer in offers.db). Rows a shard
+        already holds are never overwritten. Returns the number of offers moved.
+        """
+        moved: List[str] = []
+        for shard, records in self._group_by_shard(self.home.records()).values():
+            if shard is self.home:
+                continue
+            shard.upsert_many([record for record in records if shard.get(record['offer_id']) is None])
+            moved.extend(record['offer_id'] for record in records)
+        if not moved:
+            return 0
+        with self.home.write_transaction() as (conn, _):
+            conn.executemany("DELETE FROM offers WHERE offer_id = ?", [(offer_id,) for offer_id in moved])
+        self.home.reload()
+        print(f"INFO: Moved {len(moved)} offers from offers.db into their region shards")
+        return len(moved)
+
+    # --- WRITES ---
+
+    def append(self, record: Dict[str, Any]) -> Future:
+        return self.shard_for_write(record).append(record)
+
+    def upsert_many(self, records: List[Dict[str, Any]]) -> int:
+        """
+        One transaction per region touched (each durable on return). Existing offers are
+        updated in the shard that holds them (see shard_for_write). Returns rows written.
+        """
+        self.refresh(force=True) # Route by every offer id committed so far, by any worker
+        groups = self._group_by_shard(records, self.shard_for_write)
+        return sum(shard.upsert_many(group) for shard, group in groups.values())
+
+    def apply_committed(self, record: Dict[str, Any]) -> None:
+        self.shard_for_write(record).apply_committed(record)
+
+    def attach_index(self, index: Any) -> None:
+        """Attaches one index to every shard, filled once with the offers of all regions."""
+        index.rebuild(chain.from_iterable(shard.records() for shard in self._shards.values()))
+        for shard in self._shards.values():
+            shard.attach_index(index, rebuild=False)
+
+    def flush(self) -> None:
+        for shard in self._shards.values():
+            shard.flush()
+
+    @contextmanager
+    def write_transaction(self) -> Iterator[Tuple[sqlite3.Connection, int]]:
+        """Transaction on the home database (cross-region tables, not offers)."""
+        with self.home.write_transaction() as transaction:
+            yield transaction
+
+    @contextmanager
+    def read_connection(self) -> Iterator[sqlite3.Connection]:
+        """Pooled reader on the home database (cross-region tables, not offers)."""
+        with self.home.read_connection() as conn:
+            yield conn
+
+    # --- READS ---
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards.values())
+
+    def get(self, offer_id: str) -> Optional[Dict[str, Any]]:
+        for shard in self._shards.values():
+            record = shard.get(offer_id)
+            if record is not None:
+                return record
+        return None
+
+    def records(self) -> List[Dict[str, Any]]:
+        return [record for shard in self._shards.values() for record in shard.records()]
+
+    def read_committed(self, offer_id: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        for shard in self._shards.values():
+            committed = shard.read_committed(offer_id)
+            if committed is not None:
+                return committed
+        return None
+
+    def cheapest_available(
+        self,
+        waste_type: str,
+        producer_distances: Mapping[str, float],
+        k: int = 5,
+        regions: Optional[Iterable[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Top-k by (cost, distance) over the shards of `regions` (the regions of the
+        producers in producer_distances when omitted). Each shard returns its own
+        top-k from its index; the union is re-ranked.
+        """
+        if regions is None:
+            regions = {self._region_of_producer(producer_id) or DEFAULT_REGION for producer_id in producer_distances}
+        shards = self._shards_for(regions)
+        if len(shards) == 1:
+            return shards[0].cheapest_available(waste_type, producer_distances, k)
+        candidates = [offer for shard in shards for offer in shard.cheapest_available(waste_type, producer_distances, k)]
+        candidates.sort(key=lambda offer: (_cost_key(offer['cost_per_kg']), offer['distance_km']))
+        return candidates[:k]
+
+    def available_offers(self, waste_type: str, regions: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Available offers of one waste type across the given regions (default: all), cheapest first."""
+        per_shard = [shard.available_offers(waste_type) for shard in self._shards_for(regions)]
+        return list(heapq.merge(*per_shard, key=lambda offer: _cost_key(offer['cost_per_kg'])))
+
+    def dataframe(self) -> pd.DataFrame:
+        """All regions as one DataFrame (each shard caches its own frame)."""
+        return pd.concat([shard.dataframe() for shard in self._shards.values()], ignore_index=True)
+
+    def refresh(self, force: bool = False) -> int:
+        return sum(shard.refresh(force) for shard in self._shards.values())
+
+    # --- KEYSET PAGINATION (merged across shards, ordered by offer_id) ---
+
+    def page_committed(
+        self,
+        after: Optional[str],
+        limit: int,
+        waste_type: Optional[str] = None,
+        available_only: bool = False,
+    ) -> List[Dict[str, Any]]:
+        pages = [shard.page_committed(after, limit, waste_type, available_only) for shard in self._shards.values()]
+        return list(islice(heapq.merge(*pages, key=lambda record: record['offer_id']), limit))
+
+    def cursor_after(
+        self,
+        after: Optional[str],
+        count: int,
+        waste_type: Optional[str] = None,
+        available_only: bool = False,
+    ) -> Optional[str]:
+        """The offer_id ending a page of `count` rows after `after`, or None if there is no next page."""
+        ids = [shard.committed_ids_after(after, count + 1, waste_type, available_only) for shard in self._shards.values()]
+        merged = list(islice(heapq.merge(*ids), count + 1))
+        return merged[count - 1] if len(merged) == count + 1 else None
+
+    # --- COMPACTION / SHUTDOWN ---
+
+    def snapshot(self, csv_path: Optional[Path] = None) -> None:
+        """Checkpoints every shard's WAL and optionally exports one combined CSV snapshot."""
+        for shard in self._shards.values():
+            shard.snapshot()
+        if csv_path is not None:
+            tmp_path = Path(f"{csv_path}.{os.getpid()}.tmp")
+            self.dataframe()[OFFER_COLUMNS].to_csv(tmp_path, index=False)
+            os.replace(tmp_path, csv_path)
+
+    def close(self) -> None:
+        for shard in self._shards.values():
+            shard.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {region: len(shard) for region, shard in self._shards.items()}
@@ -0,0 +1,197 @@
+# app/services/regions.py
+import math
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.geo_index import DEFAULT_CELL_DEG, ProducerGeoIndex, haversine_km
+
+# Producers with no city (and no city within reach) live in this region; its offers stay in offers.db
+DEFAULT_REGION = 'unassigned'
+
+
+def region_key(city) -> str:
+    """'Delhi_NCR' -> 'delhi_ncr'. Also used as the shard's file name, so only [a-z0-9_] survive."""
+    if city is None or (isinstance(city, float) and math.isnan(city)):
+        return DEFAULT_REGION
+    return re.sub(r'[^a-z0-9]+', '_', str(city).strip().lower()).strip('_') or DEFAULT_REGION
+
+
+class RegionExtent:
+    """Bounding box of a region's producers (grows as producers are added)."""
+
+    __slots__ = ('min_lat', 'max_lat', 'min_lon', 'max_lon')
+
+    def __init__(self, lat: float, lon: float):
+        self.min_lat = self.max_lat = lat
+        self.min_lon = self.max_lon = lon
+
+    def include(self, lat: float, lon: float) -> None:
+        self.min_lat, self.max_lat = min(self.min_lat, lat), max(self.max_lat, lat)
+        self.min_lon, self.max_lon = min(self.min_lon, lon), max(self.max_lon, lon)
+
+    def distance_km(self, lat: float, lon: float) -> float:
+        """Distance from a point to the nearest point of the box (0 inside it)."""
+        nearest_lat = min(max(lat, self.min_lat), self.max_lat)
+        nearest_lon = min(max(lon, self.min_lon), self.max_lon)
+        return float(haversine_km(lat, lon, nearest_lat, nearest_lon))
+
+
+# =======================================================
+#               REGION-SHARDED PRODUCER INDEX
+# =======================================================
+
+class RegionalProducerIndex:
+    """
+    One ProducerGeoIndex per region (the producer table's `city`). A radius query
+    first picks the regions whose extent comes within the radius, then searches
+    only those shards, so a national producer table costs a local search the same
+    as one city does. Same read API as ProducerGeoIndex, plus region lookups used
+    to route offers to their region's store (see RegionalOfferStore).
+
+    A producer keeps its region for life: its offers are stored in that region's shard.
+    """
+
+    def __init__(self, cell_deg: float = DEFAULT_CELL_DEG, assign_radius_km: float = 50.0):
+        self.cell_deg = cell_deg
+        self.assign_radius_km = assign_radius_km
+        self._shards: Dict[str, ProducerGeoIndex] = {}
+        self._extents: Dict[str, RegionExtent] = {}
+        self._regions: Dict[str, str] = {} # producer_id -> region
+        self._flat: Optional[Tuple[List[str], np.ndarray, np.ndarray, Dict[str, int]]] = None # Cross-region view (batch path)
+
+    @classmethod
+    def from_dataframe(
+        cls, producer_df: pd.DataFrame, cell_deg: float = DEFAULT_CELL_DEG, assign_radius_km: float = 50.0
+    ) -> "RegionalProducerIndex":
+        """Builds the index from producer_id/latitude/longitude (+ optional city) columns."""
+        index = cls(cell_deg=cell_deg, assign_radius_km=assign_radius_km)
+        cities = producer_df['city'] if 'city' in producer_df.columns else [None] * len(producer_df)
+        for producer_id, lat, lon, city in zip(
+            producer_df['producer_id'], producer_df['latitude'], producer_df['longitude'], cities
+        ):
+            index.add(producer_id, lat, lon, region_key(city))
+        return index
+
+    # --- REGIONS ---
+
+    @property
+    def regions(self) -> List[str]:
+        return list(self._shards)
+
+    def region_of(self, producer_id: str) -> Optional[str]:
+        return self._regions.get(producer_id)
+
+    def region_for(self, lat: float, lon: float) -> str:
+        """Region for a new producer without a city: the nearest region within assign_radius_km."""
+        best, best_distance = DEFAULT_REGION, self.assign_radius_km
+        for region, extent in self._extents.items():
+            if region == DEFAULT_REGION:
+                continue
+            distance = extent.distance_km(lat, lon)
+            if distance <= best_distance:
+                best, best_distance = region, distance
+        return best
+
+    def regions_within(self, lat: float, lon: float, radius_km: float) -> List[str]:
+        """Regions that may hold producers within radius_km of (lat, lon)."""
+        return [region for region, extent in self._extents.items() if extent.distance_km(lat, lon) <= radius_km]
+
+    def regions_within_many(self, lat: np.ndarray, lon: np.ndarray, radius_km: float) -> Tuple[List[str], np.ndarray]:
+        """Vectorized regions_within for many points: (regions, mask[point, region])."""
+        regions = list(self._extents)
+        if not regions:
+            return regions, np.zeros((len(lat), 0), dtype=bool)
+        box = np.array([(e.min_lat, e.max_lat, e.min_lon, e.max_lon) for e in self._extents.values()], dtype=np.float64)
+        lat, lon = np.asarray(lat, dtype=np.float64)[:, None], np.asarray(lon, dtype=np.float64)[:, None]
+        nearest_lat = np.clip(lat, box[:, 0], box[:, 1])
+        nearest_lon = np.clip(lon, box[:, 2], box[:, 3])
+        return regions, haversine_km(lat, lon, nearest_lat, nearest_lon) <= radius_km
+
+    def shard(self, region: str) -> Optional[ProducerGeoIndex]:
+        return self._shards.get(region)
+
+    # --- WRITES ---
+
+    def add(self, producer_id: str, lat: float, lon: float, region: Optional[str] = None) -> str:
+        """Adds (or moves) a producer and returns its region. Existing producers never change region."""
+        lat, lon = float(lat), float(lon)
+        region = self._regions.get(producer_id) or region or self.region_for(lat, lon)
+        shard = self._shards.get(region)
+        if shard is None:
+            shard = self._shards[region] = ProducerGeoIndex(cell_deg=self.cell_deg)
+        shard.add(producer_id, lat, lon)
+        if region in self._extents:
+            self._extents[region].include(lat, lon)
+        else:
+            self._extents[region] = RegionExtent(lat, lon)
+        self._regions[producer_id] = region
+        self._flat = None
+        return region
+
+    # --- READS (ProducerGeoIndex API) ---
+
+    def __len__(self) -> int:
+        return len(self._regions)
+
+    def __contains__(self, producer_id: str) -> bool:
+        return producer_id in self._regions
+
+    def location(self, producer_id: str) -> Tuple[float, float] | None:
+        region = self._regions.get(producer_id)
+        return self._shards[region].location(producer_id) if region is not None else None
+
+    def query_radius(
+        self, lat: float, lon: float, radius_km: float, regions: Optional[Iterable[str]] = None
+    ) -> Tuple[List[str], np.ndarray]:
+        """
+        (producer_ids, distances_km) within radius_km, searching only the shards of
+        `regions` (default: the regions within the radius).
+        """
+        if regions is None:
+            regions = self.regions_within(lat, lon, radius_km)
+        ids: List[str] = []
+        distances: List[np.ndarray] = []
+        for region in regions:
+            shard_ids, shard_distances = self._shards[region].query_radius(lat, lon, radius_km)
+            ids.extend(shard_ids)
+            distances.append(shard_distances)
+        if not ids:
+            return [], np.empty(0, dtype=np.float64)
+        return ids, np.concatenate(distances)
+
+    def _flat_view(self) -> Tuple[List[str], np.ndarray, np.ndarray, Dict[str, int]]:
+        flat = self._flat
+        if flat is None:
+            ids: List[str] = []
+            lats, lons = [], []
+            for shard in self._shards.values():
+                ids.extend(shard.producer_ids)
+                shard_lat, shard_lon = shard.coordinates()
+                lats.append(shard_lat)
+                lons.append(shard_lon)
+            lat = np.concatenate(lats) if lats else np.empty(0, dtype=np.float64)
+            lon = np.concatenate(lons) if lons else np.empty(0, dtype=np.float64)
+            lat.flags.writeable = False
+            lon.flags.writeable = False
+            flat = self._flat = (ids, lat, lon, {producer_id: pos for pos, producer_id in enumerate(ids)})
+        return flat
+
+    @property
+    def producer_ids(self) -> List[str]:
+        return self._flat_view()[0]
+
+    def coordinates(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(lat, lon) over every region, in producer_ids order. Built once per change, for the batch path."""
+        _, lat, lon, _ = self._flat_view()
+        return lat, lon
+
+    def positions_of(self, producer_ids) -> np.ndarray:
+        """Maps producer ids to their row in coordinates() (-1 for unknown producers)."""
+        positions = self._flat_view()[3]
+        return np.fromiter((positions.get(pid, -1) for pid in producer_ids), dtype=np.int64, count=len(producer_ids))
+
+    def stats(self) -> Dict[str, int]:
+        return {region: len(shard) for region, shard in self._shards.items()}
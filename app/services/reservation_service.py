@@ -0,0 +1,302 @@
+# app/services/reservation_service.py
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from app.services.offer_store import OfferStore
+from app.services.regional_store import RegionalOfferStore
+from app.services.metrics import METRICS
+
+RESERVATION_LOCK_STRIPES = 64
+MAX_CAS_RETRIES = 8
+_IN_BATCH = 500 # Ids per "IN (...)" query, under SQLite's bound-parameter limit
+
+CAS_RETRIES = METRICS.counter(
+    "marketplace_reservation_cas_retries_total", "Reservation attempts that lost a compare-and-swap race and retried."
+)
+
+_CREATE_RESERVATIONS_SQL = """
+CREATE TABLE IF NOT EXISTS reservations (
+    reservation_id TEXT PRIMARY KEY,
+    offer_id       TEXT NOT NULL,
+    buyer_id       TEXT,
+    quantity_kg    REAL NOT NULL,
+    status         TEXT NOT NULL,
+    created_at     REAL NOT NULL,
+    expires_at     REAL NOT NULL
+)
+"""
+_RESERVATION_COLUMNS = ['reservation_id', 'offer_id', 'buyer_id', 'quantity_kg', 'status', 'created_at', 'expires_at']
+
+# Compare-and-swap decrement: only applies if nobody changed the offer since we read it
+_CAS_DECREMENT_SQL = """
+UPDATE offers
+SET quantity_kg = ?, is_available = ?, version = version + 1, change_seq = ?
+WHERE offer_id = ? AND version = ?
+"""
+# Give stock back. Re-open the offer only if it was closed by running out of stock.
+_RESTOCK_SQL = """
+UPDATE offers
+SET is_available = CASE WHEN quantity_kg <= 0 THEN 1 ELSE is_available END,
+    quantity_kg = quantity_kg + ?, version = version + 1, change_seq = ?
+WHERE offer_id = ?
+"""
+
+
+class ReservationError(Exception):
+    """Base class for reservation failures (mapped to HTTP errors by the routes)."""
+
+
+class OfferNotFoundError(ReservationError):
+    pass
+
+
+class InsufficientStockError(ReservationError):
+    pass
+
+
+class ReservationConflictError(ReservationError):
+    """The offer kept changing under us (CAS retries exhausted)."""
+
+
+class ReservationNotFoundError(ReservationError):
+    pass
+
+
+class ReservationExpiredError(ReservationError):
+    pass
+
+
+class ReservationForbiddenError(ReservationError):
+    """The caller is not the buyer holding the reservation."""
+
+
+class ReservationAuthRequiredError(ReservationForbiddenError):
+    """An anonymous caller touched a reservation held by a signed-in buyer."""
+
+
+class _CasMismatch(Exception):
+    pass
+
+
+# =======================================================
+#               RESERVATIONS (optimistic concurrency)
+# =======================================================
+
+class ReservationService:
+    """
+    Stock holds on top of the offer store. Each reservation lives in the same region
+    shard (SQLite file) as its offer, so the hold and the stock decrement commit in
+    one transaction and holds in different cities never share a write lock.
+
+    - reserve() reads the offer's version, then decrements quantity with a
+      compare-and-swap UPDATE (WHERE version = ?). A lost race simply retries.
+    - In-process contention is per offer (striped locks), never a lock over the
+      whole offers table; cross-worker races are caught by the version check.
+    - An offer whose quantity reaches zero is marked unavailable in the same
+      transaction, so it drops out of the offer index immediately.
+    - Holds expire: release_expired() returns their stock and re-opens the offer.
+    """
+
+    def __init__(self, store: RegionalOfferStore):
+        self.store = store
+        self._stripes = [threading.Lock() for _ in range(RESERVATION_LOCK_STRIPES)]
+        for shard in store.shards.values():
+            with shard.write_transaction() as (conn, _):
+                conn.execute(_CREATE_RESERVATIONS_SQL)
+                conn.execute("CREATE INDEX IF NOT EXISTS reservations_expiry ON reservations(status, expires_at)")
+                conn.execute("CREATE INDEX IF NOT EXISTS reservations_offer ON reservations(offer_id, status)")
+        self._rehome_reservations()
+
+    def _rehome_reservations(self) -> None:
+        """Moves reservations whose offer lives in another shard (offers moved by rehome_offers) next to it."""
+        for shard in self.store.shards.values():
+            with shard.read_connection() as conn:
+                orphans = [dict(row) for row in conn.execute(
+                    f"SELECT {', '.join(_RESERVATION_COLUMNS)} FROM reservations r "
+                    f"WHERE NOT EXISTS (SELECT 1 FROM offers o WHERE o.offer_id = r.offer_id)"
+                ).fetchall()]
+            for reservation in orphans:
+                target = self.store.shard_for_offer(reservation['offer_id'])
+                if target is None or target is shard:
+                    continue
+                with target.write_transaction() as (conn, _):
+                    conn.execute(
+                        f"INSERT OR IGNORE INTO reservations ({', '.join(_RESERVATION_COLUMNS)}) "
+                        f"VALUES ({', '.join('?' for _ in _RESERVATION_COLUMNS)})",
+                        tuple(reservation[c] for c in _RESERVATION_COLUMNS),
+                    )
+                with shard.write_transaction() as (conn, _):
+                    conn.execute("DELETE FROM reservations WHERE reservation_id = ?", (reservation['reservation_id'],))
+
+    def _stripe(self, offer_id: str) -> threading.Lock:
+        return self._stripes[zlib.crc32(offer_id.encode()) % RESERVATION_LOCK_STRIPES]
+
+    def _read_offer(self, offer_id: str):
+        """Returns (shard, record, version) of an offer, committed state."""
+        shard = self.store.shard_for_offer(offer_id)
+        if shard is None:
+            raise OfferNotFoundError(offer_id)
+        committed = shard.read_committed(offer_id)
+        if committed is None:
+            shard.flush() # Offer was appended moments ago and is still in the group-commit queue
+            committed = shard.read_committed(offer_id)
+        if committed is None:
+            raise OfferNotFoundError(offer_id)
+        return (shard,) + committed
+
+    def held_offer_ids(self, offer_ids: Iterable[str]) -> Set[str]:
+        """The subset of offer_ids with at least one live hold (read from each offer's shard)."""
+        by_shard: Dict[int, tuple] = {}
+        for offer_id in offer_ids:
+            shard = self.store.shard_for_offer(offer_id)
+            if shard is not None:
+                by_shard.setdefault(id(shard), (shard, []))[1].append(offer_id)
+        held: Set[str] = set()
+        for shard, ids in by_shard.values():
+            with shard.read_connection() as conn:
+                for start in range(0, len(ids), _IN_BATCH):
+                    batch = ids[start:start + _IN_BATCH]
+                    rows = conn.execute(
+                        f"SELECT DISTINCT offer_id FROM reservations WHERE status = 'held' "
+                        f"AND offer_id IN ({', '.join('?' for _ in batch)})",
+                        batch,
+                    ).fetchall()
+                    held.update(row['offer_id'] for row in rows)
+        return held
+
+    def _locate(self, reservation_id: str) -> OfferStore:
+        """The shard holding a reservation (one primary-key lookup per region)."""
+        for shard in self.store.shards.values():
+            with shard.read_connection() as conn:
+                if conn.execute("SELECT 1 FROM reservations WHERE reservation_id = ?", (reservation_id,)).fetchone():
+                    return shard
+        raise ReservationNotFoundError(reservation_id)
+
+    def reserve(self, offer_id: str, quantity_kg: float, buyer_id: Optional[str], hold_s: float) -> Dict[str, Any]:
+        """Holds quantity_kg of an offer for hold_s seconds. Returns the reservation."""
+        if quantity_kg <= 0:
+            raise ValueError("quantity_kg must be positive.")
+
+        with self._stripe(offer_id):
+            for _ in range(MAX_CAS_RETRIES):
+                shard, record, version = self._read_offer(offer_id)
+                available_kg = record['quantity_kg'] or 0.0
+                if not record['is_available']:
+                    raise InsufficientStockError(f"Offer '{offer_id}' is not available.")
+                if available_kg < quantity_kg:
+                    raise InsufficientStockError(
+                        f"Offer '{offer_id}' has {available_kg:g} kg available, requested {quantity_kg:g} kg."
+                    )
+
+                remaining = available_kg - quantity_kg
+                now = time.time()
+                reservation = {
+                    'reservation_id': f"R-{uuid.uuid4().hex[:12].upper()}",
+                    'offer_id': offer_id,
+                    'buyer_id': buyer_id,
+                    'quantity_kg': quantity_kg,
+                    'status': 'held',
+                    'created_at': now,
+                    'expires_at': now + hold_s,
+                }
+                try:
+                    with shard.write_transaction() as (conn, seq):
+                        cursor = conn.execute(
+                            _CAS_DECREMENT_SQL, (remaining, int(remaining > 0), seq, offer_id, version)
+                        )
+                        if cursor.rowcount == 0:
+                            raise _CasMismatch() # Another worker won the race: re-read and retry
+                        conn.execute(
+                            f"INSERT INTO reservations ({', '.join(_RESERVATION_COLUMNS)}) "
+                            f"VALUES ({', '.join('?' for _ in _RESERVATION_COLUMNS)})",
+                            tuple(reservation[c] for c in _RESERVATION_COLUMNS),
+                        )
+                except _CasMismatch:
+                    CAS_RETRIES.inc()
+                    continue
+
+                shard.apply_committed({**record, 'quantity_kg': remaining, 'is_available': remaining > 0})
+                return reservation
+
+        raise ReservationConflictError(f"Offer '{offer_id}' is under heavy contention, try again.")
+
+    def _get(self, conn, reservation_id: str, caller_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Loads a reservation for its caller (None = anonymous). A reservation held by a
+        buyer only accepts that buyer; anonymous holds (no buyer_id) accept anyone.
+        """
+        row = conn.execute(
+            f"SELECT {', '.join(_RESERVATION_COLUMNS)} FROM reservations WHERE reservation_id = ?", (reservation_id,)
+        ).fetchone()
+        if row is None:
+            raise ReservationNotFoundError(reservation_id)
+        if row['buyer_id'] is not None and row['buyer_id'] != caller_id:
+            if caller_id is None:
+                raise ReservationAuthRequiredError(reservation_id)
+            raise ReservationForbiddenError(reservation_id)
+        return dict(row)
+
+    def confirm(self, reservation_id: str, caller_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Turns a live hold into a sale. The stock was already decremented by reserve().
+        caller_id is the authenticated caller (None when anonymous), checked by _get().
+        """
+        with self._locate(reservation_id).write_transaction() as (conn, _):
+            reservation = self._get(conn, reservation_id, caller_id)
+            if reservation['status'] == 'confirmed':
+                return reservation
+            if reservation['status'] != 'held' or reservation['expires_at'] <= time.time():
+                raise ReservationExpiredError(reservation_id)
+            conn.execute("UPDATE reservations SET status = 'confirmed' WHERE reservation_id = ?", (reservation_id,))
+        reservation['status'] = 'confirmed'
+        return reservation
+
+    def release(self, reservation_id: str, caller_id: Optional[str] = None) -> Dict[str, Any]:
+        """Cancels a hold and returns its quantity to the offer (no-op if it is no longer held)."""
+        shard = self._locate(reservation_id)
+        with shard.write_transaction() as (conn, seq):
+            reservation = self._get(conn, reservation_id, caller_id)
+            touched = self._release_held(conn, seq, [reservation], 'released')
+        self._apply_offers(shard, touched)
+        return reservation
+
+    def release_expired(self, now: Optional[float] = None, limit: int = 500) -> int:
+        """Returns stock from every hold past its expiry. Returns the number of holds released."""
+        now = time.time() if now is None else now
+        released = 0
+        for shard in self.store.shards.values():
+            with shard.write_transaction() as (conn, seq):
+                rows = conn.execute(
+                    f"SELECT {', '.join(_RESERVATION_COLUMNS)} FROM reservations "
+                    f"WHERE status = 'held' AND expires_at <= ? LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                touched = self._release_held(conn, seq, [dict(row) for row in rows], 'expired')
+            self._apply_offers(shard, touched)
+            released += len(rows)
+        return released
+
+    def _release_held(self, conn, seq: int, reservations: List[Dict[str, Any]], status: str) -> set:
+        """Flips held reservations to status and restocks their offers. Returns the offer ids touched."""
+        touched = set()
+        for reservation in reservations:
+            # Conditional status flip: a hold is released exactly once even if two workers race
+            cursor = conn.execute(
+                "UPDATE reservations SET status = ? WHERE reservation_id = ? AND status = 'held'",
+                (status, reservation['reservation_id']),
+            )
+            if cursor.rowcount == 0:
+                continue
+            conn.execute(_RESTOCK_SQL, (reservation['quantity_kg'], seq, reservation['offer_id']))
+            reservation['status'] = status
+            touched.add(reservation['offer_id'])
+        return touched
+
+    def _apply_offers(self, shard: OfferStore, offer_ids) -> None:
+        for offer_id in offer_ids:
+            committed = shard.read_committed(offer_id)
+            if committed is not None:
+                shard.apply_committed(committed[0])
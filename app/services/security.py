@@ -0,0 +1,304 @@
+# app/services/security.py
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from app.config.constants import AUTH_HASH_WORKERS, AUTH_SCRYPT_N
+from app.services.metrics import METRICS, stage
+from app.services.offer_store import OfferStore
+
+# --- NOTE: Password hashing is deliberately slow (tens of ms of CPU) and never runs on the
+# event loop: it goes to a small dedicated pool, so a burst of logins cannot starve the
+# thread pool that serves sync routes. Token checks are the opposite: HMAC + an LRU of
+# already-verified tokens + an in-memory revocation list, no database on the request path.
+
+TOKEN_VERIFICATIONS = METRICS.counter(
+    "marketplace_auth_token_verifications_total", "Access token checks by result.", ["result"]
+)
+
+
+class InvalidTokenError(Exception):
+    """Malformed, forged, expired or revoked access token (maps to 401)."""
+
+
+# =======================================================
+#               1. PASSWORD HASHING (scrypt)
+# =======================================================
+
+_SCRYPT_R = 8
+_SCRYPT_P = 1
+_SCRYPT_DKLEN = 32
+
+_HASH_EXECUTOR = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix="password-hash")
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int, dklen: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode('utf-8'), salt=salt, n=n, r=r, p=p, dklen=dklen, maxmem=256 * n * r + 1024 * 1024
+    )
+
+
+def hash_password(password: str, n: int = AUTH_SCRYPT_N) -> str:
+    """Returns 'scrypt$n$r$p$salt$hash' (parameters stored per hash, so the cost can be raised later)."""
+    salt = os.urandom(16)
+    digest = _scrypt(password, salt, n, _SCRYPT_R, _SCRYPT_P, _SCRYPT_DKLEN)
+    return '$'.join([
+        'scrypt', str(n), str(_SCRYPT_R), str(_SCRYPT_P),
+        base64.b64encode(salt).decode('ascii'), base64.b64encode(digest).decode('ascii'),
+    ])
+
+
+def verify_password(password: str, stored: str) -> bool:
+    try:
+        scheme, n, r, p, salt, digest = stored.split('$')
+        if scheme != 'scrypt':
+            return False
+        expected = base64.b64decode(digest)
+        actual = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p), len(expected))
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+def needs_rehash(stored: str, n: int = AUTH_SCRYPT_N) -> bool:
+    """True when the hash was made with a lower cost than the current setting."""
+    parts = stored.split('$')
+    return len(parts) != 6 or parts[0] != 'scrypt' or int(parts[1]) < n
+
+
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    with stage("password_hash"):
+        return await loop.run_in_executor(_HASH_EXECUTOR, hash_password, password)
+
+
+async def verify_password_async(password: str, stored: str) -> bool:
+    loop = asyncio.get_running_loop()
+    with stage("password_verify"):
+        return await loop.run_in_executor(_HASH_EXECUTOR, verify_password, password, stored)
+
+
+@lru_cache(maxsize=1)
+def dummy_password_hash() -> str:
+    """Verified against when the username does not exist, so unknown users cost the same time."""
+    return hash_password(uuid.uuid4().hex)
+
+
+# =======================================================
+#               2. SIGNED ACCESS TOKENS (JWT, HS256)
+# =======================================================
+
+def _b64url_encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64url_decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class TokenSigner:
+    """
+    Issues and checks compact HS256 JWTs. Only our own header is accepted (no
+    'alg' negotiation), so a token is valid iff its HMAC matches. Claims: sub
+    (user_id), name (username), iat, exp, jti.
+    """
+
+    def __init__(self, secret: bytes, ttl_s: float):
+        self._secret = secret
+        self.ttl_s = ttl_s
+        self._header = _b64url_encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(',', ':')).encode())
+
+    def _sign(self, signing_input: str) -> bytes:
+        return hmac.new(self._secret, signing_input.encode('ascii'), hashlib.sha256).digest()
+
+    def issue(self, user_id: str, username: str) -> Tuple[str, Dict[str, Any]]:
+        now = time.time()
+        claims = {
+            'sub': user_id,
+            'name': username,
+            'iat': now, # Full precision: a token issued right after a password reset must outlive the cutoff
+            'exp': int(now + self.ttl_s),
+            'jti': uuid.uuid4().hex,
+        }
+        payload = _b64url_encode(json.dumps(claims, separators=(',', ':')).encode())
+        signing_input = f"{self._header}.{payload}"
+        return f"{signing_input}.{_b64url_encode(self._sign(signing_input))}", claims
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        """Checks the signature and returns the claims (expiry is checked by the caller)."""
+        signing_input, _, signature = token.rpartition('.')
+        header, _, payload = signing_input.partition('.')
+        if header != self._header or not payload:
+            raise InvalidTokenError("Malformed token.")
+        try:
+            valid = hmac.compare_digest(self._sign(signing_input), _b64url_decode(signature))
+            claims = json.loads(_b64url_decode(payload)) if valid else None
+        except ValueError:
+            raise InvalidTokenError("Malformed token.")
+        if not valid:
+            raise InvalidTokenError("Bad token signature.")
+        if not isinstance(claims, dict) or not {'sub', 'iat', 'exp', 'jti'} <= claims.keys():
+            raise InvalidTokenError("Malformed token.")
+        return claims
+
+
+# =======================================================
+#               3. REVOCATIONS (shared table, in-memory view)
+# =======================================================
+
+_CREATE_REVOCATIONS_SQL = """
+CREATE TABLE IF NOT EXISTS token_revocations (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    jti        TEXT,
+    user_id    TEXT NOT NULL,
+    revoked_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+)
+"""
+
+
+class RevocationList:
+    """
+    Revoked tokens live in the offer database (every worker sees them) and are
+    mirrored in memory, so checks never touch SQLite. A row with a jti revokes
+    one token (logout); a row without one revokes every token of user_id issued
+    before revoked_at (password reset). Rows are kept only until the tokens they
+    cover would have expired anyway. refresh() pulls rows added by other workers.
+    """
+
+    def __init__(self, store: OfferStore, token_ttl_s: float):
+        self.store = store
+        self.token_ttl_s = token_ttl_s
+        self._lock = threading.Lock()
+        self._jtis: Dict[str, float] = {} # jti -> expires_at
+        self._user_cutoffs: Dict[str, float] = {} # user_id -> revoked_at
+        self._last_seq = 0
+        with store.write_transaction() as (conn, _):
+            conn.execute(_CREATE_REVOCATIONS_SQL)
+        self.refresh()
+
+    def is_revoked(self, claims: Dict[str, Any]) -> bool:
+        if claims['jti'] in self._jtis:
+            return True
+        cutoff = self._user_cutoffs.get(claims['sub'])
+        return cutoff is not None and claims['iat'] < cutoff
+
+    def _remember(self, jti: Optional[str], user_id: str, revoked_at: float, expires_at: float) -> None:
+        if jti is not None:
+            self._jtis[jti] = expires_at
+        else:
+            self._user_cutoffs[user_id] = max(revoked_at, self._user_cutoffs.get(user_id, 0.0))
+
+    def insert(
+        self, conn: sqlite3.Connection, user_id: str, jti: Optional[str] = None, expires_at: Optional[float] = None
+    ) -> Tuple[float, float]:
+        """
+        Records a revocation inside the caller's write transaction. Returns (revoked_at,
+        expires_at); pass them to remember_local() once the transaction has committed.
+        """
+        revoked_at = time.time()
+        expires_at = expires_at if expires_at is not None else revoked_at + self.token_ttl_s
+        conn.execute("DELETE FROM token_revocations WHERE expires_at < ?", (revoked_at,))
+        conn.execute(
+            "INSERT INTO token_revocations (jti, user_id, revoked_at, expires_at) VALUES (?, ?, ?, ?)",
+            (jti, user_id, revoked_at, expires_at),
+        )
+        return revoked_at, expires_at
+
+    def remember_local(self, user_id: str, jti: Optional[str], revoked_at: float, expires_at: float) -> None:
+        """Applies a committed revocation in this worker at once (others pick it up on refresh)."""
+        with self._lock:
+            self._remember(jti, user_id, revoked_at, expires_at)
+
+    def revoke_token(self, claims: Dict[str, Any]) -> None:
+        with self.store.write_transaction() as (conn, _):
+            revoked_at, expires_at = self.insert(conn, claims['sub'], claims['jti'], float(claims['exp']))
+        self.remember_local(claims['sub'], claims['jti'], revoked_at, expires_at)
+
+    def refresh(self) -> int:
+        """Loads revocations committed since the last refresh (any worker). Returns how many."""
+        with self.store.read_connection() as conn:
+            rows = conn.execute(
+                "SELECT seq, jti, user_id, revoked_at, expires_at FROM token_revocations WHERE seq > ? ORDER BY seq",
+                (self._last_seq,),
+            ).fetchall()
+        now = time.time()
+        with self._lock:
+            for row in rows:
+                self._remember(row['jti'], row['user_id'], row['revoked_at'], row['expires_at'])
+                self._last_seq = max(self._last_seq, row['seq'])
+            # Forget entries whose tokens have expired on their own
+            self._jtis = {jti: exp for jti, exp in self._jtis.items() if exp >= now}
+            self._user_cutoffs = {
+                user_id: cutoff for user_id, cutoff in self._user_cutoffs.items() if cutoff + self.token_ttl_s >= now
+            }
+        return len(rows)
+
+    def __len__(self) -> int:
+        return len(self._jtis) + len(self._user_cutoffs)
+
+
+# =======================================================
+#               4. VERIFICATION (LRU of verified tokens)
+# =======================================================
+
+class TokenVerifier:
+    """
+    verify(token) -> claims in a few microseconds: tokens whose signature was already
+    checked are served from an LRU (max_entries), so a hit costs a dict lookup plus
+    the expiry and revocation checks, which are re-done on every call.
+    """
+
+    def __init__(self, signer: TokenSigner, revocations: RevocationList, max_entries: int = 10000):
+        self.signer = signer
+        self.revocations = revocations
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        with self._lock:
+            claims = self._cache.get(token)
+            if claims is not None:
+                self._cache.move_to_end(token)
+        result = 'hit'
+        if claims is None:
+            result = 'miss'
+            try:
+                claims = self.signer.decode(token)
+            except InvalidTokenError:
+                TOKEN_VERIFICATIONS.inc(result='invalid')
+                raise
+        if claims['exp'] <= time.time():
+            self._evict(token)
+            TOKEN_VERIFICATIONS.inc(result='expired')
+            raise InvalidTokenError("Token expired.")
+        if self.revocations.is_revoked(claims):
+            self._evict(token)
+            TOKEN_VERIFICATIONS.inc(result='revoked')
+            raise InvalidTokenError("Token revoked.")
+        if result == 'miss' and self.max_entries > 0:
+            with self._lock:
+                self._cache[token] = claims
+                if len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        TOKEN_VERIFICATIONS.inc(result=result)
+        return claims
+
+    def _evict(self, token: str) -> None:
+        with self._lock:
+            self._cache.pop(token, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._cache), "max_entries": self.max_entries, "revocations": len(self.revocations)}
@@ -0,0 +1,46 @@
+# app/services/serialization.py
+import dataclasses
+import json
+from datetime import date, datetime
+from typing import Any
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError: # Optional dependency: fall back to the stdlib encoder (same output, slower)
+    orjson = None
+
+# --- NOTE: Hot routes return FastJSONResponse(...) themselves instead of a dict, so FastAPI
+# skips both jsonable_encoder and response-model validation. orjson serializes (slotted)
+# dataclasses, NumPy scalars/arrays and non-str dict keys natively, in C.
+
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+def _default(obj: Any) -> Any:
+    """Types neither encoder handles natively (pandas Timestamps, and everything json lacks)."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {f.name: getattr(obj, f.name) for f in dataclasses.fields(obj)} # Shallow: nested values come back here
+    return str(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact UTF-8 JSON for response bodies and NDJSON/SSE lines."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by dumps() (orjson when installed)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,302 @@
+# app/services/upload_jobs.py
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.services.offer_store import OfferStore
+from app.services.metrics import METRICS
+from app.services.serialization import dumps
+
+# Lifecycle: queued -> running -> succeeded | failed
+TERMINAL_STATUSES = ('succeeded', 'failed')
+
+_CREATE_JOBS_SQL = """
+CREATE TABLE IF NOT EXISTS upload_jobs (
+    job_id          TEXT PRIMARY KEY,
+    idempotency_key TEXT UNIQUE,
+    request_hash    TEXT NOT NULL,
+    status          TEXT NOT NULL,
+    result_json     TEXT,
+    error_status    INTEGER,
+    error_detail    TEXT,
+    created_at      REAL NOT NULL,
+    updated_at      REAL NOT NULL
+)
+"""
+_JOB_COLUMNS = [
+    'job_id', 'idempotency_key', 'request_hash', 'status', 'result_json',
+    'error_status', 'error_detail', 'created_at', 'updated_at',
+]
+_SELECT_JOB_SQL = f"SELECT {', '.join(_JOB_COLUMNS)} FROM upload_jobs"
+
+JOBS_PENDING = METRICS.gauge("marketplace_upload_jobs_pending", "Upload jobs queued or running in this worker.")
+JOBS_FINISHED = METRICS.counter("marketplace_upload_jobs_total", "Upload jobs by outcome.", ["outcome"])
+
+JobWork = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity (maps to 429)."""
+
+
+class IdempotencyConflictError(Exception):
+    """Raised when an idempotency key is reused with a different request (maps to 422)."""
+
+
+def _is_retryable(row: sqlite3.Row) -> bool:
+    """A job that failed on our side (5xx, interrupted, shut down): resubmitting its key runs it again."""
+    return row['status'] == 'failed' and (row['error_status'] or 0) >= 500
+
+
+def _job_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    result_json = job.pop('result_json')
+    job['result'] = json.loads(result_json) if result_json else None
+    error_status, error_detail = job.pop('error_status'), job.pop('error_detail')
+    job['error'] = {'status_code': error_status, 'detail': error_detail} if error_status else None
+    job.pop('request_hash')
+    return job
+
+
+class UploadJobQueue:
+    """
+    Bounded asynchronous upload pipeline. Jobs are recorded in the offer database
+    (so any worker can answer status polls and dedupe idempotency keys), while
+    the work itself runs on `workers` asyncio tasks in the accepting worker.
+    At most `max_pending` jobs wait or run per worker; beyond that submit()
+    raises QueueFullError. Jobs stuck queued/running longer than stale_after_s
+    (their worker died) are failed by the sweeper; finished jobs are purged
+    after result_ttl_s.
+    """
+
+    def __init__(
+        self,
+        store: OfferStore,
+        workers: int = 4,
+        max_pending: int = 64,
+        result_ttl_s: float = 24 * 3600,
+        stale_after_s: float = 600,
+        sweep_interval_s: float = 60,
+        poll_interval_s: float = 0.25,
+    ):
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self.result_ttl_s = result_ttl_s
+        self.stale_after_s = stale_after_s
+        self.sweep_interval_s = sweep_interval_s
+        self.poll_interval_s = poll_interval_s
+        self._pending = 0 # Slots reserved by submit() until the job finishes
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._done_events: Dict[str, asyncio.Event] = {} # Local unfinished jobs: wakes long-polls instantly
+        with store.write_transaction() as (conn, _):
+            conn.execute(_CREATE_JOBS_SQL)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_upload_jobs_status ON upload_jobs (status, updated_at)")
+
+    # --- LIFECYCLE (called from the app lifespan) ---
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self) -> None:
+        """Cancels the workers and fails every unfinished local job so clients can resubmit at once."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job_id in list(self._done_events):
+            try:
+                await run_in_threadpool(
+                    self._update, job_id, 'failed', None, (503, "Server shut down before the job finished; please resubmit.")
+                )
+            except sqlite3.Error as e:
+                print(f"ERROR: Could not fail upload job {job_id} on shutdown: {e}")
+        self._done_events.clear()
+
+    # --- DATABASE ---
+
+    def _read(self, where: str, params: tuple) -> Optional[sqlite3.Row]:
+        with self.store.read_connection() as conn:
+            return conn.execute(f"{_SELECT_JOB_SQL} WHERE {where}", params).fetchone()
+
+    def _insert(self, job_id: str, idempotency_key: Optional[str], request_hash: str) -> Tuple[sqlite3.Row, bool]:
+        """
+        Inserts a queued job, or returns the job already holding the key. Returns (row, created).
+        A retryable job holding the key for the same request is re-queued under its own job_id
+        (created=True), in the same transaction, so only one of several retries wins.
+        """
+        now = time.time()
+        try:
+            with self.store.write_transaction() as (conn, _):
+                retried = conn.execute(
+                    "SELECT job_id FROM upload_jobs WHERE idempotency_key = ? AND request_hash = ? "
+                    "AND status = 'failed' AND error_status >= 500",
+                    (idempotency_key, request_hash),
+                ).fetchone() if idempotency_key else None
+                if retried is not None:
+                    job_id = retried['job_id']
+                    conn.execute(
+                        "UPDATE upload_jobs SET status = 'queued', result_json = NULL, error_status = NULL, "
+                        "error_detail = NULL, updated_at = ? WHERE job_id = ?",
+                        (now, job_id),
+                    )
+                else:
+                    conn.execute(
+                        "INSERT INTO upload_jobs (job_id, idempotency_key, request_hash, status, created_at, updated_at) "
+                        "VALUES (?, ?, ?, 'queued', ?, ?)",
+                        (job_id, idempotency_key, request_hash, now, now),
+                    )
+        except sqlite3.IntegrityError:
+            # Another request (possibly on another worker) claimed the key first
+            return self._read("idempotency_key = ?", (idempotency_key,)), False
+        return self._read("job_id = ?", (job_id,)), True
+
+    def _update(self, job_id: str, status: str, result: Any = None, error: Optional[Tuple[int, str]] = None) -> None:
+        with self.store.write_transaction() as (conn, _):
+            conn.execute(
+                "UPDATE upload_jobs SET status = ?, result_json = ?, error_status = ?, error_detail = ?, updated_at = ? "
+                "WHERE job_id = ?",
+                (
+                    status,
+                    dumps(result).decode() if result is not None else None,
+                    error[0] if error else None,
+                    error[1] if error else None,
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    def _sweep(self, now: float) -> Tuple[int, int]:
+        with self.store.write_transaction() as (conn, _):
+            stale = conn.execute(
+                "UPDATE upload_jobs SET status = 'failed', error_status = 500, "
+                "error_detail = 'Job interrupted before completion; please resubmit.', updated_at = ? "
+                "WHERE status IN ('queued', 'running') AND updated_at < ?",
+                (now, now - self.stale_after_s),
+            ).rowcount
+            purged = conn.execute(
+                "DELETE FROM upload_jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+                (now - self.result_ttl_s,),
+            ).rowcount
+        return stale, purged
+
+    # --- SUBMIT / STATUS ---
+
+    async def submit(self, idempotency_key: Optional[str], request_hash: str, work: JobWork) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queues `work` (an async callable returning the job result). Returns (job, created).
+        A repeated idempotency key returns the original job instead (created=False; the
+        caller must discard `work`), unless that job failed with a 5xx: then it is queued
+        again with this `work`. Raises IdempotencyConflictError if the key was used for a
+        different request and QueueFullError when this worker is at capacity.
+        """
+        if idempotency_key:
+            existing = await run_in_threadpool(self._read, "idempotency_key = ?", (idempotency_key,))
+            if existing is not None:
+                if existing['request_hash'] != request_hash:
+                    raise IdempotencyConflictError(idempotency_key)
+                if not _is_retryable(existing):
+                    return _job_from_row(existing), False
+
+        if self._queue is None:
+            raise RuntimeError("UploadJobQueue is not running.")
+        if self._pending >= self.max_pending:
+            JOBS_FINISHED.inc(outcome='rejected')
+            raise QueueFullError()
+        self._pending += 1 # Reserve the slot before awaiting so concurrent submits cannot overshoot
+        JOBS_PENDING.inc()
+
+        job_id = uuid.uuid4().hex
+        try:
+            row, created = await run_in_threadpool(self._insert, job_id, idempotency_key, request_hash)
+        except BaseException:
+            self._release_slot()
+            raise
+        if not created:
+            self._release_slot()
+            if row['request_hash'] != request_hash:
+                raise IdempotencyConflictError(idempotency_key)
+            return _job_from_row(row), False
+
+        job_id = row['job_id'] # A retried job keeps its original id
+        self._done_events[job_id] = asyncio.Event()
+        self._queue.put_nowait((job_id, work))
+        return _job_from_row(row), True
+
+    def _release_slot(self) -> None:
+        self._pending -= 1
+        JOBS_PENDING.dec()
+
+    async def get(self, job_id: str, wait_s: float = 0.0) -> Optional[Dict[str, Any]]:
+        """Current job state. With wait_s > 0, long-polls until the job finishes or wait_s elapses."""
+        deadline = time.monotonic() + wait_s
+        while True:
+            row = await run_in_threadpool(self._read, "job_id = ?", (job_id,))
+            remaining = deadline - time.monotonic()
+            if row is None or row['status'] in TERMINAL_STATUSES or remaining <= 0:
+                return _job_from_row(row) if row is not None else None
+            event = self._done_events.get(job_id)
+            try:
+                if event is not None:
+                    await asyncio.wait_for(event.wait(), remaining)
+                else:
+                    # Job runs in another worker: poll the shared table
+                    await asyncio.sleep(min(self.poll_interval_s, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self._pending,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_pending": self.max_pending,
+            "workers": self.workers,
+        }
+
+    # --- WORKERS ---
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, work = await self._queue.get()
+            try:
+                await run_in_threadpool(self._update, job_id, 'running')
+                try:
+                    result = await work()
+                except HTTPException as e:
+                    await run_in_threadpool(self._update, job_id, 'failed', None, (e.status_code, str(e.detail)))
+                    JOBS_FINISHED.inc(outcome='failed')
+                except Exception as e:
+                    print(f"ERROR: Upload job {job_id} failed: {e}")
+                    await run_in_threadpool(self._update, job_id, 'failed', None, (500, f"Upload processing failed: {e}"))
+                    JOBS_FINISHED.inc(outcome='failed')
+                else:
+                    await run_in_threadpool(self._update, job_id, 'succeeded', result)
+                    JOBS_FINISHED.inc(outcome='succeeded')
+            except sqlite3.Error as e:
+                print(f"ERROR: Could not record state of upload job {job_id}: {e}")
+            finally:
+                self._release_slot()
+                self._queue.task_done()
+            # Not reached on cancellation: the job stays in _done_events for stop() to fail
+            event = self._done_events.pop(job_id, None)
+            if event is not None:
+                event.set()
+
+    async def _sweeper(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval_s)
+            try:
+                stale, purged = await run_in_threadpool(self._sweep, time.time())
+                if stale or purged:
+                    print(f"INFO: Upload job sweep: {stale} interrupted, {purged} purged")
+            except sqlite3.Error as e:
+                print(f"ERROR: Upload job sweep failed: {e}")
@@ -0,0 +1,171 @@
+# app/services/upload_service.py
+import hashlib
+from dataclasses import dataclass
+from io import BytesIO
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from PIL import Image, UnidentifiedImageError
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config.constants import (
+    UPLOAD_MAX_BYTES,
+    UPLOAD_FORM_OVERHEAD_BYTES,
+    UPLOAD_CHUNK_BYTES,
+    UPLOAD_MAX_PIXELS,
+    ANALYSIS_MAX_SIDE_PX,
+    ANALYSIS_JPEG_QUALITY,
+)
+
+ALLOWED_IMAGE_FORMATS = {"JPEG", "PNG", "WEBP", "MPO"} # MPO = multi-picture JPEG from some phones
+
+
+@dataclass
+class PreparedImage:
+    """Result of the preprocessing stage: a small re-encoded image ready for analysis."""
+    image: Image.Image # Decoded, downsized RGB image
+    encoded: bytes # Bounded-size JPEG (what is actually sent to the model)
+    content_hash: str # SHA-256 of the original upload (cache key)
+    original_bytes: int
+    original_size: tuple
+
+
+# =======================================================
+#               1. STREAMING UPLOAD (SIZE-CAPPED)
+# =======================================================
+
+def _too_large_detail(max_bytes: int) -> str:
+    return f"Image too large (limit {max_bytes // (1024 * 1024)} MB)."
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Caps multipart request bodies BEFORE the form parser spools them: a declared
+    Content-Length over max_bytes is answered 413 without reading the body, and a
+    chunked body is cut off with 413 as soon as its running total passes max_bytes.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int = UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if not headers.get('content-type', '').startswith('multipart/form-data'):
+            await self.app(scope, receive, send)
+            return
+
+        declared = headers.get('content-length')
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            response = JSONResponse({"detail": _too_large_detail(UPLOAD_MAX_BYTES)}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    # Raised inside the form parser; FastAPI re-raises HTTPExceptions from body parsing as-is
+                    raise HTTPException(status_code=413, detail=_too_large_detail(UPLOAD_MAX_BYTES))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def spool_upload(file: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES) -> tuple[BinaryIO, str, int]:
+    """
+    Takes over the spooled temp file the form parser already wrote the upload to and
+    hashes it in chunks (no second copy). Oversized bodies never get this far
+    (UploadSizeLimitMiddleware); the 413 here only catches a file that fits the body
+    cap but not max_bytes. The caller owns the returned file and must close it.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=_too_large_detail(max_bytes))
+    digest = hashlib.sha256()
+    total = 0
+    await file.seek(0)
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise HTTPException(status_code=413, detail=_too_large_detail(max_bytes))
+        digest.update(chunk)
+    await file.seek(0)
+    # Detach it: FastAPI closes the request's UploadFiles after the response, but a queued job still reads it
+    spool, file.file = file.file, BytesIO()
+    return spool, digest.hexdigest(), total
+
+
+# =======================================================
+#               2. HEADER CHECK + REDUCED DECODE
+# =======================================================
+
+def prepare_image_for_analysis(
+    spool: BinaryIO,
+    content_hash: str,
+    original_bytes: int,
+    max_side: int = ANALYSIS_MAX_SIDE_PX,
+    quality: int = ANALYSIS_JPEG_QUALITY,
+) -> PreparedImage:
+    """
+    Opens the image lazily (header only) to reject bad inputs before any pixel
+    data is decoded, then decodes at reduced size and re-encodes a small JPEG.
+    """
+    if original_bytes == 0:
+        raise HTTPException(status_code=400, detail="Empty image upload.")
+    try:
+        image = Image.open(spool) # Reads the header only
+    except (UnidentifiedImageError, OSError):
+        raise HTTPException(status_code=415, detail="Unsupported or corrupt image file.")
+
+    if image.format not in ALLOWED_IMAGE_FORMATS:
+        raise HTTPException(status_code=415, detail=f"Unsupported image format: {image.format}.")
+    width, height = image.size
+    if width * height > UPLOAD_MAX_PIXELS:
+        raise HTTPException(status_code=413, detail=f"Image dimensions too large ({width}x{height}).")
+
+    # JPEG draft mode lets libjpeg decode directly at 1/2, 1/4 or 1/8 scale (no full-size bitmap)
+    image.draft("RGB", (max_side, max_side))
+    try:
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    except (OSError, ValueError):
+        raise HTTPException(status_code=415, detail="Image data could not be decoded.")
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    out = BytesIO()
+    image.save(out, format="JPEG", quality=quality, optimize=True)
+    return PreparedImage(
+        image=image,
+        encoded=out.getvalue(),
+        content_hash=content_hash,
+        original_bytes=original_bytes,
+        original_size=(width, height),
+    )
+
+
+async def prepare_spooled_upload(spool: BinaryIO, content_hash: str, original_bytes: int) -> PreparedImage:
+    """Decode stage for an already spooled upload (closes the spool)."""
+    try:
+        # Decode/resize/encode is CPU-bound: keep it off the event loop
+        return await run_in_threadpool(prepare_image_for_analysis, spool, content_hash, original_bytes)
+    finally:
+        spool.close()
+
+
+async def preprocess_upload(file: UploadFile) -> PreparedImage:
+    """Full preprocessing stage: stream -> validate header -> reduced decode -> re-encode."""
+    spool, content_hash, original_bytes = await spool_upload(file)
+    return await prepare_spooled_upload(spool, content_hash, original_bytes)
@@ -0,0 +1,166 @@
+# app/services/vision_service.py
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from fastapi import Request
+
+from app.config.constants import (
+    GEMINI_VISION_MODEL,
+    VISION_MAX_CONCURRENCY,
+    VISION_TIMEOUT_S,
+    VISION_DISCONNECT_POLL_S,
+    USE_FAKE_GEMINI,
+    VISION_BACKEND,
+    VISION_LOCAL_MODEL_PATH,
+    VISION_LOCAL_LABELS_PATH,
+    VISION_LOCAL_CONFIDENCE,
+    VISION_LOCAL_IOU,
+    VISION_LOCAL_MAX_BATCH,
+    VISION_LOCAL_BATCH_WAIT_MS,
+    VISION_LOCAL_THREADS,
+    VISION_CASCADE_MIN_CONFIDENCE,
+)
+from app.config.state import APP_STATE
+from app.services.detectors import CascadeDetector, Detector, OnnxYoloDetector, normalize_detections
+
+# --- NOTE: Vision calls never run on the event loop thread. Clients with a native async API
+# (client.aio) are awaited directly; anything else runs on a bounded thread pool. The local
+# backend runs on its own inference thread (see detectors._MicroBatcher).
+
+
+class ClientDisconnectedError(Exception):
+    """Raised when the uploading client goes away while its image is being analysed."""
+
+
+# One semaphore per event loop (each uvicorn worker runs a single loop)
+_VISION_SEMAPHORES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+_VISION_EXECUTOR = ThreadPoolExecutor(max_workers=VISION_MAX_CONCURRENCY, thread_name_prefix="vision")
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _VISION_SEMAPHORES.get(loop)
+    if semaphore is None:
+        semaphore = _VISION_SEMAPHORES[loop] = asyncio.Semaphore(VISION_MAX_CONCURRENCY)
+    return semaphore
+
+
+def create_gemini_client():
+    """Builds the vision client used by the app (the offline fake when USE_FAKE_GEMINI=1)."""
+    if USE_FAKE_GEMINI:
+        from app.services.fake_gemini import FakeGeminiClient
+        return FakeGeminiClient()
+    from google import genai
+    return genai.Client() # Reads GEMINI_API_KEY / GOOGLE_API_KEY from the environment
+
+
+async def _run_vision_call(image: Any, client: Any) -> List[Dict]:
+    # Imported here: image_analysis pulls in google.genai, which the local backend does not need
+    from app.routes.agent.image_analysis import call_gemini_vision_api, call_gemini_vision_api_async
+    if hasattr(client, "aio"):
+        return await call_gemini_vision_api_async(image, client)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_VISION_EXECUTOR, call_gemini_vision_api, image, client)
+
+
+class GeminiDetector(Detector):
+    """Remote backend: one Gemini call per image, sent as the re-encoded JPEG."""
+
+    name = "gemini"
+
+    def __init__(self, client: Any):
+        self.client = client
+
+    @property
+    def cache_namespace(self) -> str:
+        return f"{self.name}-{GEMINI_VISION_MODEL}"
+
+    async def detect(self, prepared: Any) -> List[Dict]:
+        return normalize_detections(await _run_vision_call(prepared.encoded, self.client))
+
+
+def _is_known_waste(label: str) -> bool:
+    from app.services.waste_calculator import get_waste_lookup
+    return get_waste_lookup(APP_STATE['WASTE_DF_PROCESSED']).index_of(label) is not None
+
+
+def create_vision_detector(backend: str = VISION_BACKEND) -> Detector:
+    """
+    Builds the configured backend (VISION_BACKEND): 'gemini', 'local' (ONNX model at
+    VISION_LOCAL_MODEL_PATH) or 'cascade' (local first, Gemini when the local model is
+    unsure). The Gemini client is APP_STATE['GEMINI_CLIENT'], created here if unset.
+    """
+    local = None
+    if backend in ("local", "cascade"):
+        if not VISION_LOCAL_MODEL_PATH:
+            raise RuntimeError(f"VISION_BACKEND={backend} needs VISION_LOCAL_MODEL_PATH (a YOLO-style ONNX model).")
+        local = OnnxYoloDetector(
+            VISION_LOCAL_MODEL_PATH,
+            labels_path=VISION_LOCAL_LABELS_PATH or None,
+            confidence=VISION_LOCAL_CONFIDENCE,
+            iou_threshold=VISION_LOCAL_IOU,
+            max_batch=VISION_LOCAL_MAX_BATCH,
+            batch_wait_s=VISION_LOCAL_BATCH_WAIT_MS / 1000,
+            threads=VISION_LOCAL_THREADS,
+        )
+        if backend == "local":
+            return local
+    elif backend != "gemini":
+        raise ValueError(f"Unknown VISION_BACKEND '{backend}' (expected gemini, local or cascade).")
+
+    if APP_STATE.get('GEMINI_CLIENT') is None:
+        APP_STATE['GEMINI_CLIENT'] = create_gemini_client()
+    remote = GeminiDetector(APP_STATE['GEMINI_CLIENT'])
+    if local is None:
+        return remote
+    return CascadeDetector(local, remote, _is_known_waste, min_confidence=VISION_CASCADE_MIN_CONFIDENCE)
+
+
+def get_vision_detector() -> Detector:
+    """Returns the shared detector (the local model is loaded once per worker, on first use)."""
+    detector = APP_STATE.get('VISION_DETECTOR')
+    if detector is None:
+        detector = APP_STATE['VISION_DETECTOR'] = create_vision_detector()
+    return detector
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(VISION_DISCONNECT_POLL_S)
+
+
+async def analyze_waste_image(
+    prepared: Any,
+    detector: Detector,
+    request: Optional[Request] = None,
+    timeout_s: Optional[float] = None,
+) -> List[Dict]:
+    """
+    Runs one vision analysis (any backend) on a PreparedImage without blocking the event loop.
+
+    - At most VISION_MAX_CONCURRENCY calls are in flight per worker; extra uploads wait their turn.
+    - Each call is bounded by timeout_s, VISION_TIMEOUT_S by default (raises asyncio.TimeoutError).
+    - If `request` is given, the call is cancelled as soon as the client disconnects
+      (raises ClientDisconnectedError).
+    """
+    timeout_s = VISION_TIMEOUT_S if timeout_s is None else timeout_s
+    async with _get_semaphore():
+        call_task = asyncio.ensure_future(asyncio.wait_for(detector.detect(prepared), timeout_s))
+        if request is None:
+            return await call_task
+
+        disconnect_task = asyncio.ensure_future(_wait_for_disconnect(request))
+        try:
+            done, _ = await asyncio.wait(
+                {call_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            disconnect_task.cancel()
+            if not call_task.done():
+                call_task.cancel() # Client went away (or we were cancelled): stop the model call
+
+        if call_task in done:
+            return call_task.result()
+        raise ClientDisconnectedError("Client disconnected during image analysis.")
@@ -1,56 +1,183 @@
+import re
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Any
+from types import MappingProxyType
+from typing import List, Dict, Any, Optional, Tuple, Union
 
 # --- NOTE: This function requires APP_STATE['WASTE_DF_PROCESSED'] to be accessible globally.
 # It is assumed that the calling router (photo_upload.py) will pass this DataFrame.
 
+# =======================================================
+#               LABEL NORMALIZATION
+# =======================================================
+
+# Word-level synonyms, applied to BOTH the database labels and model output,
+# so "Banana Peel" and "Banana Skin" resolve to the same key.
+WORD_ALIASES = {
+    'peel': 'skin',
+    'peeling': 'skin',
+    'rind': 'skin',
+    'eggshell': 'egg shell',
+    'teabag': 'tea bag',
+}
+
+# Whole-label aliases for common model phrasings (keys/values are normalized forms)
+LABEL_ALIASES = {
+    'coffee': 'coffee ground',
+    'used coffee ground': 'coffee ground',
+    'meat': 'cooked meat',
+    'leftover meat': 'cooked meat',
+    'lettuce': 'lettuce leaf',
+    'tea': 'tea bag',
+}
+
+_SEPARATORS = re.compile(r'[\s_\-]+')
+
+
+def _singular(word: str) -> str:
+    if len(word) > 3 and word.endswith('ves'):
+        return word[:-3] + 'f' # leaves -> leaf
+    if len(word) > 4 and word.endswith('oes'):
+        return word[:-2] # potatoes -> potato, tomatoes -> tomato
+    if len(word) > 3 and word.endswith('es') and word[-3] in 'sxz':
+        return word[:-2] # boxes -> box
+    if len(word) > 2 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1] # shells -> shell, grounds -> ground
+    return word
+
+
+def normalize_waste_label(label: str) -> str:
+    """Case/whitespace/plural/alias-insensitive key for a waste label."""
+    words = _SEPARATORS.sub(' ', str(label).strip().lower()).split()
+    key = ' '.join(WORD_ALIASES.get(word, word) for word in map(_singular, words))
+    return LABEL_ALIASES.get(key, key)
+
+
+# =======================================================
+#               PRECOMPUTED NPK LOOKUP
+# =======================================================
+
+class WasteNpkLookup:
+    """
+    Immutable label -> NPK concentration table built once from waste_npk_processed.csv.
+    Holds a label->index dict and contiguous float64 arrays for N, P and K.
+    Duplicate Waste_Type rows keep the first occurrence (same as the old iloc[0]).
+    """
+
+    __slots__ = ('labels', 'row_positions', 'nitrogen', 'phosphorus', 'potassium', '_exact', '_normalized')
+
+    def __init__(self, waste_npk_df: pd.DataFrame):
+        first_rows = ~waste_npk_df['Waste_Type'].duplicated(keep='first')
+        unique_df = waste_npk_df[first_rows]
+
+        self.labels: Tuple[str, ...] = tuple(unique_df['Waste_Type'])
+        self.row_positions = np.flatnonzero(first_rows.to_numpy()) # Row position in the source DataFrame
+        self.nitrogen = unique_df['Nitrogen_mg'].to_numpy(dtype=np.float64, copy=True)
+        self.phosphorus = unique_df['Phosphorus_mg'].to_numpy(dtype=np.float64, copy=True)
+        self.potassium = unique_df['Potassium_mg'].to_numpy(dtype=np.float64, copy=True)
+        for array in (self.row_positions, self.nitrogen, self.phosphorus, self.potassium):
+            array.setflags(write=False)
+
+        self._exact = MappingProxyType({label: i for i, label in enumerate(self.labels)})
+        normalized = {}
+        for i, label in enumerate(self.labels):
+            normalized.setdefault(normalize_waste_label(label), i)
+        self._normalized = MappingProxyType(normalized)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def index_of(self, waste_label: str) -> Optional[int]:
+        """O(1) lookup: exact label first, then the normalized key."""
+        index = self._exact.get(waste_label)
+        if index is None:
+            index = self._normalized.get(normalize_waste_label(waste_label))
+        return index
+
+    def canonical_label(self, waste_label: str) -> Optional[str]:
+        index = self.index_of(waste_label)
+        return None if index is None else self.labels[index]
+
+
+# Lookups are built once per waste DataFrame (the CSV is loaded once at startup).
+# The DataFrame is kept alongside so its id() cannot be reused by another object.
+_LOOKUP_CACHE: Dict[int, Tuple[pd.DataFrame, WasteNpkLookup]] = {}
+
+
+def get_waste_lookup(waste_npk: Union[pd.DataFrame, WasteNpkLookup]) -> WasteNpkLookup:
+    """Returns the precomputed lookup for a waste DataFrame (or passes a lookup through)."""
+    if isinstance(waste_npk, WasteNpkLookup):
+        return waste_npk
+    cached = _LOOKUP_CACHE.get(id(waste_npk))
+    if cached is None or cached[0] is not waste_npk:
+        cached = (waste_npk, WasteNpkLookup(waste_npk))
+        _LOOKUP_CACHE[id(waste_npk)] = cached
+    return cached[1]
+
+
 def get_npk_row(waste_label: str, waste_npk_df: pd.DataFrame) -> pd.Series | None:
     """Safely retrieves the NPK concentration row for a given waste label."""
-    npk_row = waste_npk_df[waste_npk_df['Waste_Type'] == waste_label]
-    if npk_row.empty:
+    lookup = get_waste_lookup(waste_npk_df)
+    index = lookup.index_of(waste_label)
+    if index is None:
         return None
-    # Return the first matching row as a Series object
-    return npk_row.iloc[0]
+    # Return the first matching row as a Series object (only built on request)
+    return waste_npk_df.iloc[lookup.row_positions[index]]
 
 def calculate_manual_npk_score(
     waste_label: str, 
     quantity_kg: float, 
-    waste_npk_df: pd.DataFrame
+    waste_npk_df: Union[pd.DataFrame, WasteNpkLookup]
 ) -> Dict[str, float]:
     """
     Calculates the NPK score for a SINGLE, manually confirmed waste item.
     This is used for the manual input fallback path.
     """
     
-    npk_row = get_npk_row(waste_label, waste_npk_df)
+    lookup = get_waste_lookup(waste_npk_df)
+    index = lookup.index_of(waste_label)
     
-    if npk_row is None:
+    if index is None:
         # Raise error if the manually entered item is not in the database
         raise ValueError(f"Waste type '{waste_label}' not found in NPK database.")
         
-    # Get NPK concentration (from N_mg, P_mg, K_mg columns)
-    n_conc = npk_row['Nitrogen_mg']
-    p_conc = npk_row['Phosphorus_mg']
-    k_conc = npk_row['Potassium_mg']
-    
     # Calculate Weighted NPK (Concentration * Absolute Mass)
     final_npk = {
-        'N': n_conc * quantity_kg,
-        'P': p_conc * quantity_kg,
-        'K': k_conc * quantity_kg
+        'N': float(lookup.nitrogen[index] * quantity_kg),
+        'P': float(lookup.phosphorus[index] * quantity_kg),
+        'K': float(lookup.potassium[index] * quantity_kg)
     }
 
     return final_npk
 
 
+# Gemini's relative_quantity_score runs 1-10; a 10 is read as "fills the frame" (area 1.0)
+MAX_RELATIVE_QUANTITY_SCORE = 10.0
+
+
+def detection_area(item: Dict[str, Any]) -> float:
+    """
+    Quantity weight of one detection, as a fraction of the frame. Box detectors
+    (YOLO-style, 0-1 normalized) give box_w * box_h; detectors without boxes
+    (Gemini) give relative_quantity_score, scaled to the same 0-1 range.
+    """
+    area = (item.get('box_w') or 0.0) * (item.get('box_h') or 0.0)
+    if area > 0:
+        return area
+    score = item.get('relative_quantity_score') or 0.0
+    return min(max(score, 0.0), MAX_RELATIVE_QUANTITY_SCORE) / MAX_RELATIVE_QUANTITY_SCORE
+
+
 def calculate_weighted_npk_score(
     detection_results: List[Dict[str, Any]], 
-    waste_npk_df: pd.DataFrame
+    waste_npk_df: Union[pd.DataFrame, WasteNpkLookup]
 ) -> Dict[str, Any]:
     """
     Calculates the combined NPK concentration and total quantity proxy for a batch 
     of detected waste items (used in AI/Vision mode).
     """
+    lookup = get_waste_lookup(waste_npk_df)
+    nitrogen, phosphorus, potassium = lookup.nitrogen, lookup.phosphorus, lookup.potassium
     total_npk = {'N': 0.0, 'P': 0.0, 'K': 0.0}
     total_area_proxy = 0.0
     item_area_contributions = {}
@@ -59,32 +186,24 @@ def calculate_weighted_npk_score(
     for item in detection_results:
         label = item['label']
         
-        # Quantity Proxy: Use the relative score (from Gemini) or the box dimensions (from YOLO)
-        # We assume the input provides box_w and box_h (0-1 normalized) or a score.
-        box_w = item.get('box_w', 0.0) 
-        box_h = item.get('box_h', 0.0)
-        
-        area = box_w * box_h # This is the quantity weight for the weighted average
+        # Quantity Proxy: the box dimensions (from YOLO) or the relative score (from Gemini)
+        area = detection_area(item) # This is the quantity weight for the weighted average
         if area <= 0: continue
             
         total_area_proxy += area
         
-        # 2. Lookup NPK concentration
-        npk_row = get_npk_row(label, waste_npk_df)
-        if npk_row is None:
+        # 2. Lookup NPK concentration (O(1) dict + array access, labels normalized)
+        index = lookup.index_of(label)
+        if index is None:
             continue
-            
-        # Get NPK concentration (from N_mg, P_mg, K_mg columns)
-        n_conc = npk_row['Nitrogen_mg']
-        p_conc = npk_row['Phosphorus_mg']
-        k_conc = npk_row['Potassium_mg']
         
         # 3. Calculate Weighted NPK (Concentration * Area) and accumulate
-        total_npk['N'] += n_conc * area
-        total_npk['P'] += p_conc * area
-        total_npk['K'] += k_conc * area
+        total_npk['N'] += float(nitrogen[index]) * area
+        total_npk['P'] += float(phosphorus[index]) * area
+        total_npk['K'] += float(potassium[index]) * area
         
-        item_area_contributions[label] = item_area_contributions.get(label, 0) + area
+        canonical = lookup.labels[index]
+        item_area_contributions[canonical] = item_area_contributions.get(canonical, 0) + area
 
     # 4. Final Dominant Waste Type and Result Aggregation
     if not item_area_contributions:
@@ -98,3 +217,120 @@ def calculate_weighted_npk_score(
         "combined_npk_score": total_npk,
         "total_area_proxy": total_area_proxy,
     }
+
+
+# =======================================================
+#               BATCH (VECTORIZED) SCORING
+# =======================================================
+
+def _label_indices(lookup: WasteNpkLookup, labels) -> np.ndarray:
+    """Maps many labels to lookup indices (-1 if unknown), resolving each distinct label once."""
+    if len(labels) == 0:
+        return np.empty(0, dtype=np.int64)
+    codes, distinct = pd.factorize(pd.Series(labels, dtype=object), sort=False)
+    resolved = np.array(
+        [-1 if (index := lookup.index_of(label)) is None else index for label in distinct], dtype=np.int64
+    )
+    return resolved[codes]
+
+
+def manual_npk_arrays(
+    labels,
+    quantities,
+    waste_npk_df: Union[pd.DataFrame, WasteNpkLookup]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Array kernel behind the batch manual path: returns (label_indices, npk) where
+    label_indices is -1 for unknown labels and npk is an (n, 3) float64 array of N/P/K.
+    """
+    lookup = get_waste_lookup(waste_npk_df)
+    indices = _label_indices(lookup, labels)
+    quantities = np.asarray(quantities, dtype=np.float64)
+    safe = np.where(indices >= 0, indices, 0)
+    npk = np.column_stack((
+        lookup.nitrogen[safe] * quantities,
+        lookup.phosphorus[safe] * quantities,
+        lookup.potassium[safe] * quantities,
+    ))
+    return indices, npk
+
+
+def calculate_batch_manual_npk_scores(
+    items: List[Tuple[str, float]],
+    waste_npk_df: Union[pd.DataFrame, WasteNpkLookup]
+) -> List[Optional[Dict[str, float]]]:
+    """
+    Vectorized calculate_manual_npk_score over many (waste_label, quantity_kg) pairs.
+    Unknown waste types yield None instead of raising, so one bad row does not fail the batch.
+    """
+    if not items:
+        return []
+    labels, quantities = zip(*items)
+    indices, npk = manual_npk_arrays(labels, quantities, waste_npk_df)
+
+    return [
+        {'N': n, 'P': p, 'K': k} if index >= 0 else None
+        for index, (n, p, k) in zip(indices.tolist(), npk.tolist())
+    ]
+
+
+def calculate_batch_weighted_npk_scores(
+    detection_batches: List[List[Dict[str, Any]]],
+    waste_npk_df: Union[pd.DataFrame, WasteNpkLookup]
+) -> List[Dict[str, Any]]:
+    """
+    Vectorized calculate_weighted_npk_score over many detection lists (one per bin/photo).
+    Labels are gathered to lookup indices once, then all N/P/K totals, area proxies and
+    per-label contributions are computed with np.bincount in a single pass.
+    Results are identical to calling calculate_weighted_npk_score on each list.
+    """
+    lookup = get_waste_lookup(waste_npk_df)
+    num_batches = len(detection_batches)
+
+    # 1. Flatten (batch_id, label index, area) for every detected item
+    flat = [(batch_id, item) for batch_id, detections in enumerate(detection_batches) for item in detections]
+    batch_arr = np.fromiter((batch_id for batch_id, _ in flat), dtype=np.int64, count=len(flat))
+    label_arr = _label_indices(lookup, [item['label'] for _, item in flat])
+    area_arr = np.fromiter((detection_area(item) for _, item in flat), dtype=np.float64, count=len(flat))
+
+    # 2. Quantity proxy counts every positive area, recognised or not (same as the per-item path)
+    positive = area_arr > 0
+    total_area = np.bincount(batch_arr[positive], weights=area_arr[positive], minlength=num_batches)
+
+    # 3. Weighted NPK sums over recognised items (gather by label index, then bincount)
+    known = positive & (label_arr >= 0)
+    k_batch, k_label, k_area = batch_arr[known], label_arr[known], area_arr[known]
+    total_n = np.bincount(k_batch, weights=lookup.nitrogen[k_label] * k_area, minlength=num_batches)
+    total_p = np.bincount(k_batch, weights=lookup.phosphorus[k_label] * k_area, minlength=num_batches)
+    total_k = np.bincount(k_batch, weights=lookup.potassium[k_label] * k_area, minlength=num_batches)
+
+    # 4. Dominant type: largest per-(batch, label) area; ties go to the label seen first
+    dominant = np.full(num_batches, -1, dtype=np.int64)
+    if k_batch.size:
+        pair_keys = k_batch * len(lookup) + k_label
+        unique_keys, first_seen, inverse = np.unique(pair_keys, return_index=True, return_inverse=True)
+        contributions = np.bincount(inverse, weights=k_area)
+        pair_batch = unique_keys // len(lookup)
+        order = np.lexsort((first_seen, -contributions, pair_batch))
+        is_first = np.ones(order.size, dtype=bool)
+        is_first[1:] = pair_batch[order][1:] != pair_batch[order][:-1]
+        winners = order[is_first]
+        dominant[pair_batch[winners]] = unique_keys[winners] % len(lookup)
+
+    # 5. Result aggregation (same shape as calculate_weighted_npk_score)
+    results: List[Dict[str, Any]] = []
+    for batch_id in range(num_batches):
+        if dominant[batch_id] < 0:
+            results.append({"status": "failed", "message": "No recognized organic waste detected."})
+            continue
+        results.append({
+            "status": "success",
+            "dominant_waste_type": lookup.labels[dominant[batch_id]],
+            "combined_npk_score": {
+                'N': float(total_n[batch_id]),
+                'P': float(total_p[batch_id]),
+                'K': float(total_k[batch_id]),
+            },
+            "total_area_proxy": float(total_area[batch_id]),
+        })
+    return results
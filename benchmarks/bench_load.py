@@ -0,0 +1,143 @@
+# benchmarks/bench_load.py
+# End-to-end load test of /api/v1/upload/photo and /api/v1/recommend_fertilizer, run
+# in-process through the ASGI app (full lifespan, routing, validation, threadpool) with
+# the stub Gemini client (app/services/fake_gemini.py), so no network or API key is needed.
+#
+#   python benchmarks/bench_load.py [--scale 1k] [--requests 500] [--concurrency 32]
+#                                   [--gemini-latency 0.2] [--data-dir DIR] [--out FILE]
+
+import argparse
+import asyncio
+import io
+import random
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import httpx  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from benchmarks.harness import print_table, run_metadata, save_results, summarize  # noqa: E402
+from benchmarks.synthetic_data import generate_dataset, parse_scale  # noqa: E402
+
+
+def make_jpeg(rng: random.Random, size=(640, 480)) -> bytes:
+    """Small distinct JPEG (random colour blocks) so every upload misses the analysis cache."""
+    image = Image.new('RGB', size)
+    block = 80
+    for x in range(0, size[0], block):
+        for y in range(0, size[1], block):
+            image.paste((rng.randrange(256), rng.randrange(256), rng.randrange(256)), (x, y, x + block, y + block))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+async def drive(client: httpx.AsyncClient, make_request, total: int, concurrency: int):
+    """Runs `total` requests with at most `concurrency` in flight. Returns (latencies, status counts, wall)."""
+    latencies, statuses = [], {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def worker():
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            response = await make_request(client, i)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+async def run(data_dir: Path, total: int, concurrency: int, gemini_latency: float, seed: int):
+    from app.config.state import APP_STATE
+    from app.services.fake_gemini import FakeGeminiClient
+
+    APP_STATE.clear()
+    APP_STATE['DATA_PATH'] = data_dir
+    APP_STATE['GEMINI_CLIENT'] = FakeGeminiClient(latency_s=gemini_latency)
+
+    from main import app
+    rng = random.Random(seed)
+    results, extras = {}, {}
+
+    async with app.router.lifespan_context(app):
+        producers = APP_STATE['PRODUCER_DF']
+        crops = APP_STATE['CROP_DF']['label'].astype(str).unique().tolist()
+        producer_ids = producers['producer_id'].astype(str).tolist()
+        images = [make_jpeg(rng) for _ in range(total)] # Built before timing starts
+
+        async def upload(client, i):
+            return await client.post(
+                '/api/v1/upload/photo',
+                files={'file': (f'bin{i}.jpg', images[i], 'image/jpeg')},
+                data={'cost_per_kg': '2.5', 'producer_id': rng.choice(producer_ids)},
+            )
+
+        def farmer(i):
+            p = producers.iloc[i % len(producers)]
+            return {
+                'crop_type': rng.choice(crops),
+                'soil_nitrogen': rng.uniform(0, 150), 'soil_phosphorus': rng.uniform(0, 150), 'soil_potassium': rng.uniform(0, 200),
+                'farmer_lat': float(p['latitude']) + rng.uniform(-0.1, 0.1),
+                'farmer_lon': float(p['longitude']) + rng.uniform(-0.1, 0.1),
+            }
+
+        farmers = [farmer(i) for i in range(total)]
+
+        async def recommend(client, i):
+            return await client.post('/api/v1/recommend_fertilizer', json=farmers[i])
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=120) as client:
+            for name, make_request in (('upload_photo', upload), ('recommend_fertilizer', recommend)):
+                latencies, statuses, wall = await drive(client, make_request, total, concurrency)
+                results[name] = {**summarize(latencies, wall), 'status_codes': {str(k): v for k, v in statuses.items()}}
+
+        extras['gemini_calls'] = APP_STATE['GEMINI_CLIENT'].tracker.calls
+        extras['gemini_max_in_flight'] = APP_STATE['GEMINI_CLIENT'].tracker.max_in_flight
+        if APP_STATE.get('RECOMMENDATION_CACHE') is not None:
+            extras['recommendation_cache'] = APP_STATE['RECOMMENDATION_CACHE'].stats()
+    return results, extras
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="End-to-end load test against the stub Gemini client.")
+    parser.add_argument('--scale', default='1k', help="1k, 100k, 1m or a number of offers")
+    parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--gemini-latency', type=float, default=0.2, help="Stub model latency in seconds")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', type=Path, help="Existing dataset directory (generated if omitted)")
+    parser.add_argument('--out', type=Path, help="Result file (default benchmarks/results/...)")
+    args = parser.parse_args(argv)
+    warnings.filterwarnings('ignore')
+
+    with tempfile.TemporaryDirectory(prefix='bench-data-') as tmp:
+        data_dir = args.data_dir or generate_dataset(Path(tmp), parse_scale(args.scale), args.seed)
+        results, extras = asyncio.run(run(data_dir, args.requests, args.concurrency, args.gemini_latency, args.seed))
+
+    meta = run_metadata(
+        'load', scale=args.scale, requests=args.requests, concurrency=args.concurrency,
+        gemini_latency_s=args.gemini_latency, seed=args.seed, **extras,
+    )
+    print_table(results)
+    for key, value in extras.items():
+        print(f"{key}: {value}")
+    print(f"Saved {save_results(meta, results, args.out)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# benchmarks/bench_micro.py
+# Micro-benchmarks for the hot functions against a synthetic dataset.
+#
+#   python benchmarks/bench_micro.py [--scale 1k|100k|1m] [--iterations 2000] [--data-dir DIR] [--out FILE]
+#
+# Without --data-dir a synthetic dataset is generated into a temp directory first
+# (benchmarks/synthetic_data.py). Results are printed and saved to benchmarks/results/
+# as JSON; diff two runs with benchmarks/compare.py.
+
+import argparse
+import itertools
+import random
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.harness import bench, print_table, run_metadata, save_results, summarize  # noqa: E402
+from benchmarks.synthetic_data import generate_dataset, parse_scale  # noqa: E402
+
+QUERY_POINTS = 512 # Distinct (location, waste type) queries cycled through
+
+
+def setup_app_state(data_dir: Path):
+    """Loads the dataset the same way the app lifespan does."""
+    from app.config.state import APP_STATE
+    from app.config.data_loader import load_app_state
+    from app.routes.agent.recommendation import get_npk_similarity_index, get_producer_index
+    from app.services.marketplace_services import get_offer_store
+    from app.services.recommendation_table import build_recommendation_table
+
+    APP_STATE.clear()
+    load_app_state(APP_STATE, data_dir)
+    get_producer_index()
+    get_offer_store()
+    get_npk_similarity_index()
+    build_recommendation_table()
+    return APP_STATE
+
+
+def run(data_dir: Path, scale: int, iterations: int, seed: int):
+    from app.models.models import FarmerInput
+    from app.routes.agent.recommendation import _compute_recommendation, find_best_offers
+    from app.services.marketplace_services import get_offer_store, save_offer_to_marketplace
+    from app.services.recommendation_table import get_recommendation_table
+    from app.services.serialization import dumps
+    from app.services.waste_calculator import calculate_weighted_npk_score, get_npk_row, get_waste_lookup
+
+    state = setup_app_state(data_dir)
+    rng = random.Random(seed)
+    producers = state['PRODUCER_DF']
+    waste_df = state['WASTE_DF_PROCESSED']
+    lookup = get_waste_lookup(waste_df)
+    waste_types = list(lookup.labels)
+    crops = state['CROP_DF']['label'].astype(str).unique().tolist()
+
+    picks = [rng.randrange(len(producers)) for _ in range(QUERY_POINTS)]
+    points = [
+        (float(producers['latitude'].iloc[i]) + rng.uniform(-0.2, 0.2),
+         float(producers['longitude'].iloc[i]) + rng.uniform(-0.2, 0.2),
+         rng.choice(waste_types))
+        for i in picks
+    ]
+    farmers = [
+        FarmerInput(crop_type=rng.choice(crops), soil_nitrogen=rng.uniform(0, 150), soil_phosphorus=rng.uniform(0, 150),
+                    soil_potassium=rng.uniform(0, 200), farmer_lat=lat, farmer_lon=lon)
+        for lat, lon, _ in points
+    ]
+    detection_sets = [
+        [{'label': rng.choice(waste_types), 'box_w': rng.random(), 'box_h': rng.random()} for _ in range(5)]
+        for _ in range(QUERY_POINTS)
+    ]
+    producer_ids = producers['producer_id'].astype(str).tolist()
+    table = get_recommendation_table()
+
+    point_cycle = itertools.cycle(points)
+    farmer_cycle = itertools.cycle(farmers)
+    detection_cycle = itertools.cycle(detection_sets)
+    label_cycle = itertools.cycle(waste_types + ['banana peels', 'EGGSHELLS', 'unknown thing'])
+
+    results = {}
+    results['find_best_offers'] = bench(lambda: find_best_offers(*next(point_cycle)), iterations)
+
+    def recommend_uncached():
+        farmer = next(farmer_cycle)
+        entry = table.lookup(farmer.crop_type, state['CROP_DF'])
+        return _compute_recommendation(farmer, entry)
+
+    results['recommendation_uncached'] = bench(recommend_uncached, iterations)
+    results['recommendation_uncached_json'] = bench(lambda: dumps(recommend_uncached()), iterations)
+    results['calculate_weighted_npk_score'] = bench(
+        lambda: calculate_weighted_npk_score(next(detection_cycle), waste_df), iterations * 5
+    )
+    results['get_npk_row'] = bench(lambda: get_npk_row(next(label_cycle), waste_df), iterations * 5)
+
+    npk = {'N': 10.0, 'P': 2.0, 'K': 3.0}
+    results['save_offer_to_marketplace'] = bench(
+        lambda: save_offer_to_marketplace(rng.choice(producer_ids), 2.5, rng.choice(waste_types), 42.0, npk),
+        iterations * 5, warmup=0, memory=False,
+    )
+    start = time.perf_counter()
+    get_offer_store().flush() # Time for the group-commit writer to drain every queued offer
+    results['save_offer_flush'] = summarize([time.perf_counter() - start])
+    get_offer_store().close()
+    return results
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the marketplace hot paths.")
+    parser.add_argument('--scale', default='1k', help="1k, 100k, 1m or a number of offers")
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', type=Path, help="Existing dataset directory (generated if omitted)")
+    parser.add_argument('--out', type=Path, help="Result file (default benchmarks/results/...)")
+    args = parser.parse_args(argv)
+    warnings.filterwarnings('ignore') # sklearn version warnings when unpickling the model
+
+    scale = parse_scale(args.scale)
+    with tempfile.TemporaryDirectory(prefix='bench-data-') as tmp:
+        data_dir = args.data_dir or generate_dataset(Path(tmp), scale, args.seed)
+        results = run(data_dir, scale, args.iterations, args.seed)
+
+    meta = run_metadata('micro', scale=args.scale, iterations=args.iterations, seed=args.seed)
+    print_table(results)
+    print(f"Saved {save_results(meta, results, args.out)}")
+
+
+if __name__ == '__main__':
+    main()
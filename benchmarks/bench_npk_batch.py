@@ -0,0 +1,74 @@
+# benchmarks/bench_npk_batch.py
+# Compares per-item NPK scoring with the vectorized batch functions at 10k items.
+#
+#   python benchmarks/bench_npk_batch.py [num_items]
+
+import random
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.services.waste_calculator import (  # noqa: E402
+    calculate_weighted_npk_score,
+    calculate_manual_npk_score,
+    calculate_batch_weighted_npk_scores,
+    calculate_batch_manual_npk_scores,
+    get_waste_lookup,
+    manual_npk_arrays,
+)
+
+ITEMS_PER_BIN = 5
+
+
+def best_of(fn, repeats: int = 5) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(num_items: int = 10_000) -> None:
+    waste_df = pd.read_csv(ROOT / 'app' / 'data' / 'waste_npk_processed.csv')
+    lookup = get_waste_lookup(waste_df)
+    labels = list(lookup.labels) + ['banana peel', 'egg shells', 'unrecognised item']
+
+    rng = random.Random(42)
+    batches = [
+        [
+            {'label': rng.choice(labels), 'box_w': rng.random(), 'box_h': rng.random()}
+            for _ in range(ITEMS_PER_BIN)
+        ]
+        for _ in range(num_items // ITEMS_PER_BIN)
+    ]
+    manual_items = [(rng.choice(lookup.labels), rng.uniform(1, 500)) for _ in range(num_items)]
+
+    # --- Correctness: batch results must match the per-item functions exactly ---
+    assert calculate_batch_weighted_npk_scores(batches, lookup) == [
+        calculate_weighted_npk_score(batch, lookup) for batch in batches
+    ]
+    assert calculate_batch_manual_npk_scores(manual_items, lookup) == [
+        calculate_manual_npk_score(label, kg, lookup) for label, kg in manual_items
+    ]
+
+    weighted_loop = best_of(lambda: [calculate_weighted_npk_score(batch, lookup) for batch in batches])
+    weighted_batch = best_of(lambda: calculate_batch_weighted_npk_scores(batches, lookup))
+    manual_loop = best_of(lambda: [calculate_manual_npk_score(label, kg, lookup) for label, kg in manual_items])
+    manual_batch = best_of(lambda: calculate_batch_manual_npk_scores(manual_items, lookup))
+    labels, quantities = zip(*manual_items)
+    manual_kernel = best_of(lambda: manual_npk_arrays(labels, quantities, lookup))
+
+    print(f"{num_items} items ({len(batches)} bins x {ITEMS_PER_BIN})")
+    print(f"  weighted  per-item: {weighted_loop * 1e3:8.2f} ms   batch: {weighted_batch * 1e3:8.2f} ms   speedup: {weighted_loop / weighted_batch:5.1f}x")
+    print(f"  manual    per-item: {manual_loop * 1e3:8.2f} ms   batch: {manual_batch * 1e3:8.2f} ms   speedup: {manual_loop / manual_batch:5.1f}x")
+    print(f"  manual    array kernel only (no per-row dicts): {manual_kernel * 1e3:8.2f} ms   speedup: {manual_loop / manual_kernel:5.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,60 @@
+# benchmarks/compare.py
+# Diffs two benchmark result files (e.g. from two commits).
+#
+#   python benchmarks/compare.py benchmarks/results/micro-1k-abc123.json benchmarks/results/micro-1k-def456.json
+#
+# Lower is better for latency, higher is better for throughput. Changes beyond --threshold
+# (default 10%) are flagged; the exit code is 1 if any benchmark regressed.
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+METRICS = (('p50_ms', -1), ('p95_ms', -1), ('p99_ms', -1), ('throughput_per_s', 1), ('peak_alloc_mb', -1))
+
+
+def load(path: Path):
+    payload = json.loads(Path(path).read_text())
+    return payload['meta'], payload['results']
+
+
+def compare(base_path: Path, head_path: Path, threshold: float = 0.10) -> bool:
+    """Prints a per-metric comparison. Returns True if any metric regressed past the threshold."""
+    base_meta, base = load(base_path)
+    head_meta, head = load(head_path)
+    if (base_meta.get('suite'), base_meta.get('scale')) != (head_meta.get('suite'), head_meta.get('scale')):
+        print("WARNING: Comparing different suites/scales; numbers are not like for like.")
+    print(f"base {base_meta.get('commit')} ({base_meta.get('timestamp')})  ->  head {head_meta.get('commit')} ({head_meta.get('timestamp')})")
+    print(f"{'benchmark':<32}{'metric':<18}{'base':>12}{'head':>12}{'change':>10}")
+
+    regressed = False
+    for name in sorted(set(base) | set(head)):
+        if name not in base or name not in head:
+            print(f"{name:<32}{'(only in ' + ('head' if name in head else 'base') + ')':<18}")
+            continue
+        for metric, better in METRICS:
+            old, new = base[name].get(metric), head[name].get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            flag = ''
+            if abs(change) > threshold:
+                improved = (change > 0) == (better > 0)
+                flag = '  faster' if improved else '  REGRESSION'
+                regressed |= not improved
+            print(f"{name:<32}{metric:<18}{old:>12.3f}{new:>12.3f}{change:>+10.1%}{flag}")
+    return regressed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument('base', type=Path)
+    parser.add_argument('head', type=Path)
+    parser.add_argument('--threshold', type=float, default=0.10, help="Relative change to flag (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+    return 1 if compare(args.base, args.head, args.threshold) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
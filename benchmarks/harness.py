@@ -0,0 +1,116 @@
+# benchmarks/harness.py
+# Shared helpers for the benchmark scripts: latency percentiles, peak memory and
+# result files that can be diffed across commits (see compare.py).
+
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / 'benchmarks' / 'results'
+
+
+# =======================================================
+#               MEASUREMENT
+# =======================================================
+
+def summarize(latencies_s: List[float], wall_s: Optional[float] = None) -> Dict[str, float]:
+    """p50/p95/p99/mean in ms plus throughput. wall_s defaults to the sum (sequential runs)."""
+    samples = np.asarray(latencies_s, dtype=np.float64) * 1e3
+    wall_s = wall_s if wall_s is not None else float(np.sum(latencies_s))
+    return {
+        'n': int(samples.size),
+        'mean_ms': round(float(samples.mean()), 4),
+        'p50_ms': round(float(np.percentile(samples, 50)), 4),
+        'p95_ms': round(float(np.percentile(samples, 95)), 4),
+        'p99_ms': round(float(np.percentile(samples, 99)), 4),
+        'max_ms': round(float(samples.max()), 4),
+        'throughput_per_s': round(samples.size / wall_s, 2) if wall_s > 0 else 0.0,
+    }
+
+
+def peak_alloc_mb(fn: Callable[[], Any]) -> float:
+    """Peak Python heap allocated during one call (tracemalloc; run outside the timed loop)."""
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 2**20, 3)
+
+
+def max_rss_mb() -> float:
+    """Peak resident set size of this process so far."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / 2**20 if sys.platform == 'darwin' else rss / 2**10, 1) # bytes on macOS, KiB on Linux
+
+
+def bench(fn: Callable[[], Any], iterations: int, warmup: int = 10, memory: bool = True) -> Dict[str, float]:
+    """Times fn() `iterations` times after `warmup` untimed calls."""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    result = summarize(latencies)
+    if memory:
+        result['peak_alloc_mb'] = peak_alloc_mb(fn)
+    return result
+
+
+# =======================================================
+#               RESULT FILES
+# =======================================================
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_metadata(suite: str, **params: Any) -> Dict[str, Any]:
+    return {
+        'suite': suite,
+        'commit': _git('rev-parse', '--short', 'HEAD') or 'unknown',
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        **params,
+    }
+
+
+def save_results(meta: Dict[str, Any], results: Dict[str, Dict[str, Any]], out: Optional[Path] = None) -> Path:
+    """Writes {meta, results} as JSON, named <suite>-<scale>-<commit>.json by default."""
+    if out is None:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        suffix = '-dirty' if meta.get('dirty') else ''
+        out = RESULTS_DIR / f"{meta['suite']}-{meta.get('scale', 'na')}-{meta['commit']}{suffix}.json"
+    meta = {**meta, 'max_rss_mb': max_rss_mb()}
+    Path(out).write_text(json.dumps({'meta': meta, 'results': results}, indent=2, sort_keys=True))
+    return Path(out)
+
+
+def print_table(results: Dict[str, Dict[str, Any]]) -> None:
+    print(f"{'benchmark':<36}{'n':>8}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'ops/s':>12}{'peak MB':>10}")
+    for name, r in results.items():
+        print(
+            f"{name:<36}{r['n']:>8}{r['p50_ms']:>11.3f}{r['p95_ms']:>11.3f}{r['p99_ms']:>11.3f}"
+            f"{r['throughput_per_s']:>12.1f}{r.get('peak_alloc_mb', float('nan')):>10.2f}"
+        )
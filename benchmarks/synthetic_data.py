@@ -0,0 +1,119 @@
+# benchmarks/synthetic_data.py
+# Generates a synthetic DATA_PATH (producers, offers, crops) at a given scale, using the
+# columns, value ranges and label sets of the real app/data/*.csv files.
+#
+#   python benchmarks/synthetic_data.py <out_dir> [--scale 1k|100k|1m|<int>] [--seed 42]
+#
+# Scale is the number of offers. Producers = scale / 20 (min 50), crop rows = scale / 100 (min 80).
+# The waste NPK table and the model are copied unchanged (their labels are fixed by the model).
+
+import argparse
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+SOURCE_DIR = ROOT / 'app' / 'data'
+
+SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+CITY_SPREAD_DEG = 0.35 # Std-dev of producer scatter around each real city's centroid
+
+
+def parse_scale(value: str) -> int:
+    return SCALES.get(value.lower()) or int(value)
+
+
+def _sample_numeric(series: pd.Series, n: int, rng: np.random.Generator, jitter: float = 0.1) -> np.ndarray:
+    """Resamples real values with multiplicative jitter, clipped to the real [min, max] range."""
+    values = series.to_numpy(dtype=np.float64)
+    sampled = rng.choice(values, size=n) * rng.uniform(1 - jitter, 1 + jitter, size=n)
+    sampled = np.clip(sampled, values.min(), values.max())
+    if pd.api.types.is_integer_dtype(series):
+        return np.rint(sampled).astype(np.int64)
+    return sampled
+
+
+def synthesize_like(df: pd.DataFrame, n: int, rng: np.random.Generator) -> pd.DataFrame:
+    """n rows with df's columns: numeric columns resampled + jittered, others resampled as-is."""
+    data = {}
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_bool_dtype(series):
+            data[column] = rng.random(n) < series.mean()
+        elif pd.api.types.is_numeric_dtype(series):
+            data[column] = _sample_numeric(series, n, rng)
+        else:
+            data[column] = rng.choice(series.astype(str).to_numpy(), size=n)
+    return pd.DataFrame(data, columns=df.columns)
+
+
+def make_producers(real: pd.DataFrame, n: int, rng: np.random.Generator) -> pd.DataFrame:
+    producers = synthesize_like(real, n, rng)
+    producers['producer_id'] = [f"P{i:07d}" for i in range(n)]
+    producers['producer_name'] = [f"Producer {i}" for i in range(n)]
+    producers['contact'] = [f"+91{rng.integers(10**8, 10**9)}" for _ in range(n)]
+
+    # Scatter producers around the real city centroids (keeps realistic geo density)
+    centroids = real.groupby('city')[['latitude', 'longitude']].mean()
+    cities = producers['city'].to_numpy()
+    producers['latitude'] = centroids.loc[cities, 'latitude'].to_numpy() + rng.normal(0, CITY_SPREAD_DEG, n)
+    producers['longitude'] = centroids.loc[cities, 'longitude'].to_numpy() + rng.normal(0, CITY_SPREAD_DEG, n)
+    return producers
+
+
+def make_offers(real: pd.DataFrame, producer_ids: np.ndarray, waste_types: np.ndarray, n: int, rng: np.random.Generator) -> pd.DataFrame:
+    offers = synthesize_like(real, n, rng)
+    offers['offer_id'] = [f"O{i:08d}" for i in range(n)]
+    offers['producer_id'] = rng.choice(producer_ids, size=n)
+    offers['waste_type'] = rng.choice(waste_types, size=n) # Every waste type the NPK table knows
+    return offers
+
+
+def make_crops(real: pd.DataFrame, n: int, rng: np.random.Generator) -> pd.DataFrame:
+    crops = synthesize_like(real, n, rng)
+    # Keep the real crop names, then add synthetic varieties so the crop table grows with scale
+    extra = max(0, n - len(real))
+    crops['label'] = np.concatenate([real['label'].to_numpy(), [f"crop_{i}" for i in range(extra)]])[:n]
+    crops.loc[:len(real) - 1, ['N', 'P', 'K']] = real[['N', 'P', 'K']].to_numpy()[:n]
+    return crops
+
+
+def generate_dataset(out_dir: Path, scale: int, seed: int = 42) -> Path:
+    """Writes a complete DATA_PATH (CSV files + model) for `scale` offers. Returns out_dir."""
+    rng = np.random.default_rng(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    real_producers = pd.read_csv(SOURCE_DIR / 'waste_producers.csv', dtype={'contact': str})
+    real_offers = pd.read_csv(SOURCE_DIR / 'offers.csv')
+    real_crops = pd.read_csv(SOURCE_DIR / 'crop_npk_requirements.csv')
+    waste_df = pd.read_csv(SOURCE_DIR / 'waste_npk_processed.csv')
+
+    producers = make_producers(real_producers, max(50, scale // 20), rng)
+    offers = make_offers(real_offers, producers['producer_id'].to_numpy(), waste_df['Waste_Type'].unique(), scale, rng)
+    crops = make_crops(real_crops, max(len(real_crops), scale // 100), rng)
+
+    producers.to_csv(out_dir / 'waste_producers.csv', index=False)
+    offers.to_csv(out_dir / 'offers.csv', index=False)
+    crops.to_csv(out_dir / 'crop_npk_requirements.csv', index=False)
+    for name in ('waste_npk_processed.csv', 'waste_npk.csv', 'waste_recommender_model.joblib'):
+        if (SOURCE_DIR / name).exists():
+            shutil.copy(SOURCE_DIR / name, out_dir / name)
+    return out_dir
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic DATA_PATH for benchmarks.")
+    parser.add_argument('out_dir', type=Path)
+    parser.add_argument('--scale', default='1k', help="1k, 100k, 1m or a number of offers")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+    out = generate_dataset(args.out_dir, parse_scale(args.scale), args.seed)
+    print(f"Wrote synthetic dataset ({parse_scale(args.scale)} offers) to {out}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,10 @@
-from fastapi import FastAPI
+from app.config.api import app # Main app: routers + lifespan data loader
 from app.services.agent_service import router as agent_router
-
-app = FastAPI()
+from app.services.auth_service import router as auth_router
 
 # Include routers from services
 app.include_router(agent_router)
+app.include_router(auth_router, prefix="/api/v1")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,59 @@
+# tests/conftest.py
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+# Read at import time by app/config/constants.py: offline vision client, cheap password hashing,
+# reset tokens in the response (no mailer in tests)
+os.environ.setdefault("USE_FAKE_GEMINI", "1")
+os.environ.setdefault("AUTH_SCRYPT_N", "1024")
+os.environ.setdefault("AUTH_RETURN_RESET_TOKEN", "1")
+
+from app.config.state import APP_STATE  # noqa: E402
+
+SEED_FILES = (
+    'crop_npk_requirements.csv', 'offers.csv', 'waste_npk.csv', 'waste_npk_processed.csv',
+    'waste_producers.csv', 'waste_recommender_model.joblib',
+)
+
+
+@pytest.fixture
+def data_dir(tmp_path: Path) -> Path:
+    """A private copy of the seed data (every test gets its own offers.db, shards, users...)."""
+    for name in SEED_FILES:
+        shutil.copy(REPO_ROOT / 'app' / 'data' / name, tmp_path / name)
+    return tmp_path
+
+
+@pytest.fixture
+def client(data_dir: Path):
+    """TestClient over the real app (lifespan included) on a fresh APP_STATE."""
+    from fastapi.testclient import TestClient
+    from main import app
+
+    APP_STATE.clear()
+    APP_STATE['DATA_PATH'] = data_dir
+    with TestClient(app) as test_client:
+        yield test_client
+    APP_STATE.clear()
+
+
+@pytest.fixture
+def register_user(client):
+    """register_user('alice') -> {'Authorization': 'Bearer ...'} for a new account."""
+    def register(username: str, password: str = "correct horse battery") -> dict:
+        response = client.post(
+            "/api/v1/auth/register",
+            json={"username": username, "password": password, "email": f"{username}@example.com"},
+        )
+        assert response.status_code == 201, response.text
+        response = client.post("/api/v1/auth/login", json={"username": username, "password": password})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return register
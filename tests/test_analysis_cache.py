@@ -0,0 +1,102 @@
+# tests/test_analysis_cache.py
+import os
+import time
+
+import pytest
+
+from app.services.analysis_cache import AnalysisCache
+
+DETECTIONS = [{"label": "Egg Shell", "box_2d": [0, 0, 10, 10]}]
+
+
+@pytest.mark.parametrize("content", ['{"phash": null}', '[1, 2]', '{"created_at": "soon", "detections": []}', '{trunc'])
+def test_malformed_disk_entry_is_a_miss(tmp_path, content):
+    cache = AnalysisCache(disk_dir=tmp_path)
+    path = cache._disk_path("ab" * 32)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+    assert cache.get("ab" * 32) is None
+    assert not path.exists()
+
+
+def test_disk_entries_survive_a_restart(tmp_path):
+    AnalysisCache(disk_dir=tmp_path).put("cd" * 32, DETECTIONS)
+    cache = AnalysisCache(disk_dir=tmp_path)
+    assert cache.get("cd" * 32) == DETECTIONS
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_prune_drops_expired_then_oldest_files(tmp_path):
+    cache = AnalysisCache(disk_dir=tmp_path, ttl_s=3600, disk_max_entries=2)
+    while cache._pruning: # Startup prune (empty directory) still running
+        time.sleep(0.01)
+    now = time.time()
+    for i, age in enumerate((7200, 30, 20, 10)):
+        key = f"{i:02d}" * 32
+        cache.put(key, DETECTIONS)
+        os.utime(cache._disk_path(key), (now - age, now - age))
+
+    assert cache.prune_disk() == 2
+    assert sorted(path.name[:2] for path in tmp_path.glob("*/*.json")) == ["02", "03"]
+
+
+def test_entries_are_scoped_to_the_detector_namespace(tmp_path):
+    from PIL import Image
+
+    image = Image.new("RGB", (64, 48), (200, 180, 120))
+    cache = AnalysisCache(disk_dir=tmp_path, phash_max_distance=4)
+    cache.put("ef" * 32, DETECTIONS, image, namespace="gemini-gemini-2.5-flash")
+
+    assert cache.get("ef" * 32, image, namespace="gemini-gemini-2.5-flash") == DETECTIONS
+    assert cache.get("ef" * 32, image, namespace="local-0123abcd") is None
+    restarted = AnalysisCache(disk_dir=tmp_path)
+    assert restarted.get("ef" * 32, namespace="local-0123abcd") is None
+    assert restarted.get("ef" * 32, namespace="gemini-gemini-2.5-flash") == DETECTIONS
+
+
+def test_upload_keeps_cache_io_off_the_event_loop_and_rescans_after_a_backend_switch(client, monkeypatch):
+    import asyncio
+    from io import BytesIO
+
+    from PIL import Image
+
+    from app.config.state import APP_STATE
+    from app.services.fake_gemini import FakeGeminiClient
+    from app.services.vision_service import GeminiDetector
+
+    class OtherModel(GeminiDetector):
+        name = "other"
+
+    cache = APP_STATE['ANALYSIS_CACHE']
+    calls = [] # (method, ran on the event loop thread)
+    for method in ("get_blocking", "put"):
+        original = getattr(cache, method)
+
+        def spy(*args, method=method, original=original, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                calls.append((method, True))
+            except RuntimeError:
+                calls.append((method, False))
+            return original(*args, **kwargs)
+        monkeypatch.setattr(cache, method, spy)
+
+    out = BytesIO()
+    Image.new("RGB", (64, 48), (10, 20, 30)).save(out, format="PNG")
+    first, second = FakeGeminiClient(latency_s=0), FakeGeminiClient(latency_s=0)
+
+    def upload(detector):
+        APP_STATE['VISION_DETECTOR'] = detector
+        response = client.post(
+            "/api/v1/upload/photo",
+            files={"file": ("waste.png", out.getvalue(), "image/png")},
+            data={"cost_per_kg": "2.5", "producer_id": "P007"},
+        )
+        assert response.status_code == 200, response.text
+
+    upload(GeminiDetector(first))
+    upload(GeminiDetector(first)) # Cached
+    upload(OtherModel(second)) # Same image, another model: analysed again
+    assert (first.tracker.calls, second.tracker.calls) == (1, 1)
+    assert calls == [("get_blocking", False), ("put", False)] * 2
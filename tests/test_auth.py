@@ -0,0 +1,54 @@
+# tests/test_auth.py
+
+
+def test_logout_revokes_the_token(client, register_user):
+    alice = register_user("alice")
+    assert client.get("/api/v1/auth/me", headers=alice).status_code == 200
+
+    assert client.post("/api/v1/auth/logout", headers=alice).status_code == 200
+    response = client.get("/api/v1/auth/me", headers=alice)
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
+
+
+def test_password_reset_signs_out_existing_sessions(client, register_user):
+    alice = register_user("alice")
+    response = client.post("/api/v1/auth/forgot-password", json={"email": "alice@example.com"})
+    token = response.json()["reset_token"]
+
+    response = client.post("/api/v1/auth/reset-password", json={"token": token, "new_password": "a brand new secret"})
+    assert response.status_code == 200, response.text
+    assert client.get("/api/v1/auth/me", headers=alice).status_code == 401
+
+    response = client.post("/api/v1/auth/login", json={"username": "alice", "password": "a brand new secret"})
+    assert response.status_code == 200, response.text
+
+
+def test_revocations_reach_other_workers_on_refresh(tmp_path):
+    from app.services.offer_store import OfferStore
+    from app.services.security import RevocationList
+
+    stores = [OfferStore(tmp_path / 'offers.db'), OfferStore(tmp_path / 'offers.db')]
+    here, there = (RevocationList(store, token_ttl_s=3600) for store in stores)
+    claims = {'sub': 'U1', 'jti': 'j1', 'iat': 0, 'exp': 4_000_000_000}
+
+    here.revoke_token(claims)
+    assert here.is_revoked(claims) and not there.is_revoked(claims)
+    assert there.refresh() == 1
+    assert there.is_revoked(claims)
+    for store in stores:
+        store.close()
+
+
+def test_bad_credentials_and_duplicate_accounts(client, register_user):
+    register_user("alice")
+    response = client.post("/api/v1/auth/login", json={"username": "alice", "password": "wrong password!"})
+    assert response.status_code == 401
+    response = client.post("/api/v1/auth/login", json={"username": "nobody", "password": "wrong password!"})
+    assert response.status_code == 401
+
+    response = client.post(
+        "/api/v1/auth/register",
+        json={"username": "alice", "password": "correct horse battery", "email": "other@example.com"},
+    )
+    assert response.status_code == 409
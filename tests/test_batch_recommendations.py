@@ -0,0 +1,60 @@
+# tests/test_batch_recommendations.py
+import numpy as np
+
+from app.config.state import APP_STATE
+from app.models.models import FarmerInput
+from app.routes.agent.recommendation import MAX_SEARCH_RADIUS_KM, get_producer_index, iter_batch_recommendations
+from app.services.geo_index import haversine_km, within_bounding_box
+from app.services.marketplace_services import get_offer_store
+from app.services.recommendation_table import get_recommendation_table
+
+
+def _full_scan(farmer, waste_type):
+    """Reference ranking: every available offer of the waste type, nationwide."""
+    index = get_producer_index()
+    ranked = []
+    for record in get_offer_store().available_offers(waste_type):
+        location = index.location(record['producer_id'])
+        if location is None:
+            continue
+        distance = float(haversine_km(farmer.farmer_lat, farmer.farmer_lon, *location))
+        if distance <= MAX_SEARCH_RADIUS_KM:
+            ranked.append((record['cost_per_kg'], distance, record['offer_id']))
+    return [(offer_id, distance) for _, distance, offer_id in sorted(ranked)[:5]]
+
+
+def test_prefiltered_batch_matches_a_full_scan(client):
+    producers = APP_STATE['PRODUCER_DF']
+    rng = np.random.default_rng(7)
+    crops = list(APP_STATE['CROP_DF']['label'].unique()[:4])
+    farmers = []
+    for k in range(120):
+        # Near a random producer (mostly in range), plus some far from every city
+        base = producers.iloc[rng.integers(len(producers))]
+        spread = 0.5 if k % 6 else 5.0
+        farmers.append(FarmerInput(
+            crop_type=crops[k % len(crops)], soil_nitrogen=10, soil_phosphorus=10, soil_potassium=10,
+            farmer_lat=float(base['latitude'] + rng.normal(0, spread)),
+            farmer_lon=float(base['longitude'] + rng.normal(0, spread)),
+        ))
+
+    results = list(iter_batch_recommendations(farmers))
+    assert sorted(result.index for result in results) == list(range(len(farmers)))
+    matched = 0
+    for result in results:
+        farmer = farmers[result.index]
+        expected = _full_scan(farmer, get_recommendation_table().lookup(farmer.crop_type).best_waste_type)
+        got = [(supplier.offer_id, supplier.distance_km) for supplier in result.nearest_suppliers]
+        assert [offer_id for offer_id, _ in got] == [offer_id for offer_id, _ in expected]
+        assert np.allclose([d for _, d in got], [d for _, d in expected])
+        matched += bool(got)
+    assert matched > 0
+
+
+def test_bounding_box_keeps_every_point_in_range():
+    rng = np.random.default_rng(3)
+    centers_lat, centers_lon = rng.uniform(-70, 70, 5), rng.uniform(-170, 170, 5)
+    lat, lon = rng.uniform(-80, 80, 20000), rng.uniform(-180, 180, 20000)
+    in_range = (haversine_km(lat[:, None], lon[:, None], centers_lat, centers_lon) <= 500).any(axis=1)
+    assert in_range.any()
+    assert not (in_range & ~within_bounding_box(lat, lon, centers_lat, centers_lon, 500)).any()
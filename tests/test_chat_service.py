@@ -0,0 +1,34 @@
+# tests/test_chat_service.py
+import asyncio
+
+import pytest
+
+from app.services.chat_service import ChatBroker, InProcessBroker, Subscriber
+
+
+def test_broker_interface_is_abstract():
+    with pytest.raises(TypeError):
+        ChatBroker()
+
+    class PublishOnly(ChatBroker):
+        async def publish(self, room, frame):
+            pass
+
+    with pytest.raises(TypeError):
+        PublishOnly() # subscribe/unsubscribe missing
+
+
+def test_in_process_broker_fans_out_per_room():
+    async def scenario():
+        broker = InProcessBroker()
+        alice, bob = Subscriber(max_pending=4), Subscriber(max_pending=4)
+        broker.subscribe('O1', alice)
+        broker.subscribe('O2', bob)
+        await broker.publish('O1', '{"body": "hi"}')
+        assert alice.queue.get_nowait() == '{"body": "hi"}'
+        assert bob.queue.empty()
+
+        broker.unsubscribe('O1', alice)
+        broker.unsubscribe('O2', bob)
+        assert broker.room_count() == 0
+    asyncio.run(scenario())
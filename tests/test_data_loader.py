@@ -0,0 +1,45 @@
+# tests/test_data_loader.py
+import os
+import time
+
+import pandas as pd
+
+from app.config import data_loader
+from app.config.data_loader import SNAPSHOT_POINTER, read_snapshot, write_snapshot
+
+
+def _dataset(tmp_path, rows=3):
+    df = pd.DataFrame({'label': [f"crop-{i}" for i in range(rows)], 'N': [float(i) for i in range(rows)]})
+    source = tmp_path / 'crops.csv'
+    df.to_csv(source, index=False)
+    return df, source
+
+
+def _current(snapshot_dir):
+    return snapshot_dir / (snapshot_dir / SNAPSHOT_POINTER).read_text()
+
+
+def test_rewrite_swaps_versions_and_keeps_the_old_one_for_readers(tmp_path):
+    df, source = _dataset(tmp_path)
+    snapshot_dir = tmp_path / 'snapshots' / 'crop_df'
+    write_snapshot(df, snapshot_dir, source)
+    first = _current(snapshot_dir)
+
+    write_snapshot(df, snapshot_dir, source)
+    assert _current(snapshot_dir) != first
+    assert (first / 'meta.json').exists() # A reader that already resolved it can still finish
+    assert read_snapshot(snapshot_dir, source).to_dict('list') == df.to_dict('list')
+
+    old = time.time() - data_loader.SNAPSHOT_GRACE_S - 1
+    os.utime(first, (old, old))
+    write_snapshot(df, snapshot_dir, source)
+    assert not first.exists()
+
+
+def test_version_vanishing_mid_read_falls_back_to_the_csv(tmp_path):
+    df, source = _dataset(tmp_path)
+    snapshot_dir = tmp_path / 'snapshots' / 'crop_df'
+    write_snapshot(df, snapshot_dir, source)
+    (_current(snapshot_dir) / 'col1.npy').unlink()
+
+    assert read_snapshot(snapshot_dir, source) is None
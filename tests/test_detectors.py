@@ -0,0 +1,40 @@
+# tests/test_detectors.py
+import asyncio
+
+import pytest
+
+from app.services.detectors import CascadeDetector, Detector
+
+
+class _Fixed(Detector):
+    def __init__(self, name, detections):
+        self.name = name
+        self.detections = detections
+        self.calls = 0
+
+    async def detect(self, prepared):
+        self.calls += 1
+        if isinstance(self.detections, Exception):
+            raise self.detections
+        return self.detections
+
+
+def test_detector_interface_is_abstract():
+    with pytest.raises(TypeError):
+        Detector()
+
+
+@pytest.mark.parametrize("local_result, expected_backend", [
+    ([{'label': 'Egg Shell', 'confidence': 0.9, 'relative_quantity_score': 5}], 'local'),
+    ([{'label': 'Egg Shell', 'confidence': 0.3, 'relative_quantity_score': 5}], 'remote'),
+    ([{'label': 'Moon Rock', 'confidence': 0.9, 'relative_quantity_score': 5}], 'remote'),
+    (RuntimeError("model missing"), 'remote'),
+])
+def test_cascade_falls_back_unless_the_local_model_is_sure(local_result, expected_backend):
+    local = _Fixed('local', local_result)
+    remote = _Fixed('remote', [{'label': 'Egg Shell', 'relative_quantity_score': 4}])
+    cascade = CascadeDetector(local, remote, is_known_label=lambda label: label == 'Egg Shell')
+
+    detections = asyncio.run(cascade.detect(prepared=None))
+    assert detections == (local if expected_backend == 'local' else remote).detections
+    assert remote.calls == (expected_backend == 'remote')
@@ -0,0 +1,50 @@
+# tests/test_offer_import.py
+
+IMPORT_URL = "/api/v1/offers/import"
+CSV_HEADER = "offer_id,producer_id,waste_type,quantity_kg,cost_per_kg\n"
+
+
+def _import(client, headers, *rows):
+    return client.post(
+        IMPORT_URL, content=CSV_HEADER + "".join(f"{row}\n" for row in rows),
+        headers={**headers, "Content-Type": "text/csv"},
+    )
+
+
+def test_import_requires_a_token(client):
+    response = _import(client, {}, "O002,P007,Egg Shell,1,0.5")
+    assert response.status_code == 401
+    assert client.get("/api/v1/offers/O002").json()['quantity_kg'] == 254
+
+
+def test_import_updates_an_offer_but_not_its_producer(client, register_user):
+    alice = register_user("alice")
+    response = _import(client, alice, "O002,P007,Egg Shell,300,2.5", "O003,P007,Coffee Grounds,10,0.1")
+    assert response.status_code == 200, response.text
+    summary = response.json()
+    assert (summary['imported'], summary['rejected']) == (1, 1)
+    assert summary['errors'] == [{"line": 3, "error": "Offer 'O003' belongs to producer 'P031'."}]
+
+    assert client.get("/api/v1/offers/O002").json()['quantity_kg'] == 300
+    assert client.get("/api/v1/offers/O003").json()['producer_id'] == 'P031'
+
+
+def test_import_skips_offers_with_reservations_on_hold(client, register_user):
+    alice = register_user("alice")
+    reservation = client.post("/api/v1/offers/O002/reservations", json={"quantity_kg": 50}, headers=alice)
+    assert reservation.status_code == 201
+
+    summary = _import(client, alice, "O002,P007,Egg Shell,999,2.5").json()
+    assert (summary['imported'], summary['rejected']) == (0, 1)
+    assert client.get("/api/v1/offers/O002").json()['quantity_kg'] == 204
+
+    client.delete(f"/api/v1/reservations/{reservation.json()['reservation_id']}", headers=alice)
+    assert _import(client, alice, "O002,P007,Egg Shell,999,2.5").json()['imported'] == 1
+
+
+def test_repeated_new_offer_id_keeps_its_first_producer(client, register_user):
+    summary = _import(
+        client, register_user("alice"), "NEW1,P007,Egg Shell,10,1", "NEW1,P031,Egg Shell,10,1",
+    ).json()
+    assert (summary['imported'], summary['rejected']) == (1, 1)
+    assert client.get("/api/v1/offers/NEW1").json()['producer_id'] == 'P007'
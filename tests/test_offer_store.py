@@ -0,0 +1,100 @@
+# tests/test_offer_store.py
+import sqlite3
+
+import pytest
+
+from app.services import offer_store
+from app.services.offer_store import OfferStore
+
+
+def _offer(offer_id, quantity_kg=100.0):
+    return {
+        'offer_id': offer_id, 'producer_id': 'P1', 'waste_type': 'Egg Shell',
+        'quantity_kg': quantity_kg, 'cost_per_kg': 2.0, 'is_available': True,
+    }
+
+
+def test_group_commit_makes_appends_durable(tmp_path):
+    store = OfferStore(tmp_path / 'offers.db', batch_size=16)
+    for i in range(50):
+        store.append(_offer(f"O{i:03d}"))
+    assert store.get('O049') is not None # Visible locally before it is committed
+    store.flush()
+    store.close()
+
+    reopened = OfferStore(tmp_path / 'offers.db')
+    assert len(reopened.dataframe()) == 50
+    assert reopened.get('O049')['quantity_kg'] == 100.0
+    reopened.close()
+
+
+def _failing_commits(store, monkeypatch, failures):
+    """Makes the next `failures` group commits of `store` raise, like a full or locked disk."""
+    monkeypatch.setattr(offer_store, 'COMMIT_RETRY_DELAY_S', 0)
+    commit_rows = store._commit_rows
+    remaining = [failures]
+
+    def commit(rows):
+        if remaining[0] > 0:
+            remaining[0] -= 1
+            raise sqlite3.OperationalError("disk I/O error")
+        commit_rows(rows)
+    monkeypatch.setattr(store, '_commit_rows', commit)
+
+
+def test_append_future_resolves_after_a_retried_commit(tmp_path, monkeypatch):
+    store = OfferStore(tmp_path / 'offers.db')
+    _failing_commits(store, monkeypatch, offer_store.COMMIT_ATTEMPTS - 1)
+
+    assert store.append(_offer('O1')).result(timeout=5) is None
+    assert store.read_committed('O1')[0]['quantity_kg'] == 100.0
+    store.close()
+
+
+def test_failed_commit_fails_the_future_and_rolls_the_append_back(tmp_path, monkeypatch):
+    store = OfferStore(tmp_path / 'offers.db')
+    store.append(_offer('O1')).result(timeout=5)
+    _failing_commits(store, monkeypatch, offer_store.COMMIT_ATTEMPTS)
+
+    new_offer, changed_offer = store.append(_offer('O2')), store.append(_offer('O1', quantity_kg=5.0))
+    for committed in (new_offer, changed_offer):
+        with pytest.raises(sqlite3.OperationalError):
+            committed.result(timeout=5)
+
+    assert store.get('O2') is None
+    assert store.available_offers('Egg Shell') == [store.get('O1')]
+    assert store.get('O1')['quantity_kg'] == 100.0
+    assert list(store.dataframe()['offer_id']) == ['O1']
+    store.close()
+
+
+def test_upload_reports_a_failed_commit_as_500(client, monkeypatch):
+    from app.services.marketplace_services import get_offer_store
+
+    store = get_offer_store().shard_for_producer('P007')
+    _failing_commits(store, monkeypatch, offer_store.COMMIT_ATTEMPTS)
+    before = len(get_offer_store())
+
+    response = client.post("/api/v1/upload/photo", data={
+        "cost_per_kg": "2.5", "producer_id": "P007", "manual_waste_type": "Egg Shell", "manual_quantity_kg": "12",
+    })
+    assert response.status_code == 500, response.text
+    assert len(get_offer_store()) == before
+
+
+def test_other_workers_see_committed_appends_on_refresh(tmp_path):
+    writer = OfferStore(tmp_path / 'offers.db')
+    reader = OfferStore(tmp_path / 'offers.db', refresh_interval_s=0)
+
+    for i in range(50):
+        writer.append(_offer(f"O{i:03d}"))
+    writer.flush()
+    assert reader.refresh(force=True) == 50
+    assert reader.get('O049')['quantity_kg'] == 100.0
+
+    writer.append(_offer('O000', quantity_kg=5.0))
+    writer.flush()
+    reader.refresh(force=True)
+    assert reader.get('O000')['quantity_kg'] == 5.0
+    reader.close()
+    writer.close()
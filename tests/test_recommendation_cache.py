@@ -0,0 +1,74 @@
+# tests/test_recommendation_cache.py
+import dataclasses
+
+import pytest
+
+from app.services.recommendation_cache import RecommendationCache
+from app.services.regional_store import RegionalOfferStore
+
+LOCATION = (18.52, 73.85)
+
+
+@dataclasses.dataclass
+class _Payload:
+    recommended_waste: str
+    nearest_suppliers: list
+
+
+def _offer(offer_id, quantity_kg):
+    return {
+        'offer_id': offer_id, 'producer_id': 'P1', 'waste_type': 'Egg Shell',
+        'quantity_kg': quantity_kg, 'cost_per_kg': 2.0, 'is_available': True,
+    }
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two stores over the same files, as two worker processes would open them."""
+    stores = [
+        RegionalOfferStore(tmp_path / 'offers.db', tmp_path / 'regions', [], lambda _: None, refresh_interval_s=0)
+        for _ in range(2)
+    ]
+    yield stores
+    for store in stores:
+        store.close()
+
+
+def _cache(store):
+    cache = RecommendationCache(locate=lambda _: LOCATION, refresh=store.refresh)
+    store.attach_index(cache)
+    return cache
+
+
+def test_offer_change_invalidates_matching_entries(workers):
+    store = workers[0]
+    cache = _cache(store)
+    computed = []
+
+    def compute():
+        computed.append(1)
+        return _Payload('Egg Shell', [{'offer_id': 'O1'}])
+
+    cache.get_or_compute('k', *LOCATION, compute)
+    cache.get_or_compute('k', *LOCATION, compute)
+    assert len(computed) == 1
+
+    store.upsert_many([_offer('O1', 10.0)])
+    cache.get_or_compute('k', *LOCATION, compute)
+    assert len(computed) == 2
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_write_by_another_worker_invalidates_before_the_next_hit(workers):
+    writer, reader = workers
+    cache = _cache(reader)
+    computed = []
+
+    def compute():
+        computed.append(1)
+        return _Payload('Egg Shell', [{'offer_id': 'O1'}])
+
+    cache.get_or_compute('k', *LOCATION, compute)
+    writer.upsert_many([_offer('O1', 10.0)])
+    cache.get_or_compute('k', *LOCATION, compute)
+    assert len(computed) == 2
@@ -0,0 +1,24 @@
+# tests/test_recommendation_table.py
+import time
+
+from app.config.state import APP_STATE
+from app.services import recommendation_table
+from app.services.recommendation_table import get_recommendation_table
+
+
+def test_source_change_rebuilds_the_table_in_the_background(client, data_dir, monkeypatch):
+    monkeypatch.setattr(recommendation_table, 'SOURCE_CHECK_INTERVAL_S', 0.0)
+    table = get_recommendation_table()
+    assert table.lookup('quinoa') is None
+
+    with open(data_dir / 'crop_npk_requirements.csv', 'a') as crop_csv:
+        crop_csv.write("40,60,80,21.0,70.0,6.5,100.0,quinoa\n")
+    assert get_recommendation_table() is table # Served at once; the rebuild runs off the request path
+
+    deadline = time.monotonic() + 10
+    while APP_STATE['RECOMMENDATION_TABLE'] is table and time.monotonic() < deadline:
+        time.sleep(0.02)
+    rebuilt = get_recommendation_table()
+    assert rebuilt is not table
+    assert rebuilt.lookup('quinoa') is not None
+    assert 'quinoa' in set(APP_STATE['CROP_DF']['label'])
@@ -0,0 +1,53 @@
+# tests/test_regional_store.py
+import pytest
+
+from app.services.regional_store import RegionalOfferStore
+from app.services.regions import DEFAULT_REGION
+
+PRODUCER_REGIONS = {'P-PUNE': 'pune', 'P-DELHI': 'delhi'}
+
+
+def _offer(offer_id, producer_id, quantity_kg=100.0):
+    return {
+        'offer_id': offer_id, 'producer_id': producer_id, 'waste_type': 'Egg Shell',
+        'quantity_kg': quantity_kg, 'cost_per_kg': 2.0, 'is_available': True,
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RegionalOfferStore(
+        tmp_path / 'offers.db', tmp_path / 'regions', ['pune', 'delhi'], PRODUCER_REGIONS.get,
+    )
+    yield store
+    store.close()
+
+
+def test_writes_are_routed_by_producer_region(store):
+    store.upsert_many([_offer('O1', 'P-PUNE'), _offer('O2', 'P-DELHI'), _offer('O3', 'P-UNKNOWN')])
+    assert store.shard_for_offer('O1') is store.shards['pune']
+    assert store.shard_for_offer('O2') is store.shards['delhi']
+    assert store.shard_for_offer('O3') is store.shards[DEFAULT_REGION]
+
+
+def test_reimport_under_another_region_updates_the_existing_offer(store):
+    store.upsert_many([_offer('O1', 'P-PUNE')])
+    store.upsert_many([_offer('O1', 'P-DELHI', quantity_kg=40.0)])
+
+    assert store.stats() == {DEFAULT_REGION: 0, 'delhi': 0, 'pune': 1}
+    assert store.get('O1')['quantity_kg'] == 40.0
+    assert list(store.dataframe()['offer_id']) == ['O1']
+
+    store.append(_offer('O1', 'P-DELHI', quantity_kg=30.0))
+    store.flush()
+    assert store.stats()['delhi'] == 0
+    assert store.get('O1')['quantity_kg'] == 30.0
+
+
+def test_shutdown_leaves_the_seed_csv_untouched(client, data_dir):
+    from app.services.marketplace_services import get_offer_store, shutdown_offer_store
+
+    seed = (data_dir / 'offers.csv').read_bytes()
+    get_offer_store().upsert_many([_offer('O-NEW', 'P007')])
+    shutdown_offer_store()
+    assert (data_dir / 'offers.csv').read_bytes() == seed
@@ -0,0 +1,93 @@
+# tests/test_reservations.py
+
+RESERVE_URL = "/api/v1/offers/O002/reservations"
+
+
+def _reserve(client, headers=None, **body):
+    response = client.post(RESERVE_URL, json={"quantity_kg": 10, **body}, headers=headers or {})
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def _status(reservation_id):
+    from app.services.marketplace_services import get_reservation_service
+    with get_reservation_service()._locate(reservation_id).write_transaction() as (conn, _):
+        row = conn.execute("SELECT status FROM reservations WHERE reservation_id = ?", (reservation_id,)).fetchone()
+    return row[0]
+
+
+def test_owned_reservation_rejects_anonymous_and_other_buyers(client, register_user):
+    alice, bob = register_user("alice"), register_user("bob")
+    reservation_id = _reserve(client, alice)['reservation_id']
+
+    for method, url in (
+        ("POST", f"/api/v1/reservations/{reservation_id}/confirm"),
+        ("DELETE", f"/api/v1/reservations/{reservation_id}"),
+    ):
+        anonymous = client.request(method, url)
+        assert anonymous.status_code == 401, anonymous.text
+        assert anonymous.headers["WWW-Authenticate"] == "Bearer"
+        assert client.request(method, url, headers=bob).status_code == 403
+    assert _status(reservation_id) == 'held'
+
+    response = client.post(f"/api/v1/reservations/{reservation_id}/confirm", headers=alice)
+    assert response.status_code == 200, response.text
+    assert response.json()['status'] == 'confirmed'
+
+
+def test_anonymous_caller_cannot_claim_a_buyer_id(client, register_user):
+    register_user("alice")
+    response = client.post(RESERVE_URL, json={"quantity_kg": 10, "buyer_id": "alice"})
+    assert response.status_code == 401
+
+
+def test_anonymous_hold_can_be_released_anonymously(client):
+    reservation = _reserve(client)
+    assert reservation['buyer_id'] is None
+    response = client.delete(f"/api/v1/reservations/{reservation['reservation_id']}")
+    assert response.status_code == 200, response.text
+    assert _status(reservation['reservation_id']) == 'released'
+
+
+def test_overselling_is_rejected_and_release_restocks(client):
+    from app.services.marketplace_services import get_offer_store
+
+    reservation = _reserve(client, quantity_kg=250)
+    response = client.post(RESERVE_URL, json={"quantity_kg": 10})
+    assert response.status_code == 409, response.text
+    assert get_offer_store().get('O002')['quantity_kg'] == 4
+
+    client.delete(f"/api/v1/reservations/{reservation['reservation_id']}")
+    assert get_offer_store().get('O002')['quantity_kg'] == 254
+    assert get_offer_store().get('O002')['is_available']
+
+
+def test_concurrent_reservations_never_oversell(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.services.regional_store import RegionalOfferStore
+    from app.services.reservation_service import InsufficientStockError, ReservationService
+
+    store = RegionalOfferStore(tmp_path / 'offers.db', tmp_path / 'regions', ['pune'], {'P1': 'pune'}.get)
+    store.upsert_many([{
+        'offer_id': 'O1', 'producer_id': 'P1', 'waste_type': 'Egg Shell',
+        'quantity_kg': 100.0, 'cost_per_kg': 2.0, 'is_available': True,
+    }])
+    # Two services on the same files stand in for two workers: only the CAS keeps them honest
+    services = [ReservationService(store), ReservationService(store)]
+
+    def attempt(i):
+        try:
+            return services[i % 2].reserve('O1', 7.0, None, hold_s=60)
+        except InsufficientStockError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        held = [r for r in pool.map(attempt, range(40)) if r is not None]
+
+    assert len(held) == 14 # floor(100 / 7)
+    assert store.get('O1')['quantity_kg'] == 100.0 - 7.0 * len(held)
+
+    assert services[0].release_expired(now=held[0]['expires_at'] + 1) == len(held)
+    assert store.get('O1')['quantity_kg'] == 100.0
+    store.close()
@@ -0,0 +1,69 @@
+# tests/test_upload_jobs.py
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.offer_store import OfferStore
+from app.services.upload_jobs import IdempotencyConflictError, UploadJobQueue
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = OfferStore(tmp_path / 'offers.db')
+    yield store
+    store.close()
+
+
+def _run(store, scenario):
+    async def main():
+        queue = UploadJobQueue(store, workers=1)
+        queue.start()
+        try:
+            return await scenario(queue)
+        finally:
+            await queue.stop()
+    return asyncio.run(main())
+
+
+def _work(result=None, error=None):
+    async def work():
+        if error is not None:
+            raise error
+        return result
+    return work
+
+
+def test_repeated_key_returns_the_original_job(store):
+    async def scenario(queue):
+        job, created = await queue.submit('key-1', 'hash-a', _work({'offer_id': 'O1'}))
+        assert created
+        finished = await queue.get(job['job_id'], wait_s=5)
+        replay, created = await queue.submit('key-1', 'hash-a', _work({'offer_id': 'O2'}))
+        assert not created
+        assert replay['job_id'] == job['job_id'] and replay['result'] == finished['result'] == {'offer_id': 'O1'}
+        with pytest.raises(IdempotencyConflictError):
+            await queue.submit('key-1', 'hash-b', _work())
+    _run(store, scenario)
+
+
+def test_key_of_a_job_that_failed_with_5xx_requeues_it(store):
+    async def scenario(queue):
+        job, _ = await queue.submit('key-1', 'hash-a', _work(error=RuntimeError("vision backend down")))
+        failed = await queue.get(job['job_id'], wait_s=5)
+        assert failed['status'] == 'failed' and failed['error']['status_code'] == 500
+
+        retry, created = await queue.submit('key-1', 'hash-a', _work({'offer_id': 'O1'}))
+        assert created and retry['job_id'] == job['job_id']
+        done = await queue.get(job['job_id'], wait_s=5)
+        assert done['status'] == 'succeeded' and done['result'] == {'offer_id': 'O1'} and done['error'] is None
+    _run(store, scenario)
+
+
+def test_key_of_a_job_rejected_with_4xx_is_not_retried(store):
+    async def scenario(queue):
+        job, _ = await queue.submit('key-1', 'hash-a', _work(error=HTTPException(422, "Unknown producer")))
+        await queue.get(job['job_id'], wait_s=5)
+        replay, created = await queue.submit('key-1', 'hash-a', _work({'offer_id': 'O1'}))
+        assert not created and replay['status'] == 'failed' and replay['error']['status_code'] == 422
+    _run(store, scenario)
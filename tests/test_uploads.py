@@ -0,0 +1,66 @@
+# tests/test_uploads.py
+from io import BytesIO
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.services.upload_service import UploadSizeLimitMiddleware
+
+
+def _png() -> bytes:
+    out = BytesIO()
+    Image.new("RGB", (64, 48), (200, 180, 120)).save(out, format="PNG")
+    return out.getvalue()
+
+
+def _limited_app(max_bytes: int):
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware, max_bytes=max_bytes)
+    app.state.calls = 0
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        app.state.calls += 1
+        return {"size": file.size}
+    return app
+
+
+def test_declared_oversized_body_is_refused_before_form_parsing():
+    app = _limited_app(1024)
+    with TestClient(app) as client:
+        response = client.post("/upload", files={"file": ("big.bin", b"x" * 4096)})
+        assert response.status_code == 413
+        assert client.post("/upload", files={"file": ("small.bin", b"x" * 100)}).json() == {"size": 100}
+    assert app.state.calls == 1
+
+
+def test_chunked_oversized_body_is_cut_off():
+    app = _limited_app(1024)
+    boundary = "limit-test"
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.bin\"\r\n\r\n".encode()
+        + b"x" * 4096 + f"\r\n--{boundary}--\r\n".encode()
+    )
+
+    def chunks():
+        for start in range(0, len(body), 512):
+            yield body[start:start + 512]
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/upload", content=chunks(), headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        )
+    assert response.status_code == 413
+    assert app.state.calls == 0
+
+
+def test_queued_upload_job_reads_the_spool_after_the_response(client):
+    response = client.post(
+        "/api/v1/upload/photo/jobs",
+        files={"file": ("waste.png", _png(), "image/png")},
+        data={"cost_per_kg": "2.5", "producer_id": "P007"},
+    )
+    assert response.status_code == 202, response.text
+    job = client.get(f"/api/v1/upload/jobs/{response.json()['job_id']}", params={"wait_s": 10}).json()
+    assert job['status'] == 'succeeded', job
@@ -0,0 +1,93 @@
+# tests/test_vision_service.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app.config.constants import VISION_MAX_CONCURRENCY
+from app.config.state import APP_STATE
+from app.services import vision_service
+from app.services.fake_gemini import FakeGeminiClient
+from app.services.vision_service import ClientDisconnectedError, GeminiDetector, analyze_waste_image
+
+
+def _png(shade: int) -> bytes:
+    out = BytesIO()
+    Image.new("RGB", (64, 48), (shade, 180, 120)).save(out, format="PNG")
+    return out.getvalue()
+
+
+def _use_fake_client(**options) -> FakeGeminiClient:
+    fake = FakeGeminiClient(**options)
+    APP_STATE['VISION_DETECTOR'] = GeminiDetector(fake)
+    return fake
+
+
+def _upload(client, shade: int, **manual):
+    return client.post(
+        "/api/v1/upload/photo",
+        files={"file": ("waste.png", _png(shade), "image/png")},
+        data={"cost_per_kg": "2.5", "producer_id": "P007", **manual},
+    )
+
+
+@pytest.mark.parametrize("sync_only", [False, True], ids=["aio", "thread-pool"])
+def test_concurrent_uploads_respect_the_vision_concurrency_cap(client, sync_only):
+    fake = _use_fake_client(latency_s=0.2, sync_only=sync_only)
+    uploads = 3 * VISION_MAX_CONCURRENCY
+
+    # Distinct images, so no upload is answered from the analysis cache
+    with ThreadPoolExecutor(max_workers=uploads) as pool:
+        responses = list(pool.map(lambda shade: _upload(client, shade), range(uploads)))
+
+    assert [response.status_code for response in responses] == [200] * uploads
+    assert fake.tracker.calls == uploads
+    assert 1 < fake.tracker.max_in_flight <= VISION_MAX_CONCURRENCY
+
+
+def test_vision_timeout_is_a_504_unless_manual_details_were_sent(client, monkeypatch):
+    monkeypatch.setattr(vision_service, 'VISION_TIMEOUT_S', 0.05)
+    _use_fake_client(latency_s=2)
+
+    response = _upload(client, 1)
+    assert response.status_code == 504, response.text
+
+    response = _upload(client, 2, manual_waste_type="Egg Shell", manual_quantity_kg="12")
+    assert response.status_code == 200, response.text
+    assert response.json()['seller_input_source'] == "Data provided manually by seller."
+
+
+class _DisconnectingRequest:
+    """Stands in for a Starlette Request whose client hangs up after `after_s`."""
+
+    def __init__(self, after_s: float):
+        self.after_s = after_s
+        self.started = None
+
+    async def is_disconnected(self) -> bool:
+        now = asyncio.get_running_loop().time()
+        self.started = self.started or now
+        return now - self.started >= self.after_s
+
+
+def test_client_disconnect_cancels_the_call_and_frees_its_slot(monkeypatch):
+    monkeypatch.setattr(vision_service, 'VISION_DISCONNECT_POLL_S', 0.01)
+    fake = FakeGeminiClient(latency_s=5)
+    detector = GeminiDetector(fake)
+    prepared = type("Prepared", (), {"encoded": b"jpeg"})()
+
+    async def scenario():
+        calls = [
+            analyze_waste_image(prepared, detector, request=_DisconnectingRequest(after_s=0.05))
+            for _ in range(VISION_MAX_CONCURRENCY + 2)
+        ]
+        results = await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), timeout=5)
+        await asyncio.sleep(0) # Let the cancelled calls run their cleanup
+        return results, vision_service._get_semaphore()
+
+    results, semaphore = asyncio.run(scenario())
+    assert all(isinstance(result, ClientDisconnectedError) for result in results)
+    assert fake.tracker.in_flight == 0
+    assert semaphore._value == VISION_MAX_CONCURRENCY
@@ -0,0 +1,28 @@
+# tests/test_waste_calculator.py
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from app.services.waste_calculator import calculate_manual_npk_score, get_waste_lookup, normalize_waste_label
+
+WASTE_NPK_CSV = Path(__file__).resolve().parent.parent / 'app' / 'data' / 'waste_npk_processed.csv'
+
+
+@pytest.mark.parametrize("label, expected", [
+    ("potatoes", "potato"),
+    ("Tomatoes", "tomato"),
+    ("leaves", "leaf"),
+    ("boxes", "box"),
+    ("Egg-Shells", "egg shell"),
+    ("grass", "grass"),
+])
+def test_plural_words_are_singularized(label, expected):
+    assert normalize_waste_label(label) == expected
+
+
+@pytest.mark.parametrize("manual_label", ["potatoes peels", "Potato Peelings", "POTATO PEEL"])
+def test_manual_plural_entries_match_the_npk_row(manual_label):
+    waste_df = pd.read_csv(WASTE_NPK_CSV)
+    assert get_waste_lookup(waste_df).canonical_label(manual_label) == "Potato Peel"
+    assert calculate_manual_npk_score(manual_label, 10.0, waste_df) == calculate_manual_npk_score("Potato Peel", 10.0, waste_df)